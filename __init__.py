@@ -8,19 +8,59 @@ if current_dir not in sys.path:
 from .nodes.SambaNova import SambaNovaLLMNode
 from .nodes.groq_api_llm import GroqAPILLM
 from .nodes.cerebras import CerebrasAPILLM
+from .nodes.best_of_n import BestOfNLLM
+from .nodes.SambaNovaTools import SambaNovaToolsNode
+from .nodes.batch_llm import BatchLLM
+from .nodes.usage_report import LLMUsageReport
+from .nodes.async_llm import GroqSubmit, CerebrasSubmit, SambaNovaSubmit, LLMAwait
+from .nodes.template_sweep import TemplateSweepLLM
+from .nodes.stream_llm import LLMStream, LLMStreamCollect
+from .utils.warmup_utils import start_prewarm
+from .utils.prefetch_utils import start_prefetch
+from .utils.usage_utils import register_routes
 
 NODE_CLASS_MAPPINGS = {
     "SambaNovaLLMNode": SambaNovaLLMNode,
     "GroqAPILLM": GroqAPILLM,
-    "cerebrasLLMNODE": CerebrasAPILLM
+    "cerebrasLLMNODE": CerebrasAPILLM,
+    "BestOfNLLM": BestOfNLLM,
+    "SambaNovaToolsNode": SambaNovaToolsNode,
+    "BatchLLM": BatchLLM,
+    "LLMUsageReport": LLMUsageReport,
+    "GroqSubmit": GroqSubmit,
+    "CerebrasSubmit": CerebrasSubmit,
+    "SambaNovaSubmit": SambaNovaSubmit,
+    "LLMAwait": LLMAwait,
+    "TemplateSweepLLM": TemplateSweepLLM,
+    "LLMStream": LLMStream,
+    "LLMStreamCollect": LLMStreamCollect
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "SambaNovaLLMNode": "SambaNova LLM",
     "GroqAPILLM": "Groq LLM",
-    "cerebrasLLMNODE": "Cerebras LLM"
+    "cerebrasLLMNODE": "Cerebras LLM",
+    "BestOfNLLM": "Best-of-N LLM",
+    "SambaNovaToolsNode": "SambaNova Tools LLM",
+    "BatchLLM": "Batch LLM (offline jobs)",
+    "LLMUsageReport": "LLM Usage Report",
+    "GroqSubmit": "Groq LLM Submit",
+    "CerebrasSubmit": "Cerebras LLM Submit",
+    "SambaNovaSubmit": "SambaNova LLM Submit",
+    "LLMAwait": "LLM Await",
+    "TemplateSweepLLM": "Template Sweep LLM",
+    "LLMStream": "LLM Stream",
+    "LLMStreamCollect": "LLM Stream Collect"
 }
 
+# Background warm-up of paths, presets, catalogs and connections; opt in
+# with APACHELLMPACK_PREWARM=1.
+start_prewarm()
+# Queue lookahead for LLM nodes; opt in with APACHELLMPACK_PREFETCH=1.
+start_prefetch(NODE_CLASS_MAPPINGS)
+# GET /apachellmpack/usage for spend and throughput.
+register_routes()
+
 _all__ = [
     "NODE_CLASS_MAPPINGS",
     "NODE_DISPLAY_NAME_MAPPINGS"
@@ -1,12 +1,20 @@
 import os
-import configparser
+import time
 import json
 import logging
 from ..utils.Nova_api_utils import make_api_request, make_streaming_request
 from ..utils.Nova_chat_utils import ChatHistoryManager
 from ..utils.Nova_prompt_utils import load_prompt_options, format_prompt
+from ..utils.cancel_utils import CancelToken
+from ..utils.stop_utils import StopMatcher, normalize_stop_sequences
+from ..utils.catalog_utils import get_catalog, estimate_tokens
+from ..utils.cache_utils import request_key, response_cache, take_or_call
+from ..utils.usage_utils import metered
+from ..utils.priority_utils import with_priority
+from ..utils.profile_utils import profiled
+from ..utils.provider_utils import load_provider_config
+from ..utils.registry_utils import shared
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class SambaNovaLLMNode:
@@ -24,29 +32,32 @@ class SambaNovaLLMNode:
     ]
 
     def __init__(self):
-        self.config = configparser.ConfigParser()
         self.config_path = os.path.join(os.path.dirname(__file__), 'Nova', 'SambaNovaConfig.ini')
-        self.load_config()
-        self.chat_history_manager = ChatHistoryManager()
+        self.chat_history_manager = shared.get("history", "sambanova", ChatHistoryManager)
         self.prompt_options = load_prompt_options([
             os.path.join(os.path.dirname(__file__), 'Nova', 'DefaultPrompts.json'),
             os.path.join(os.path.dirname(__file__), 'Nova', 'UserPrompts.json')
         ])
 
-    def load_config(self):
-        if os.path.exists(self.config_path):
-            self.config.read(self.config_path)
-            logger.info(f"Loaded configuration from {self.config_path}")
-        else:
-            logger.warning(f"Config file not found at {self.config_path}. Using default values.")
-            self.config['API'] = {'key': '', 'base_url': 'https://api.sambanova.ai/v1', 'max_retries': '3'}
+    @property
+    def config(self):
+        # Shared and reloaded when the file changes; every read below has a fallback.
+        return load_provider_config('sambanova')
+
+    @classmethod
+    def available_models(cls):
+        # Catalog models first; hardcoded ones are kept unless the API reported them inactive.
+        catalog = get_catalog('sambanova')
+        catalog.refresh_in_background()
+        models = catalog.model_ids()
+        return models + [m for m in cls.SAMBA_NOVA_MODELS if m not in catalog.models]
 
     @classmethod
     def INPUT_TYPES(cls):
         return {
             "required": {
                 "prompt": ("STRING", {"multiline": True, "default": "", "tooltip": "Enter your prompt here"}),
-                "model": (cls.SAMBA_NOVA_MODELS, {"default": "Meta-Llama-3.1-8B-Instruct"}),
+                "model": (cls.available_models(), {"default": "Meta-Llama-3.1-8B-Instruct"}),
                 "max_tokens": ("INT", {"default": 100, "min": 1, "max": 4096}),
                 "temperature": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 1.0, "step": 0.01}),
                 "top_p": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
@@ -59,6 +70,12 @@ class SambaNovaLLMNode:
                 "conversation_id": ("STRING", {"default": ""}),
                 "repetition_penalty": ("FLOAT", {"default": 1.0, "min": 1.0, "max": 2.0, "step": 0.01}),
                 "stream": ("BOOLEAN", {"default": False}),
+                "timeout": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 3600.0, "step": 1.0, "tooltip": "Overall time budget in seconds for the request, including retries. 0 disables the budget."}),
+                "stop_regex": ("STRING", {"default": "", "tooltip": "Optional regular expression checked client-side on the streamed output. Generation stops at the first match."}),
+                "max_chars": ("INT", {"default": 0, "min": 0, "max": 1000000, "step": 1, "tooltip": "Client-side character budget for the output. 0 disables the budget."}),
+                "fork": ("BOOLEAN", {"default": False, "tooltip": "Continue conversation_id in a new branch that shares its messages instead of appending to it. The new branch id is returned."}),
+                "fork_at": ("INT", {"default": 0, "min": 0, "max": 100000, "step": 1, "tooltip": "Number of messages of conversation_id the branch shares. 0 shares all of them."}),
+                "profile": ("BOOLEAN", {"default": False, "tooltip": "Profile this execution (sampled stacks, allocations, history and HTTP timings) into the profiles folder."}),
             }
         }
 
@@ -67,9 +84,13 @@ class SambaNovaLLMNode:
     FUNCTION = "generate_text"
     CATEGORY = "LLM"
 
+    @profiled("sambanova")
+    @with_priority("interactive")
     def generate_text(self, prompt, model, max_tokens, temperature, top_p, top_k, request_type,
                       system_message="", stop_sequences="", conversation_id="",
-                      repetition_penalty=1.0, stream=False):
+                      repetition_penalty=1.0, stream=False, timeout=0.0, stop_regex="", max_chars=0,
+                      fork=False, fork_at=0):
+        token = CancelToken(timeout)
         api_key = self.config.get('API', 'key', fallback='')
         base_url = self.config.get('API', 'base_url', fallback='https://api.sambanova.ai/v1')
         max_retries = int(self.config.get('API', 'max_retries', fallback='3'))
@@ -82,11 +103,45 @@ class SambaNovaLLMNode:
             "Content-Type": "application/json"
         }
 
+        if fork and conversation_id:
+            conversation_id = self.chat_history_manager.fork_conversation(conversation_id, fork_at or None)
         if not conversation_id:
             conversation_id = self.chat_history_manager.create_new_conversation()
         
         conversation_history = self.chat_history_manager.get_history(conversation_id)
-        
+
+        data, endpoint, stop_list = self.build_request(prompt, model, max_tokens, temperature, top_p, top_k, request_type,
+                                                       system_message, stop_sequences, repetition_penalty, stream,
+                                                       conversation_history, base_url)
+        matcher = StopMatcher(stop_list, stop_regex, max_chars)
+
+        catalog = get_catalog('sambanova')
+        data["max_tokens"], catalog_error = catalog.fit_request(model, data.get("messages") or data.get("prompt", ""), max_tokens)
+        if catalog_error:
+            logger.error(catalog_error)
+            return (f"Error: {catalog_error}", 0, conversation_id)
+
+        start = time.perf_counter()
+        with metered('sambanova', model, conversation_id, "stream" if stream else "plain") as meter:
+            if stream:
+                generated_text, token_count = self.handle_streaming_response(data, headers, endpoint, conversation_id, token, matcher, max_retries)
+            else:
+                generated_text, token_count = self.handle_non_streaming_response(data, headers, endpoint, max_retries, request_type, conversation_id, prompt, token, matcher)
+
+        if not generated_text.startswith("Error:"):
+            meter.finish(data.get("messages") or data.get("prompt", ""), generated_text)
+            if stream:
+                # The usage block of the final chunk, or an estimate; not the chunk count.
+                token_count = meter.total_tokens
+            catalog.record(model, time.perf_counter() - start, estimate_tokens(generated_text))
+        else:
+            meter.fail("api_error")
+
+        self.update_chat_history(conversation_id, prompt, generated_text)
+        return (generated_text, token_count, conversation_id)
+
+    def build_request(self, prompt, model, max_tokens, temperature, top_p, top_k, request_type, system_message,
+                      stop_sequences, repetition_penalty, stream, conversation_history, base_url):
         data = {
             "model": model,
             "max_tokens": max_tokens,
@@ -97,8 +152,9 @@ class SambaNovaLLMNode:
             "stream": stream,
         }
 
-        if stop_sequences:
-            data["stop"] = [seq.strip() for seq in stop_sequences.split(',')]
+        stop_list = normalize_stop_sequences(stop_sequences, separator=',')
+        if stop_list:
+            data["stop"] = stop_list
 
         if request_type == "chat":
             data["messages"] = []
@@ -112,28 +168,62 @@ class SambaNovaLLMNode:
             full_prompt = format_prompt(system_message, conversation_history, prompt)
             data["prompt"] = full_prompt
             endpoint = f"{base_url}/completions"
+        return data, endpoint, stop_list
 
-        if stream:
-            generated_text, token_count = self.handle_streaming_response(data, headers, endpoint, conversation_id)
-        else:
-            generated_text, token_count = self.handle_non_streaming_response(data, headers, endpoint, max_retries, request_type, conversation_id, prompt)
-
-        self.update_chat_history(conversation_id, prompt, generated_text)
-        return (generated_text, token_count, conversation_id)
-
-    def handle_streaming_response(self, data, headers, endpoint, conversation_id):
-        generated_text = ""
-        token_count = 0
-        for chunk in make_streaming_request(data, headers, endpoint):
-            if chunk.startswith("Error:"):
-                logger.error(chunk)
-                return chunk, 0
-            generated_text += chunk
-            token_count += 1  
-        return generated_text, token_count
+    def prefetch(self, prompt, model, max_tokens, temperature, top_p, top_k, request_type,
+                 system_message="", stop_sequences="", conversation_id="",
+                 repetition_penalty=1.0, stream=False, timeout=0.0, stop_regex="", max_chars=0, **_):
+        """Make the request a new conversation with these inputs would send and cache the result.
 
-    def handle_non_streaming_response(self, data, headers, endpoint, max_retries, request_type, conversation_id, prompt):
-        response, success, status_code = make_api_request(data, headers, endpoint, max_retries)
+        Streaming requests and continued conversations are not prefetched.
+        """
+        api_key = self.config.get('API', 'key', fallback='')
+        if stream or conversation_id or not api_key:
+            return False
+        base_url = self.config.get('API', 'base_url', fallback='https://api.sambanova.ai/v1')
+        max_retries = int(self.config.get('API', 'max_retries', fallback='3'))
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        data, endpoint, _ = self.build_request(prompt, model, max_tokens, temperature, top_p, top_k, request_type,
+                                               system_message, stop_sequences, repetition_penalty, stream, [], base_url)
+        data["max_tokens"], catalog_error = get_catalog('sambanova').fit_request(model, data.get("messages") or data.get("prompt", ""), max_tokens)
+        if catalog_error:
+            return False
+
+        def call():
+            with metered('sambanova', model, mode="prefetch") as meter:
+                result = make_api_request(data, headers, endpoint, max_retries)
+            if not result[1]:
+                return None
+            choice = result[0]["choices"][0]
+            meter.finish(data.get("messages") or data.get("prompt", ""), (choice.get("message") or {}).get("content") or choice.get("text") or "")
+            return result
+        return response_cache.fill(request_key('sambanova', endpoint, data), call)
+
+    def handle_streaming_response(self, data, headers, endpoint, conversation_id, token=None, matcher=None, max_retries=1):
+        matcher = matcher or StopMatcher()
+        chunks = make_streaming_request(data, headers, endpoint, token, max_retries)
+        try:
+            for chunk in chunks:
+                if chunk.startswith("Error:"):
+                    logger.error(chunk)
+                    return chunk, 0
+                if matcher.feed(chunk):
+                    # Closing the generator closes the connection, so the
+                    # provider stops generating (and billing) right here.
+                    logger.info("Stopped stream client-side (%s).", matcher.stop_reason)
+                    break
+        finally:
+            chunks.close()
+        return matcher.text, 0
+
+    def handle_non_streaming_response(self, data, headers, endpoint, max_retries, request_type, conversation_id, prompt, token=None, matcher=None):
+        response, success, status_code = take_or_call(
+            request_key('sambanova', endpoint, data),
+            lambda: make_api_request(data, headers, endpoint, max_retries, token), token,
+            cacheable=lambda result: result[1])
 
         if success:
             if request_type == "chat":
@@ -141,9 +231,12 @@ class SambaNovaLLMNode:
             else:
                 generated_text = response["choices"][0]["text"].strip()
 
+            if matcher is not None and matcher.active:
+                generated_text = matcher.apply(generated_text)
+
             token_count = response.get("usage", {}).get("total_tokens", 0)
             
-            logger.info(f"Successfully generated text with {token_count} tokens using {data['model']}.")
+            logger.debug("Successfully generated text with %s tokens using %s.", token_count, data['model'])
             return generated_text, token_count
         else:
             error_message = f"Error: {response}"
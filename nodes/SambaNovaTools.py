@@ -0,0 +1,121 @@
+import logging
+from ..utils.Nova_api_utils import make_api_request
+from ..utils.Nova_functions import get_available_functions, get_tool_definitions, execute_tool_calls
+from ..utils.cancel_utils import CancelToken
+from ..utils.json_utils import dumps
+from ..utils.priority_utils import with_priority
+from ..utils.usage_utils import metered
+from .SambaNova import SambaNovaLLMNode
+
+logger = logging.getLogger(__name__)
+
+class SambaNovaToolsNode(SambaNovaLLMNode):
+    """Chat node that lets the model call the functions in Nova_functions.
+
+    All tool calls of one model turn run concurrently, results are sent back
+    and the conversation continues until the model answers without tools.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "prompt": ("STRING", {"multiline": True, "default": "", "tooltip": "Enter your prompt here"}),
+                "model": (cls.available_models(), {"default": "Meta-Llama-3.3-70B-Instruct"}),
+                "max_tokens": ("INT", {"default": 512, "min": 1, "max": 4096}),
+                "temperature": ("FLOAT", {"default": 0.1, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "top_p": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "max_rounds": ("INT", {"default": 5, "min": 1, "max": 20, "tooltip": "Maximum number of tool-calling round trips before giving up."}),
+                "tool_timeout": ("FLOAT", {"default": 30.0, "min": 0.1, "max": 600.0, "step": 0.5, "tooltip": "Per-round timeout in seconds for the tools of one model turn."}),
+            },
+            "optional": {
+                "system_message": ("STRING", {"multiline": True, "default": ""}),
+                "tools": ("STRING", {"default": "", "tooltip": "Comma separated tool names to enable. Empty enables all: " + ", ".join(get_available_functions().keys())}),
+                "conversation_id": ("STRING", {"default": ""}),
+                "timeout": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 3600.0, "step": 1.0, "tooltip": "Overall time budget in seconds for the whole tool loop. 0 disables the budget."}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "STRING", "INT", "STRING")
+    RETURN_NAMES = ("generated_text", "tool_log", "rounds", "conversation_id")
+    FUNCTION = "run_tools"
+    CATEGORY = "LLM"
+    # Tool loops depend on tool results; nothing to prefetch.
+    prefetch = None
+
+    @with_priority("interactive")
+    def run_tools(self, prompt, model, max_tokens, temperature, top_p, max_rounds, tool_timeout,
+                  system_message="", tools="", conversation_id="", timeout=0.0):
+        token = CancelToken(timeout)
+        api_key = self.config.get('API', 'key', fallback='')
+        base_url = self.config.get('API', 'base_url', fallback='https://api.sambanova.ai/v1')
+        max_retries = int(self.config.get('API', 'max_retries', fallback='3'))
+
+        if not api_key:
+            raise ValueError("API key is not set in the SambaNovaConfig.ini file.")
+
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        endpoint = f"{base_url}/chat/completions"
+
+        if not conversation_id:
+            conversation_id = self.chat_history_manager.create_new_conversation()
+
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        messages.extend(self.chat_history_manager.get_history(conversation_id))
+        messages.append({"role": "user", "content": prompt})
+
+        enabled = [name.strip() for name in tools.split(',') if name.strip()]
+        tool_definitions = get_tool_definitions(enabled)
+        tool_log = []
+        generated_text = None
+        rounds = 0
+
+        for rounds in range(1, max_rounds + 1):
+            data = {
+                "model": model,
+                "messages": messages,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "top_p": top_p,
+                "tools": tool_definitions,
+                "tool_choice": "auto",
+            }
+            with metered("sambanova", model, conversation_id, "tools") as meter:
+                response, success, status_code = make_api_request(data, headers, endpoint, max_retries, token)
+            if success:
+                meter.finish(messages, response["choices"][0]["message"].get("content") or "")
+            if not success:
+                meter.fail(status_code)
+                generated_text = f"Error: {response}"
+                logger.error(generated_text)
+                break
+
+            message = response["choices"][0]["message"]
+            tool_calls = message.get("tool_calls") or []
+            if not tool_calls:
+                generated_text = (message.get("content") or "").strip()
+                break
+
+            messages.append({"role": "assistant", "content": message.get("content") or "", "tool_calls": tool_calls})
+            if token.expired:
+                generated_text = "Error: Request exceeded its time budget."
+                break
+            token.raise_if_cancelled()
+            results = execute_tool_calls(tool_calls, timeout=token.cap(tool_timeout))
+            for tool_call, result in zip(tool_calls, results):
+                tool_log.append({"round": rounds, "name": tool_call.get("function", {}).get("name"),
+                                 "arguments": tool_call.get("function", {}).get("arguments"), "result": result})
+                messages.append({"role": "tool", "tool_call_id": tool_call.get("id", ""), "content": result})
+            logger.debug("Tool round %s: executed %s tool call(s) concurrently.", rounds, len(tool_calls))
+
+        if generated_text is None:
+            generated_text = f"Error: no final answer after {max_rounds} tool rounds."
+            logger.warning(generated_text)
+
+        self.update_chat_history(conversation_id, prompt, generated_text)
+        return (generated_text, dumps(tool_log, pretty=True), rounds, conversation_id)
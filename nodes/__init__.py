@@ -1,9 +1,27 @@
 from .SambaNova import SambaNovaLLMNode
 from .groq_api_llm import GroqAPILLM
 from .cerebras import CerebrasAPILLM
+from .best_of_n import BestOfNLLM
+from .SambaNovaTools import SambaNovaToolsNode
+from .batch_llm import BatchLLM
+from .usage_report import LLMUsageReport
+from .async_llm import GroqSubmit, CerebrasSubmit, SambaNovaSubmit, LLMAwait
+from .template_sweep import TemplateSweepLLM
+from .stream_llm import LLMStream, LLMStreamCollect
 
 __all__ = [
     "SambaNovaLLMNode",
     "GroqAPILLM",
-    "CerebrasAPILLM"
+    "CerebrasAPILLM",
+    "BestOfNLLM",
+    "SambaNovaToolsNode",
+    "BatchLLM",
+    "LLMUsageReport",
+    "GroqSubmit",
+    "CerebrasSubmit",
+    "SambaNovaSubmit",
+    "LLMAwait",
+    "TemplateSweepLLM",
+    "LLMStream",
+    "LLMStreamCollect"
 ]
\ No newline at end of file
@@ -0,0 +1,87 @@
+from colorama import init, Fore, Style
+
+from ..utils.async_utils import llm_jobs
+from ..utils.cancel_utils import CancelToken, DeadlineExceeded
+from ..utils.json_utils import dumps
+from .SambaNova import SambaNovaLLMNode
+from .groq_api_llm import GroqAPILLM
+from .cerebras import CerebrasAPILLM
+
+init()
+
+FUTURE_TYPE = "LLM_FUTURE"
+
+
+def make_submit_node(node_cls, label):
+    """Submit variant of an LLM node: same inputs, returns a handle at once.
+
+    The wrapped node runs unchanged (history, caching, usage) on the
+    background executor; ``LLMAwait`` turns the handle into its outputs.
+    """
+
+    class LLMSubmit:
+        TARGET = node_cls
+
+        @classmethod
+        def INPUT_TYPES(cls):
+            return node_cls.INPUT_TYPES()
+
+        RETURN_TYPES = (FUTURE_TYPE,)
+        RETURN_NAMES = ("handle",)
+        OUTPUT_TOOLTIPS = ("Handle of the running request; connect it to an LLM Await node",)
+        FUNCTION = "submit"
+        CATEGORY = "apachellmpack"
+        DESCRIPTION = f"Starts a {label} request in the background and returns immediately, so the rest of the graph keeps running."
+
+        def __init__(self):
+            self.node = None
+
+        def submit(self, **kwargs):
+            # One node instance per Submit node, created lazily like ComfyUI does.
+            if self.node is None:
+                self.node = node_cls()
+            method = getattr(self.node, node_cls.FUNCTION)
+            handle = llm_jobs.submit(lambda: method(**kwargs), label)
+            handle["return_names"] = list(node_cls.RETURN_NAMES)
+            return (handle,)
+
+    LLMSubmit.__name__ = f"{node_cls.__name__}Submit"
+    return LLMSubmit
+
+
+GroqSubmit = make_submit_node(GroqAPILLM, "Groq LLM")
+CerebrasSubmit = make_submit_node(CerebrasAPILLM, "Cerebras LLM")
+SambaNovaSubmit = make_submit_node(SambaNovaLLMNode, "SambaNova LLM")
+
+
+class LLMAwait:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "handle": (FUTURE_TYPE, {"tooltip": "Handle from an LLM Submit node."}),
+            },
+            "optional": {
+                "timeout": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 3600.0, "step": 1.0, "tooltip": "Seconds to wait for the result. 0 waits until it is done."}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "BOOLEAN", "STRING", "STRING")
+    RETURN_NAMES = ("text", "success", "conversation_id", "outputs")
+    OUTPUT_TOOLTIPS = ("Generated text", "Whether the request was successful", "Conversation id used by the request", "All outputs of the submitted node by name (JSON string)")
+    FUNCTION = "await_result"
+    CATEGORY = "apachellmpack"
+    DESCRIPTION = "Waits for a request started by an LLM Submit node. Place it as late in the graph as possible."
+
+    def await_result(self, handle, timeout=0.0):
+        token = CancelToken(timeout)
+        try:
+            result = llm_jobs.wait(handle, token)
+        except DeadlineExceeded:
+            message = f"Error: LLM request not finished after {timeout}s."
+            print(Fore.YELLOW + message + Style.RESET_ALL)
+            return (message, False, "", "{}")
+        outputs = dict(zip(handle.get("return_names", []), result))
+        text = result[0]
+        success = outputs.get("success", not str(text).startswith("Error:"))
+        return (text, bool(success), outputs.get("conversation_id", ""), dumps(outputs, pretty=True))
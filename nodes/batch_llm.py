@@ -0,0 +1,117 @@
+import os
+from colorama import init, Fore, Style
+
+from ..utils.Groq_api_utils import load_prompt_options, get_prompt_content
+from ..utils.batch_utils import BATCH_PROVIDERS, DEFAULT_POLL_INTERVAL, BatchError, BatchJob
+from ..utils.cancel_utils import CancelToken, DeadlineExceeded
+from ..utils.json_utils import dumps
+from ..utils.provider_utils import build_chat_payload, get_provider, prompt_files
+
+init()
+
+try:
+    import folder_paths
+except ImportError:
+    folder_paths = None
+
+
+class BatchLLM:
+    """Runs one prompt per input line through the provider's batch API.
+
+    Jobs are identified by name and their progress is saved, so a job keeps
+    going after a ComfyUI restart: queue the node again with the same name to
+    poll it and, once finished, get the results.
+    """
+    DEFAULT_PROMPT = "Use [system_message] and [user_input]"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        try:
+            prompt_options = load_prompt_options(prompt_files(BATCH_PROVIDERS[0]))
+        except Exception as e:
+            print(Fore.RED + f"Failed to load prompt options: {e}" + Style.RESET_ALL)
+            prompt_options = {}
+        return {
+            "required": {
+                "job_name": ("STRING", {"default": "batch_job", "tooltip": "Name of the batch job. Reuse it to resume or collect a submitted job."}),
+                "provider": (BATCH_PROVIDERS, {"tooltip": "Provider with a batch API."}),
+                "model": ("STRING", {"default": "llama-3.1-8b-instant", "tooltip": "Model id used for every request."}),
+                "preset": ([cls.DEFAULT_PROMPT] + list(prompt_options.keys()), {"tooltip": "Select a preset or custom prompt for guiding the LLM."}),
+                "system_message": ("STRING", {"multiline": True, "default": "", "tooltip": "System message used when no preset is selected."}),
+                "user_inputs": ("STRING", {"multiline": True, "default": "", "tooltip": "One user input per line; each line becomes one request."}),
+                "temperature": ("FLOAT", {"default": 0.85, "min": 0.0, "max": 2.0, "step": 0.05, "tooltip": "Controls randomness in responses."}),
+                "max_tokens": ("INT", {"default": 1024, "min": 1, "max": 131072, "step": 1, "tooltip": "Maximum number of tokens per response."}),
+                "top_p": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01, "tooltip": "Nucleus sampling threshold."}),
+                "seed": ("INT", {"default": 42, "min": 0, "max": 4294967295, "tooltip": "Seed for every request."}),
+                "completion_window": (["24h", "48h", "72h", "7d"], {"default": "24h", "tooltip": "How long the provider may take to finish the batch."}),
+                "wait": ("BOOLEAN", {"default": True, "tooltip": "Block until the batch is finished. Off: submit or poll once and return the status."}),
+                "poll_interval": ("FLOAT", {"default": DEFAULT_POLL_INTERVAL, "min": 1.0, "max": 3600.0, "step": 1.0, "tooltip": "Seconds between status checks while waiting."}),
+            },
+            "optional": {
+                "timeout": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 604800.0, "step": 60.0, "tooltip": "Stop waiting after this many seconds (the job keeps running). 0 waits until done."}),
+                "base_url": ("STRING", {"default": "", "tooltip": "Override the provider base URL, e.g. a local stand-in batch server."}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("texts", "status", "output_file", "job_state")
+    OUTPUT_IS_LIST = (True, False, False, False)
+    OUTPUT_TOOLTIPS = ("One generated text per input line (empty until the batch is finished)", "Batch status", "Path of the downloaded result JSONL", "Saved job state (JSON string)")
+    FUNCTION = "run_batch"
+    CATEGORY = "apachellmpack"
+    DESCRIPTION = "Submits many prompts as one asynchronous batch job, polls it and returns the results; resumes after restarts."
+
+    @classmethod
+    def IS_CHANGED(cls, job_name, provider, **kwargs):
+        # Re-run until the job is finished so queueing the node again polls it.
+        try:
+            job = cls.open_job(job_name, provider, kwargs.get("base_url", ""))
+        except BatchError:
+            return float("nan")
+        return job.state.get("batch_id") if job.done else float("nan")
+
+    @staticmethod
+    def open_job(job_name, provider, base_url=""):
+        jobs_dir = os.path.join(get_provider(provider)["dir"], 'batches')
+        output_dir = ""
+        if folder_paths is not None:
+            output_dir = os.path.join(folder_paths.get_output_directory(), 'llm_batches')
+        return BatchJob(job_name, provider, jobs_dir, output_dir, base_url=base_url)
+
+    def build_payloads(self, provider, model, preset, system_message, user_inputs, temperature, max_tokens, top_p, seed):
+        if preset != self.DEFAULT_PROMPT:
+            system_message = get_prompt_content(load_prompt_options(prompt_files(provider)), preset)
+        payloads = []
+        for line in user_inputs.splitlines():
+            if not line.strip():
+                continue
+            messages = [{"role": "system", "content": system_message}] if system_message else []
+            messages.append({"role": "user", "content": line.strip()})
+            payloads.append(build_chat_payload(provider, model, messages, temperature=temperature,
+                                               max_tokens=max_tokens, top_p=top_p, seed=seed))
+        return payloads
+
+    def run_batch(self, job_name, provider, model, preset, system_message, user_inputs, temperature, max_tokens, top_p,
+                  seed, completion_window, wait, poll_interval, timeout=0.0, base_url=""):
+        token = CancelToken(timeout)
+        job = self.open_job(job_name, provider, base_url)
+        payloads = self.build_payloads(provider, model, preset, system_message, user_inputs, temperature, max_tokens, top_p, seed)
+        if not payloads and "request_count" not in job.state:
+            raise ValueError("No user inputs: enter one prompt per line.")
+
+        try:
+            status = job.run(payloads or None, completion_window, wait=wait, poll_interval=poll_interval, token=token)
+        except DeadlineExceeded:
+            status = job.state.get("status", "unknown")
+            print(Fore.YELLOW + f"Batch '{job.name}' still {status}; queue again with the same job name to resume." + Style.RESET_ALL)
+
+        texts = []
+        output_file = ""
+        if job.done:
+            results = job.results()
+            texts = [r["text"] if r["text"] is not None else f"Error: {r['error']}" for r in results]
+            output_file = job.output_path
+            failed = sum(1 for r in results if r["error"])
+            if failed:
+                print(Fore.RED + f"Batch '{job.name}': {failed} of {len(results)} requests failed." + Style.RESET_ALL)
+        return (texts, status, output_file, dumps(job.state, pretty=True))
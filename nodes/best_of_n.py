@@ -0,0 +1,132 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from colorama import init, Fore, Style
+
+import requests
+
+from ..utils.cancel_utils import CancelToken, DeadlineExceeded, ExecutionCancelled, InterruptProcessingException, background_execution
+from ..utils.json_utils import dumps
+from ..utils.provider_utils import PROVIDER_NAMES, chat_completion, get_provider, parse_targets
+from ..utils.scoring_utils import SCORERS, check_argument, score
+from ..utils.usage_utils import metered
+
+init()
+
+
+class BestOfNLLM:
+    """Sends N candidate requests concurrently and keeps the best one.
+
+    Candidates differ by seed and/or temperature and can be spread over several
+    providers. All requests run in parallel, so wall-clock cost is close to a
+    single call.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "provider": (PROVIDER_NAMES, {"tooltip": "Provider used for every candidate unless 'targets' is set."}),
+                "model": ("STRING", {"default": "llama-3.1-8b-instant", "tooltip": "Model id used for every candidate unless 'targets' is set."}),
+                "system_message": ("STRING", {"multiline": True, "default": "", "tooltip": "Optional system message to guide the LLM's behavior."}),
+                "user_input": ("STRING", {"multiline": True, "default": "", "tooltip": "User input or prompt to generate the candidates from."}),
+                "n": ("INT", {"default": 4, "min": 1, "max": 32, "step": 1, "tooltip": "Number of candidates generated in parallel."}),
+                "vary": (["seed", "temperature", "seed+temperature"], {"default": "seed", "tooltip": "What differs between candidates."}),
+                "temperature": ("FLOAT", {"default": 0.85, "min": 0.0, "max": 2.0, "step": 0.05, "tooltip": "Base temperature."}),
+                "temperature_spread": ("FLOAT", {"default": 0.4, "min": 0.0, "max": 2.0, "step": 0.05, "tooltip": "Candidates spread evenly over temperature +/- spread/2 when varying temperature."}),
+                "max_tokens": ("INT", {"default": 1024, "min": 1, "max": 131072, "step": 1, "tooltip": "Maximum number of tokens per candidate."}),
+                "top_p": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01, "tooltip": "Nucleus sampling threshold."}),
+                "seed": ("INT", {"default": 42, "min": 0, "max": 4294967295, "tooltip": "Base seed; candidate i uses seed + i when varying the seed."}),
+                "scorer": (list(SCORERS.keys()), {"tooltip": "Local scorer used to pick the best candidate."}),
+                "scorer_argument": ("STRING", {"default": "", "tooltip": "length: target chars (empty = longest). keyword_coverage: comma separated keywords. json_valid: comma separated required keys. regex: pattern to count."}),
+            },
+            "optional": {
+                "targets": ("STRING", {"multiline": True, "default": "", "tooltip": "Optional provider:model lines. Candidates are spread round-robin over them."}),
+                "timeout": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 3600.0, "step": 1.0, "tooltip": "Overall time budget in seconds for all candidates. 0 disables the budget."}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "FLOAT", "INT", "STRING")
+    RETURN_NAMES = ("best_response", "best_score", "best_index", "candidates")
+    OUTPUT_TOOLTIPS = ("The highest scoring candidate", "Score of the best candidate", "Index of the best candidate", "All candidates with their settings and scores (JSON string)")
+    FUNCTION = "generate_best"
+    CATEGORY = "apachellmpack"
+    DESCRIPTION = "Generates N candidates concurrently (different seeds, temperatures or providers) and returns the best one by a local scorer."
+
+    def candidate_settings(self, n, vary, temperature, temperature_spread, seed, targets):
+        seedless = sorted({p for p, _ in targets if not get_provider(p)["supports_seed"]})
+        if vary == "seed" and seedless:
+            print(Fore.YELLOW + f"Best-of-N: no seed support on {', '.join(seedless)}; varying temperature for those candidates instead." + Style.RESET_ALL)
+        settings = []
+        for i in range(n):
+            provider, model = targets[i % len(targets)]
+            candidate_temperature = temperature
+            if ("temperature" in vary or provider in seedless) and n > 1:
+                candidate_temperature = temperature - temperature_spread / 2 + temperature_spread * i / (n - 1)
+                candidate_temperature = round(min(2.0, max(0.0, candidate_temperature)), 3)
+            candidate_seed = seed + i if "seed" in vary else seed
+            settings.append({"provider": provider, "model": model, "temperature": candidate_temperature, "seed": candidate_seed})
+        return settings
+
+    def run_candidate(self, candidate, messages, max_tokens, top_p, token):
+        # Worker threads must not clear ComfyUI's interrupt flag.
+        with background_execution():
+            return self._run_candidate(candidate, messages, max_tokens, top_p, token)
+
+    def _run_candidate(self, candidate, messages, max_tokens, top_p, token):
+        start = time.perf_counter()
+        try:
+            with metered(candidate["provider"], candidate["model"], mode="best_of_n") as meter:
+                text, _ = chat_completion(candidate["provider"], candidate["model"], messages, token=token,
+                                          temperature=candidate["temperature"], max_tokens=max_tokens,
+                                          top_p=top_p, seed=candidate["seed"])
+            meter.finish(messages, text)
+            return dict(candidate, text=text, success=True, latency=round(time.perf_counter() - start, 3))
+        except (InterruptProcessingException, ExecutionCancelled) as e:
+            if isinstance(e, DeadlineExceeded):
+                return dict(candidate, text="", success=False, error="Deadline exceeded")
+            raise
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            return dict(candidate, text="", success=False, error=str(e))
+
+    def generate_best(self, provider, model, system_message, user_input, n, vary, temperature, temperature_spread,
+                      max_tokens, top_p, seed, scorer, scorer_argument, targets="", timeout=0.0):
+        # Fail on a bad scorer argument before paying for any candidate.
+        check_argument(scorer, scorer_argument)
+        token = CancelToken(timeout)
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        messages.append({"role": "user", "content": user_input})
+
+        candidates = self.candidate_settings(n, vary, temperature, temperature_spread, seed,
+                                             parse_targets(targets, provider, model))
+        executor = ThreadPoolExecutor(max_workers=n, thread_name_prefix="apachellmpack-best-of-n")
+        try:
+            futures = [executor.submit(self.run_candidate, c, messages, max_tokens, top_p, token) for c in candidates]
+            results = [future.result() for future in futures]
+        except BaseException:
+            # An interrupt in one candidate cancels the others.
+            token.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        best_index, best_score = -1, float("-inf")
+        for index, result in enumerate(results):
+            if not result["success"]:
+                result["score"] = None
+                continue
+            try:
+                result["score"] = score(scorer, result["text"], scorer_argument)
+            except ValueError as e:
+                result.update(score=None, error=f"Scorer failed: {e}")
+                continue
+            if result["score"] > best_score:
+                best_index, best_score = index, result["score"]
+
+        if best_index < 0:
+            print(Fore.RED + f"Best-of-N: all {n} candidates failed." + Style.RESET_ALL)
+            errors = "; ".join(sorted({r.get("error", "") for r in results}))
+            return (f"All candidates failed: {errors}", 0.0, -1, dumps(results, pretty=True))
+
+        return (results[best_index]["text"], float(best_score), best_index, dumps(results, pretty=True))
@@ -1,37 +1,42 @@
 import os
 import json
+import time
 import random
 import numpy as np
 import torch
 import requests 
 from colorama import init, Fore, Style
-from configparser import ConfigParser
 
 from ..utils.Cerebras_api_utils import load_prompt_options, get_prompt_content, fetch_cerebras_models
 from ..utils.Cerebras_chat_utils import ChatHistoryManager
+from ..utils.json_utils import dumps, parse_response
+from ..utils.cancel_utils import CancelToken, DeadlineExceeded, ExecutionCancelled, InterruptProcessingException, in_background
+from ..utils.retry_utils import post_json_with_retry
+from ..utils.stop_utils import StopMatcher, consume_stream, normalize_stop_sequences
+from ..utils.stream_utils import stream_completion
+from ..utils.json_stream_utils import JSONStreamError, request_json_completion
+from ..utils.catalog_utils import get_catalog, estimate_tokens, model_choices
+from ..utils.provider_utils import get_api_key, get_base_url, load_provider_config
+from ..utils.registry_utils import shared
+from ..utils.cache_utils import request_key, response_cache, take_or_call
+from ..utils.near_cache_utils import near_cache, scope_key
+from ..utils.priority_utils import with_priority
+from ..utils.profile_utils import profiled
+from ..utils.usage_utils import metered, note_usage
 
 init()  
 
 class CerebrasAPILLM:
     DEFAULT_PROMPT = "Use [system_message] and [user_input]"
+    JSON_MODE_ATTEMPTS = 2
+    MAX_RETRIES = 3
 
     _LLM_MODELS = [] 
 
     def __init__(self):
         current_directory = os.path.dirname(os.path.realpath(__file__))
         cerebras_directory = os.path.join(current_directory, 'cerebras')
-        config_path = os.path.join(cerebras_directory, 'CerebrasConfig.ini')
-        self.config = ConfigParser()
-        self.config.read(config_path)
-        self.api_key = self.config.get('API', 'key')
-
-        self.cerebras_api_base_url = "https://api.cerebras.ai/v1" 
-
-        self.instance_llm_models = fetch_cerebras_models(self.api_key, self.cerebras_api_base_url)
-        if not self.instance_llm_models:
-            print(Fore.RED + "Failed to fetch Cerebras models from API. Check API key and connection." + Style.RESET_ALL)
-            self.instance_llm_models = ["error_fetching_models"] 
-        CerebrasAPILLM._LLM_MODELS = self.instance_llm_models 
+        self.instance_llm_models = self.LLM_MODELS()
 
         prompt_files = [
             os.path.join(cerebras_directory, 'DefaultPrompts.json'),
@@ -39,12 +44,28 @@ class CerebrasAPILLM:
         ]
         self.prompt_options = load_prompt_options(prompt_files)
 
-        self.chat_history_manager = ChatHistoryManager()
+        self.chat_history_manager = shared.get("history", "cerebras", ChatHistoryManager)
+
+    @property
+    def config(self):
+        return load_provider_config('cerebras')
+
+    @property
+    def api_key(self):
+        return self.config.get('API', 'key', fallback='')
+
+    @property
+    def cerebras_api_base_url(self):
+        return get_base_url('cerebras')
 
     @classmethod
     def LLM_MODELS(cls): 
-        instance = cls() 
-        return instance.instance_llm_models 
+        models = model_choices('cerebras', lambda: fetch_cerebras_models(get_api_key('cerebras'), get_base_url('cerebras')))
+        if not models:
+            print(Fore.RED + "Failed to fetch Cerebras models from API. Check API key and connection." + Style.RESET_ALL)
+            models = ["error_fetching_models"]
+        CerebrasAPILLM._LLM_MODELS = models
+        return models
     
     @classmethod
     def INPUT_TYPES(cls):
@@ -75,31 +96,48 @@ class CerebrasAPILLM:
                 "stop": ("STRING", {"default": "", "tooltip": "Stop generation when the specified sequence is encountered."}),
                 "json_mode": ("BOOLEAN", {"default": False, "tooltip": "Enable JSON mode for structured output if supported by API and model."}), # Tooltip updated
                 "conversation_id": ("STRING", {"default": "", "tooltip": "Unique identifier for the conversation. Leave empty for a new conversation."}),
+            },
+            "optional": {
+                "timeout": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 3600.0, "step": 1.0, "tooltip": "Overall time budget in seconds for the request, including retries. 0 disables the budget."}),
+                "stop_regex": ("STRING", {"default": "", "tooltip": "Optional regular expression checked client-side on the streamed output. Generation stops at the first match."}),
+                "max_chars": ("INT", {"default": 0, "min": 0, "max": 1000000, "step": 1, "tooltip": "Client-side character budget for the output. 0 disables the budget."}),
+                "fork": ("BOOLEAN", {"default": False, "tooltip": "Continue conversation_id in a new branch that shares its messages instead of appending to it. The new branch id is returned."}),
+                "fork_at": ("INT", {"default": 0, "min": 0, "max": 100000, "step": 1, "tooltip": "Number of messages of conversation_id the branch shares. 0 shares all of them."}),
+                "near_duplicate_threshold": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 1.0, "step": 0.01, "tooltip": "Reuse the answer to an earlier, almost identical user_input (same preset, model and settings) when their similarity is at least this. Only for new conversations. 0 disables it."}),
+                "profile": ("BOOLEAN", {"default": False, "tooltip": "Profile this execution (sampled stacks, allocations, history and HTTP timings) into the profiles folder."}),
             }
         }
 
     OUTPUT_NODE = True
-    RETURN_TYPES = ("STRING", "BOOLEAN", "STRING", "STRING")
-    RETURN_NAMES = ("api_response", "success", "conversation_id", "chat_history")
-    OUTPUT_TOOLTIPS = ("The API response (generated text).", "Whether the request was successful.", "The unique identifier for the conversation.", "The complete chat history (JSON string).")
+    RETURN_TYPES = ("STRING", "BOOLEAN", "STRING", "STRING", "JSON")
+    RETURN_NAMES = ("api_response", "success", "conversation_id", "chat_history", "json_object")
+    OUTPUT_TOOLTIPS = ("The API response (generated text).", "Whether the request was successful.", "The unique identifier for the conversation.", "The complete chat history (JSON string).", "The parsed JSON output when json_mode is enabled, otherwise None.")
     FUNCTION = "process_completion_request"
     CATEGORY = "apachellmpack"
     DESCRIPTION = "Uses Cerebras API to generate text from language models with conversation context."
 
-    def process_completion_request(self, model, preset, system_message, user_input, temperature, max_tokens, top_p, seed, stop, json_mode, conversation_id):
+    @profiled("cerebras")
+    @with_priority("interactive")
+    def process_completion_request(self, model, preset, system_message, user_input, temperature, max_tokens, top_p, seed, stop, json_mode, conversation_id, timeout=0.0, stop_regex="", max_chars=0, fork=False, fork_at=0, near_duplicate_threshold=0.0):
+        token = CancelToken(timeout)
 
         if "error_fetching_models" in self.instance_llm_models: 
-            return ("Error fetching model list from Cerebras API. Cannot proceed.", False, conversation_id, "{}")
+            return ("Error fetching model list from Cerebras API. Cannot proceed.", False, conversation_id, "{}", None)
 
-        torch.manual_seed(seed)
-        np.random.seed(seed)
-        random.seed(seed)
+        if not in_background():
+            # The global RNGs are shared with samplers on ComfyUI's thread;
+            # a submitted request must not reseed them mid-generation.
+            torch.manual_seed(seed)
+            np.random.seed(seed)
+            random.seed(seed)
 
         if preset == self.DEFAULT_PROMPT:
             system_message = system_message
         else:
             system_message = get_prompt_content(self.prompt_options, preset)
 
+        if fork and conversation_id:
+            conversation_id = self.chat_history_manager.fork_conversation(conversation_id, fork_at or None)
         if not conversation_id:
             conversation_id = self.chat_history_manager.create_new_conversation()
 
@@ -111,46 +149,74 @@ class CerebrasAPILLM:
         conversation_history.append({"role": "user", "content": user_input})
 
         prompt_messages = conversation_history 
+        json_object = None
+        near_scope = near_hit = None
 
         try:
             inference_url = f"{self.cerebras_api_base_url}/chat/completions" 
             headers = {'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'} 
 
-            payload = { 
-                "model": model,
-                "messages": prompt_messages, 
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "top_p": top_p,
-                "seed": seed,
-                #"stop": [stop] if stop else None, # Stop sequences - check if API expects list or string
-                #"stream": False, # Streaming - if API supports it, you can add a toggle
-                #"format": "json" if json_mode else "text", # JSON mode - check API support and parameter name
-                # Add other API parameters as needed (e.g., top_k, presence_penalty, etc.) - CHECK API DOCS
-            }
-            if stop:
-                payload["stop"] = [stop] 
-
-            #print(f"Sending request to Cerebras API for model '{model}' with payload: {json.dumps(payload, indent=2)}")
-
-            response = requests.post(inference_url, headers=headers, json=payload)
-            response.raise_for_status() 
-
-            api_response_json = response.json()
-            #print(f"Cerebras API Response: {json.dumps(api_response_json, indent=2)}")
+            payload, stop_sequences = self.build_payload(model, prompt_messages, temperature, max_tokens, top_p, seed, stop)
+            matcher = StopMatcher(stop_sequences, stop_regex, max_chars)
 
-            if 'choices' in api_response_json and api_response_json['choices']:
-                generated_text = api_response_json['choices'][0]['message']['content']
-            else:
-                raise ValueError("Unexpected API response format: No 'choices' or empty 'choices' array.")
+            catalog = get_catalog('cerebras')
+            payload["max_tokens"], catalog_error = catalog.fit_request(model, prompt_messages, max_tokens)
+            if catalog_error:
+                raise ValueError(catalog_error)
+            if near_duplicate_threshold > 0 and len(prompt_messages) == 2:
+                near_scope = scope_key('cerebras', inference_url, payload, json_mode=json_mode, stop_regex=stop_regex, max_chars=max_chars)
+                near_hit = near_cache.lookup(near_scope, user_input, near_duplicate_threshold)
+            start = time.perf_counter()
 
+            #print(f"Sending request to Cerebras API for model '{model}' with payload: {json.dumps(payload, indent=2)}")
 
+            with metered('cerebras', model, conversation_id) as meter:
+                if near_hit is not None:
+                    generated_text, json_object = near_hit.value
+                    print(Fore.GREEN + f"Near-duplicate cache hit (similarity {near_hit.similarity:.2f}), hit rate {near_cache.stats()['hit_rate']:.0%}" + Style.RESET_ALL)
+                elif json_mode:
+                    # Stop sequences are not compatible with JSON mode.
+                    payload.pop("stop", None)
+                    meter.mode = "json"
+                    json_object, generated_text, _ = request_json_completion(inference_url, headers, payload, token, max_attempts=self.JSON_MODE_ATTEMPTS,
+                                                                             retries=self.MAX_RETRIES)
+                elif matcher.active:
+                    # Stream so stop sequences and budgets are enforced client-side too.
+                    meter.mode = "stream"
+                    generated_text, _ = consume_stream(stream_completion(inference_url, headers, payload, token, max_attempts=self.MAX_RETRIES), matcher)
+                else:
+                    api_response_json = take_or_call(
+                        request_key('cerebras', inference_url, payload),
+                        lambda: self.post_completion(inference_url, headers, payload, token), token,
+                        cacheable=lambda body: bool(body.get('choices')))
+                    #print(f"Cerebras API Response: {json.dumps(api_response_json, indent=2)}")
+
+                    if 'choices' in api_response_json and api_response_json['choices']:
+                        generated_text = api_response_json['choices'][0]['message']['content']
+                    else:
+                        raise ValueError("Unexpected API response format: No 'choices' or empty 'choices' array.")
+
+            meter.finish(prompt_messages, generated_text)
+            if near_hit is None:
+                catalog.record(model, time.perf_counter() - start, estimate_tokens(generated_text))
+                if near_scope is not None:
+                    near_cache.store(near_scope, user_input, (generated_text, json_object))
             success = True
 
+        except DeadlineExceeded as e:
+            print(Fore.RED + f"Cerebras API request exceeded its time budget of {timeout}s." + Style.RESET_ALL)
+            generated_text = f"API request error: {e}"
+            success = False
+        except (InterruptProcessingException, ExecutionCancelled):
+            raise
         except requests.exceptions.RequestException as e:
             print(Fore.RED + f"Error during Cerebras API inference: {e}" + Style.RESET_ALL)
             generated_text = f"API request error: {e}"
             success = False
+        except JSONStreamError as e:
+            print(Fore.RED + f"Cerebras JSON mode output was not valid JSON: {e}" + Style.RESET_ALL)
+            generated_text = f"Invalid JSON output: {e}"
+            success = False
         except json.JSONDecodeError as e:
             print(Fore.RED + f"Error decoding JSON response from Cerebras API: {e}" + Style.RESET_ALL)
             generated_text = f"JSON decode error: {e}"
@@ -168,9 +234,62 @@ class CerebrasAPILLM:
             conversation_history.append({"role": "assistant", "content": generated_text})
             self.chat_history_manager.update_history(conversation_id, conversation_history)
 
-        chat_history = json.dumps(self.chat_history_manager.get_all_conversations(), indent=2)
-        return generated_text, success, conversation_id, chat_history
+        chat_history = dumps(self.chat_history_manager.get_all_conversations(), pretty=True)
+        return generated_text, success, conversation_id, chat_history, json_object
+
+    def build_payload(self, model, messages, temperature, max_tokens, top_p, seed, stop):
+        payload = { 
+            "model": model,
+            "messages": messages, 
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+            "seed": seed,
+            #"stop": [stop] if stop else None, # Stop sequences - check if API expects list or string
+            #"stream": False, # Streaming - if API supports it, you can add a toggle
+            # Add other API parameters as needed (e.g., top_k, presence_penalty, etc.) - CHECK API DOCS
+        }
+        stop_sequences = normalize_stop_sequences(stop)
+        if stop_sequences:
+            payload["stop"] = stop_sequences
+        return payload, stop_sequences
+
+    def post_completion(self, inference_url, headers, payload, token=None):
+        response = post_json_with_retry(inference_url, headers, payload, self.MAX_RETRIES, token=token)
+        response.raise_for_status() 
+        body = parse_response(response)
+        note_usage(body.get("usage"))
+        return body
+
+    def prefetch(self, model, preset, system_message, user_input, temperature, max_tokens, top_p, seed, stop, json_mode, conversation_id, timeout=0.0, stop_regex="", max_chars=0, near_duplicate_threshold=0.0, **_):
+        """Make the request a new conversation with these inputs would send and cache the result.
+
+        Only the plain request path is prefetched; continued conversations,
+        JSON mode, client-side stops and the near-duplicate cache return False.
+        """
+        if conversation_id or json_mode or near_duplicate_threshold > 0 or "error_fetching_models" in self.instance_llm_models:
+            return False
+        if preset != self.DEFAULT_PROMPT:
+            system_message = get_prompt_content(self.prompt_options, preset)
+        messages = [{"role": "system", "content": system_message}, {"role": "user", "content": user_input}]
+        payload, stop_sequences = self.build_payload(model, messages, temperature, max_tokens, top_p, seed, stop)
+        if StopMatcher(stop_sequences, stop_regex, max_chars).active:
+            return False
+        payload["max_tokens"], catalog_error = get_catalog('cerebras').fit_request(model, messages, max_tokens)
+        if catalog_error:
+            return False
+        inference_url = f"{self.cerebras_api_base_url}/chat/completions"
+        headers = {'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'}
+
+        def call():
+            with metered('cerebras', model, mode="prefetch") as meter:
+                body = self.post_completion(inference_url, headers, payload)
+            if not body.get('choices'):
+                return None
+            meter.finish(messages, body['choices'][0]['message']['content'])
+            return body
+        return response_cache.fill(request_key('cerebras', inference_url, payload), call)
 
     def get_chat_history(self):
         all_conversations = self.chat_history_manager.get_all_conversations()
-        return json.dumps(all_conversations, indent=2)
\ No newline at end of file
+        return dumps(all_conversations, pretty=True)
\ No newline at end of file
@@ -1,38 +1,41 @@
 import os
-import json
+import time
 import random
 import numpy as np
 import torch
 from colorama import init, Fore, Style
-from configparser import ConfigParser
 from groq import Groq
 import requests 
 
-from ..utils.Groq_api_utils import make_api_request, load_prompt_options, get_prompt_content
+from ..utils.Groq_api_utils import make_api_request, make_streaming_api_request, make_json_api_request, load_prompt_options, get_prompt_content
 from ..utils.Groq_chat_utils import ChatHistoryManager
 from ..utils.Groq_model_fetch import fetch_groq_models, load_config 
+from ..utils.json_utils import dumps
+from ..utils.cancel_utils import CancelToken, in_background
+from ..utils.stop_utils import StopMatcher, normalize_stop_sequences
+from ..utils.catalog_utils import get_catalog, estimate_tokens, model_choices
+from ..utils.provider_utils import load_provider_config
+from ..utils.registry_utils import shared
+from ..utils.cache_utils import request_key, response_cache, take_or_call
+from ..utils.near_cache_utils import near_cache, scope_key
+from ..utils.priority_utils import with_priority
+from ..utils.profile_utils import profiled
+from ..utils.usage_utils import metered
 
 init()  
 
 class GroqAPILLM:
     DEFAULT_PROMPT = "Use [system_message] and [user_input]"
+    CHAT_URL = 'https://api.groq.com/openai/v1/chat/completions'
 
     _LLM_MODELS = [] 
 
     def __init__(self):
+        # Config, history store, model list and client live in the shared
+        # registry; constructing a node only borrows them.
         current_directory = os.path.dirname(os.path.realpath(__file__))
         groq_directory = os.path.join(current_directory, 'groq')
-        config_path = os.path.join(groq_directory, 'GroqConfig.ini')
-        self.config = ConfigParser()
-        self.config.read(config_path)
-        self.api_key = self.config.get('API', 'key')
-        self.client = Groq(api_key=self.api_key) 
-
-        self.instance_llm_models = fetch_groq_models() 
-        if not self.instance_llm_models:
-            print(Fore.RED + "Failed to fetch Groq models from API.  Node will not have model choices." + Style.RESET_ALL)
-            self.instance_llm_models = ["no_models_available"]
-        GroqAPILLM._LLM_MODELS = self.instance_llm_models 
+        self.instance_llm_models = self.LLM_MODELS()
 
         prompt_files = [
             os.path.join(groq_directory, 'DefaultPrompts.json'),
@@ -40,13 +43,34 @@ class GroqAPILLM:
         ]
         self.prompt_options = load_prompt_options(prompt_files)
 
-        self.chat_history_manager = ChatHistoryManager()
+        self.chat_history_manager = shared.get("history", "groq", ChatHistoryManager)
+
+    @property
+    def config(self):
+        return load_provider_config('groq')
+
+    @property
+    def api_key(self):
+        return self.config.get('API', 'key', fallback='')
 
+    @property
+    def client(self):
+        """Groq SDK client shared by all instances, rebuilt when the key changes."""
+        api_key = self.api_key
+        cached_key, client = shared.get("client", "groq", lambda: (api_key, Groq(api_key=api_key)))
+        if cached_key != api_key:
+            shared.discard("client", "groq")
+            cached_key, client = shared.get("client", "groq", lambda: (api_key, Groq(api_key=api_key)))
+        return client
 
     @classmethod
     def LLM_MODELS(cls): 
-        instance = cls() 
-        return instance.instance_llm_models
+        models = model_choices('groq', fetch_groq_models)
+        if not models:
+            print(Fore.RED + "Failed to fetch Groq models from API.  Node will not have model choices." + Style.RESET_ALL)
+            models = ["no_models_available"]
+        GroqAPILLM._LLM_MODELS = models
+        return models
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -78,30 +102,48 @@ class GroqAPILLM:
                 "stop": ("STRING", {"default": "", "tooltip": "Stop generation when the specified sequence is encountered."}),
                 "json_mode": ("BOOLEAN", {"default": False, "tooltip": "Enable JSON mode for structured output."}),
                 "conversation_id": ("STRING", {"default": "", "tooltip": "Unique identifier for the conversation. Leave empty for a new conversation."}),
+            },
+            "optional": {
+                "timeout": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 3600.0, "step": 1.0, "tooltip": "Overall time budget in seconds for the request, including retries. 0 disables the budget."}),
+                "stop_regex": ("STRING", {"default": "", "tooltip": "Optional regular expression checked client-side on the streamed output. Generation stops at the first match."}),
+                "max_chars": ("INT", {"default": 0, "min": 0, "max": 1000000, "step": 1, "tooltip": "Client-side character budget for the output. 0 disables the budget."}),
+                "fork": ("BOOLEAN", {"default": False, "tooltip": "Continue conversation_id in a new branch that shares its messages instead of appending to it. The new branch id is returned."}),
+                "fork_at": ("INT", {"default": 0, "min": 0, "max": 100000, "step": 1, "tooltip": "Number of messages of conversation_id the branch shares. 0 shares all of them."}),
+                "near_duplicate_threshold": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 1.0, "step": 0.01, "tooltip": "Reuse the answer to an earlier, almost identical user_input (same preset, model and settings) when their similarity is at least this. Only for new conversations. 0 disables it."}),
+                "profile": ("BOOLEAN", {"default": False, "tooltip": "Profile this execution (sampled stacks, allocations, history and HTTP timings) into the profiles folder."}),
             }
         }
 
     OUTPUT_NODE = True
-    RETURN_TYPES = ("STRING", "BOOLEAN", "STRING", "STRING", "STRING")
-    RETURN_NAMES = ("api_response", "success", "status_code", "conversation_id", "chat_history")
-    OUTPUT_TOOLTIPS = ("The API response. This is the text generated by the model", "Whether the request was successful", "The status code of the request", "The unique identifier for the conversation", "The complete chat history")
+    RETURN_TYPES = ("STRING", "BOOLEAN", "STRING", "STRING", "STRING", "JSON")
+    RETURN_NAMES = ("api_response", "success", "status_code", "conversation_id", "chat_history", "json_object")
+    OUTPUT_TOOLTIPS = ("The API response. This is the text generated by the model", "Whether the request was successful", "The status code of the request", "The unique identifier for the conversation", "The complete chat history", "The parsed JSON output when json_mode is enabled, otherwise None")
     FUNCTION = "process_completion_request"
     CATEGORY = "apachellmpack"
     DESCRIPTION = "Uses Groq API to generate text from language models with conversation context."
 
-    def process_completion_request(self, model, preset, system_message, user_input, temperature, max_tokens, top_p, seed, max_retries, stop, json_mode, conversation_id):
-        torch.manual_seed(seed)
-        np.random.seed(seed)
-        random.seed(seed)
+    @profiled("groq")
+    @with_priority("interactive")
+    def process_completion_request(self, model, preset, system_message, user_input, temperature, max_tokens, top_p, seed, max_retries, stop, json_mode, conversation_id, timeout=0.0, stop_regex="", max_chars=0, fork=False, fork_at=0, near_duplicate_threshold=0.0):
+        token = CancelToken(timeout)
+
+        if not in_background():
+            # The global RNGs are shared with samplers on ComfyUI's thread;
+            # a submitted request must not reseed them mid-generation.
+            torch.manual_seed(seed)
+            np.random.seed(seed)
+            random.seed(seed)
 
         if preset == self.DEFAULT_PROMPT:
             system_message = system_message
         else:
             system_message = get_prompt_content(self.prompt_options, preset)
 
-        url = 'https://api.groq.com/openai/v1/chat/completions'
-        headers = {'Authorization': f'Bearer {self.api_key}'}
+        url = self.CHAT_URL
+        headers = {'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'}
 
+        if fork and conversation_id:
+            conversation_id = self.chat_history_manager.fork_conversation(conversation_id, fork_at or None)
         if not conversation_id:
             conversation_id = self.chat_history_manager.create_new_conversation()
 
@@ -113,29 +155,100 @@ class GroqAPILLM:
         # Add user input to conversation history
         conversation_history.append({"role": "user", "content": user_input})
 
+        data, stop_sequences = self.build_request_data(model, conversation_history, temperature, max_tokens, top_p, seed, stop)
+        matcher = StopMatcher(stop_sequences, stop_regex, max_chars)
+
+        #print(f"Sending request to {url} with data: {json.dumps(data, indent=4)} and headers: {headers}")
+
+        catalog = get_catalog('groq')
+        data['max_tokens'], catalog_error = catalog.fit_request(model, conversation_history, max_tokens)
+
+        json_object = None
+        near_scope = near_hit = None
+        if near_duplicate_threshold > 0 and len(conversation_history) == 2 and not catalog_error:
+            near_scope = scope_key('groq', url, data, json_mode=json_mode, stop_regex=stop_regex, max_chars=max_chars)
+            near_hit = near_cache.lookup(near_scope, user_input, near_duplicate_threshold)
+        start = time.perf_counter()
+        with metered('groq', model, conversation_id) as meter:
+            if catalog_error:
+                print(Fore.RED + catalog_error + Style.RESET_ALL)
+                assistant_message, success, status_code = catalog_error, False, "Rejected before sending"
+            elif near_hit is not None:
+                (assistant_message, json_object), success = near_hit.value, True
+                status_code = f"Near-duplicate cache hit (similarity {near_hit.similarity:.2f})"
+                print(Fore.GREEN + f"{status_code}, hit rate {near_cache.stats()['hit_rate']:.0%}" + Style.RESET_ALL)
+            elif json_mode:
+                # Stop sequences are not compatible with JSON mode.
+                data.pop('stop', None)
+                meter.mode = "json"
+                assistant_message, success, status_code, json_object = make_json_api_request(data, headers, url, max_retries, token=token)
+            elif matcher.active:
+                # Stream so stop sequences and budgets are enforced client-side too.
+                meter.mode = "stream"
+                assistant_message, success, status_code = make_streaming_api_request(data, headers, url, max_retries, matcher, token=token)
+            else:
+                assistant_message, success, status_code = take_or_call(
+                    request_key('groq', url, data),
+                    lambda: make_api_request(data, headers, url, max_retries, token=token), token,
+                    cacheable=lambda result: result[1])
+
+        if success:
+            meter.finish(conversation_history, assistant_message)
+            if near_hit is None:
+                catalog.record(model, time.perf_counter() - start, estimate_tokens(assistant_message))
+            conversation_history.append({"role": "assistant", "content": assistant_message})
+            self.chat_history_manager.update_history(conversation_id, conversation_history)
+            if near_scope is not None and near_hit is None:
+                near_cache.store(near_scope, user_input, (assistant_message, json_object))
+        else:
+            meter.fail(status_code)
+
+        chat_history = dumps(self.chat_history_manager.get_all_conversations(), pretty=True)
+        return assistant_message, success, status_code, conversation_id, chat_history, json_object
+
+    def build_request_data(self, model, messages, temperature, max_tokens, top_p, seed, stop):
         data = {
             'model': model,
-            'messages': conversation_history,
+            'messages': messages,
             'temperature': temperature,
             'max_tokens': max_tokens,
             'top_p': top_p,
             'seed': seed
         }
 
-        if stop:  
-            data['stop'] = stop
-
-        #print(f"Sending request to {url} with data: {json.dumps(data, indent=4)} and headers: {headers}")
+        stop_sequences = normalize_stop_sequences(stop)
+        if stop_sequences:
+            data['stop'] = stop_sequences
+        return data, stop_sequences
 
-        assistant_message, success, status_code = make_api_request(data, headers, url, max_retries)
+    def prefetch(self, model, preset, system_message, user_input, temperature, max_tokens, top_p, seed, max_retries, stop, json_mode, conversation_id, timeout=0.0, stop_regex="", max_chars=0, near_duplicate_threshold=0.0, **_):
+        """Make the request a new conversation with these inputs would send and cache the result.
 
-        if success:
-            conversation_history.append({"role": "assistant", "content": assistant_message})
-            self.chat_history_manager.update_history(conversation_id, conversation_history)
-
-        chat_history = json.dumps(self.chat_history_manager.get_all_conversations(), indent=2)
-        return assistant_message, success, status_code, conversation_id, chat_history
+        Only the plain request path is prefetched; continued conversations,
+        JSON mode, client-side stops and the near-duplicate cache return False.
+        """
+        if conversation_id or json_mode or near_duplicate_threshold > 0:
+            return False
+        if preset != self.DEFAULT_PROMPT:
+            system_message = get_prompt_content(self.prompt_options, preset)
+        messages = [{"role": "system", "content": system_message}, {"role": "user", "content": user_input}]
+        data, stop_sequences = self.build_request_data(model, messages, temperature, max_tokens, top_p, seed, stop)
+        if StopMatcher(stop_sequences, stop_regex, max_chars).active:
+            return False
+        data['max_tokens'], catalog_error = get_catalog('groq').fit_request(model, messages, max_tokens)
+        if catalog_error:
+            return False
+        headers = {'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'}
+
+        def call():
+            with metered('groq', model, mode="prefetch") as meter:
+                result = make_api_request(data, headers, self.CHAT_URL, max_retries)
+            if not result[1]:
+                return None
+            meter.finish(messages, result[0])
+            return result
+        return response_cache.fill(request_key('groq', self.CHAT_URL, data), call)
 
     def get_chat_history(self):
         all_conversations = self.chat_history_manager.get_all_conversations()
-        return json.dumps(all_conversations, indent=2)
\ No newline at end of file
+        return dumps(all_conversations, pretty=True)
\ No newline at end of file
@@ -0,0 +1,135 @@
+from colorama import init, Fore, Style
+
+from ..utils.Groq_api_utils import load_prompt_options, get_prompt_content
+from ..utils.cancel_utils import CancelToken, DeadlineExceeded
+from ..utils.json_utils import dumps
+from ..utils.pipeline_utils import BOUNDARIES, StreamError, start_stage, streams
+from ..utils.provider_utils import PROVIDER_NAMES, build_chat_payload, get_base_url, get_headers, prompt_files
+from ..utils.stream_utils import stream_completion
+from ..utils.usage_utils import metered
+
+init()
+
+STREAM_TYPE = "LLM_STREAM"
+
+
+class LLMStream:
+    """One streaming stage of an LLM chain.
+
+    Returns a stream handle at once and generates in the background. With an
+    ``upstream`` stream, the upstream text is cut at ``boundary`` and a
+    request starts for each segment as soon as it is complete, so chained
+    stages run at the same time instead of one after the other.
+    """
+    DEFAULT_PROMPT = "Use [system_message] and [user_input]"
+    MAX_RETRIES = 3
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        try:
+            prompt_options = load_prompt_options(prompt_files(PROVIDER_NAMES[0]))
+        except Exception as e:
+            print(Fore.RED + f"Failed to load prompt options: {e}" + Style.RESET_ALL)
+            prompt_options = {}
+        return {
+            "required": {
+                "provider": (PROVIDER_NAMES, {"tooltip": "Provider used for this stage."}),
+                "model": ("STRING", {"default": "llama-3.1-8b-instant", "tooltip": "Model id used for this stage."}),
+                "preset": ([cls.DEFAULT_PROMPT] + list(prompt_options.keys()), {"tooltip": "Select a preset or custom prompt for guiding the LLM."}),
+                "system_message": ("STRING", {"multiline": True, "default": "", "tooltip": "System message used when no preset is selected."}),
+                "user_input": ("STRING", {"multiline": True, "default": "", "tooltip": "User input. With an upstream stream, [user_input] is replaced by each upstream segment (appended if absent)."}),
+                "boundary": (list(BOUNDARIES), {"default": "sentence", "tooltip": "Where the upstream text is cut into requests: per sentence, per paragraph, per complete JSON object, or the complete text."}),
+                "parallel_segments": ("INT", {"default": 2, "min": 1, "max": 16, "step": 1, "tooltip": "Segment requests running at once; outputs stay in upstream order."}),
+                "temperature": ("FLOAT", {"default": 0.85, "min": 0.0, "max": 2.0, "step": 0.05, "tooltip": "Controls randomness in responses."}),
+                "max_tokens": ("INT", {"default": 1024, "min": 1, "max": 131072, "step": 1, "tooltip": "Maximum number of tokens per request."}),
+                "top_p": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01, "tooltip": "Nucleus sampling threshold."}),
+                "seed": ("INT", {"default": 42, "min": 0, "max": 4294967295, "tooltip": "Seed for every request."}),
+            },
+            "optional": {
+                "upstream": (STREAM_TYPE, {"tooltip": "Stream of an earlier LLM Stream node to feed into this stage."}),
+                "timeout": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 3600.0, "step": 1.0, "tooltip": "Overall time budget in seconds for this stage. 0 disables the budget."}),
+            }
+        }
+
+    RETURN_TYPES = (STREAM_TYPE,)
+    RETURN_NAMES = ("stream",)
+    OUTPUT_TOOLTIPS = ("Handle of the token stream; connect it to another LLM Stream node or to LLM Stream Collect",)
+    FUNCTION = "start"
+    CATEGORY = "apachellmpack"
+    DESCRIPTION = "Streams an LLM response to downstream stages as it is generated; chained stages start at each sentence, paragraph or JSON object."
+
+    @staticmethod
+    def user_message(user_input, segment):
+        if segment is None:
+            return user_input
+        if "[user_input]" in user_input:
+            return user_input.replace("[user_input]", segment)
+        return f"{user_input}\n\n{segment}" if user_input.strip() else segment
+
+    def start(self, provider, model, preset, system_message, user_input, boundary, parallel_segments, temperature,
+              max_tokens, top_p, seed, upstream=None, timeout=0.0):
+        token = CancelToken(timeout)
+        if preset != self.DEFAULT_PROMPT:
+            system_message = get_prompt_content(load_prompt_options(prompt_files(provider)), preset)
+        upstream_stream = streams.get(upstream) if upstream is not None else None
+        url = f"{get_base_url(provider)}/chat/completions"
+        headers = get_headers(provider)
+
+        def request(segment):
+            messages = [{"role": "system", "content": system_message}] if system_message else []
+            messages.append({"role": "user", "content": self.user_message(user_input, segment)})
+            payload = build_chat_payload(provider, model, messages, temperature=temperature, max_tokens=max_tokens,
+                                         top_p=top_p, seed=seed)
+            parts = []
+            with metered(provider, model, mode="stream_pipeline") as meter:
+                for delta in stream_completion(url, headers, payload, token, max_attempts=self.MAX_RETRIES):
+                    parts.append(delta)
+                    yield delta
+            meter.finish(messages, "".join(parts))
+
+        handle, _ = start_stage(f"{provider}:{model}", request, upstream_stream, boundary, parallel_segments, token)
+        return (handle,)
+
+
+class LLMStreamCollect:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "stream": (STREAM_TYPE, {"tooltip": "Stream from an LLM Stream node, usually the last stage of a chain."}),
+            },
+            "optional": {
+                "timeout": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 3600.0, "step": 1.0, "tooltip": "Seconds to wait for the stream to finish. 0 waits until it is done."}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "BOOLEAN", "STRING")
+    RETURN_NAMES = ("text", "success", "stages")
+    OUTPUT_TOOLTIPS = ("Complete text of the stream", "Whether every stage finished successfully", "Per-stage timing: segments, chars, first token and finish time (JSON string)")
+    FUNCTION = "collect"
+    CATEGORY = "apachellmpack"
+    DESCRIPTION = "Waits for an LLM stream chain to finish and returns the final text. Place it as late in the graph as possible."
+
+    def collect(self, stream, timeout=0.0):
+        token = CancelToken(timeout)
+        output = streams.get(stream)
+        try:
+            text, success = output.text(token), True
+        except StreamError as e:
+            text, success = f"Error: {e}", False
+            print(Fore.RED + text + Style.RESET_ALL)
+        except DeadlineExceeded:
+            text, success = f"Error: LLM stream not finished after {timeout}s.", False
+            print(Fore.YELLOW + text + Style.RESET_ALL)
+        except BaseException:
+            # An interrupt stops the whole chain, not just this wait.
+            output.cancel()
+            raise
+
+        stages = []
+        current = output
+        while current is not None:
+            stages.append(current.stats())
+            current = current.upstream
+        stages.reverse()
+        return (text, success, dumps(stages, pretty=True))
@@ -0,0 +1,108 @@
+import time
+from colorama import init, Fore, Style
+
+import requests
+
+from ..utils.Groq_api_utils import load_prompt_options, get_prompt_content
+from ..utils.async_utils import imap_bounded
+from ..utils.cancel_utils import CancelToken, DeadlineExceeded
+from ..utils.json_utils import dumps
+from ..utils.priority_utils import PRIORITIES, request_priority
+from ..utils.provider_utils import PROVIDER_NAMES, chat_completion, prompt_files
+from ..utils.template_utils import MODES, Sweep, parse_variables
+from ..utils.usage_utils import metered
+
+init()
+
+
+class TemplateSweepLLM:
+    """Expands prompt templates over wildcard lists and runs every combination.
+
+    Templates use ``{name}`` variables, ``{a|b|c}`` inline wildcards and
+    ``__name__`` wildcard lists. Combinations are generated one at a time and
+    fed to a bounded window of concurrent requests, so a large sweep never
+    exists in memory as a list of payloads.
+    """
+    DEFAULT_PROMPT = "Use [system_message] and [user_input]"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        try:
+            prompt_options = load_prompt_options(prompt_files(PROVIDER_NAMES[0]))
+        except Exception as e:
+            print(Fore.RED + f"Failed to load prompt options: {e}" + Style.RESET_ALL)
+            prompt_options = {}
+        return {
+            "required": {
+                "provider": (PROVIDER_NAMES, {"tooltip": "Provider used for every request."}),
+                "model": ("STRING", {"default": "llama-3.1-8b-instant", "tooltip": "Model id used for every request."}),
+                "preset": ([cls.DEFAULT_PROMPT] + list(prompt_options.keys()), {"tooltip": "Preset used as the system message template; its text may use the template syntax too."}),
+                "system_message": ("STRING", {"multiline": True, "default": "", "tooltip": "System message template used when no preset is selected."}),
+                "user_input": ("STRING", {"multiline": True, "default": "a {red|green|blue} __subject__ in {style}", "tooltip": "User message template: {name} variables, {a|b|c} inline wildcards, __name__ wildcard lists."}),
+                "variables": ("STRING", {"multiline": True, "default": "style = watercolor | pixel art", "tooltip": "One 'name = option | option' per line (or a JSON object). Also fills __name__; otherwise wildcards/<name>.txt is read."}),
+                "mode": (list(MODES), {"default": "cartesian", "tooltip": "cartesian: every combination in order. sampled: 'count' distinct random combinations."}),
+                "count": ("INT", {"default": 0, "min": 0, "max": 100000, "step": 1, "tooltip": "Maximum number of requests. 0 runs every combination."}),
+                "concurrency": ("INT", {"default": 8, "min": 1, "max": 64, "step": 1, "tooltip": "Requests in flight at once; the next combination is built only when one finishes."}),
+                "temperature": ("FLOAT", {"default": 0.85, "min": 0.0, "max": 2.0, "step": 0.05, "tooltip": "Controls randomness in responses."}),
+                "max_tokens": ("INT", {"default": 1024, "min": 1, "max": 131072, "step": 1, "tooltip": "Maximum number of tokens per response."}),
+                "top_p": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01, "tooltip": "Nucleus sampling threshold."}),
+                "seed": ("INT", {"default": 42, "min": 0, "max": 4294967295, "tooltip": "Seed for every request and for picking sampled combinations."}),
+            },
+            "optional": {
+                "timeout": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 86400.0, "step": 1.0, "tooltip": "Overall time budget in seconds for the sweep. 0 disables the budget."}),
+                "priority": (list(PRIORITIES), {"default": "bulk", "tooltip": "Scheduling class of the sweep's requests; bulk yields the provider quota to interactive nodes."}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "STRING", "STRING")
+    RETURN_NAMES = ("texts", "prompts", "sweep")
+    OUTPUT_IS_LIST = (True, True, False)
+    OUTPUT_TOOLTIPS = ("One generated text per combination, in expansion order", "The expanded user message of each combination", "Every combination with its variable values, latency and error (JSON string)")
+    FUNCTION = "run_sweep"
+    CATEGORY = "apachellmpack"
+    DESCRIPTION = "Expands wildcard/variable templates lazily (cartesian or sampled) and streams the combinations through concurrent LLM requests."
+
+    def run_request(self, provider, model, sweep, expansion, temperature, max_tokens, top_p, seed, token, priority="bulk"):
+        system_message, user_message = expansion.texts
+        messages = [{"role": "system", "content": system_message}] if system_message else []
+        messages.append({"role": "user", "content": user_message})
+        result = {"index": expansion.index, "values": sweep.named_values(expansion), "prompt": user_message}
+        start = time.perf_counter()
+        try:
+            with request_priority(priority), metered(provider, model, mode="sweep") as meter:
+                text, _ = chat_completion(provider, model, messages, token=token, temperature=temperature,
+                                          max_tokens=max_tokens, top_p=top_p, seed=seed)
+            meter.finish(messages, text)
+            return dict(result, text=text, success=True, latency=round(time.perf_counter() - start, 3))
+        except DeadlineExceeded:
+            return dict(result, text="", success=False, error="Deadline exceeded")
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            return dict(result, text="", success=False, error=str(e))
+
+    def run_sweep(self, provider, model, preset, system_message, user_input, variables, mode, count, concurrency,
+                  temperature, max_tokens, top_p, seed, timeout=0.0, priority="bulk"):
+        token = CancelToken(timeout)
+        if preset != self.DEFAULT_PROMPT:
+            system_message = get_prompt_content(load_prompt_options(prompt_files(provider)), preset)
+        sweep = Sweep([system_message, user_input], parse_variables(variables))
+        if sweep.missing:
+            print(Fore.YELLOW + f"Template sweep: no options for {', '.join(sweep.missing)}; left as written." + Style.RESET_ALL)
+
+        expansions = sweep.expand(mode, count, seed)
+        results = []
+        try:
+            for _, result in imap_bounded(
+                    lambda expansion: self.run_request(provider, model, sweep, expansion, temperature, max_tokens,
+                                                       top_p, seed, token, priority),
+                    expansions, concurrency, token):
+                results.append(result)
+        except DeadlineExceeded:
+            print(Fore.YELLOW + f"Template sweep: time budget used up after {len(results)} requests." + Style.RESET_ALL)
+        results.sort(key=lambda r: r["index"])
+
+        failed = sum(1 for r in results if not r["success"])
+        if failed:
+            print(Fore.RED + f"Template sweep: {failed} of {len(results)} requests failed." + Style.RESET_ALL)
+        print(Fore.GREEN + f"Template sweep: {len(results)} of {sweep.total} combinations ({mode})." + Style.RESET_ALL)
+        texts = [r["text"] if r["success"] else f"Error: {r['error']}" for r in results]
+        return (texts, [r["prompt"] for r in results], dumps(results, pretty=True))
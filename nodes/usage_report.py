@@ -0,0 +1,54 @@
+from ..utils.json_utils import dumps
+from ..utils.near_cache_utils import near_cache
+from ..utils.priority_utils import schedulers
+from ..utils.provider_utils import PROVIDER_NAMES
+from ..utils.shared_cache_utils import shared_cache
+from ..utils.usage_utils import GROUP_BYS, format_connections, format_report, usage_ledger
+from ..utils.warmup_utils import prewarm_stats
+
+
+class LLMUsageReport:
+    """Spend and throughput from the usage ledger, grouped by model, provider, conversation or day."""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "group_by": (list(GROUP_BYS), {"default": "model", "tooltip": "How to group the usage rows."}),
+                "provider": (["all"] + PROVIDER_NAMES, {"default": "all", "tooltip": "Only count requests to this provider."}),
+                "limit": ("INT", {"default": 20, "min": 0, "max": 10000, "step": 1, "tooltip": "Number of rows to show, highest cost first. 0 shows all."}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "FLOAT", "INT", "STRING")
+    RETURN_NAMES = ("report", "total_cost", "total_tokens", "usage_json")
+    OUTPUT_TOOLTIPS = ("Usage table as text", "Total cost in USD of the counted requests", "Total prompt + completion tokens", "Rows and totals (JSON string)")
+    FUNCTION = "report"
+    CATEGORY = "apachellmpack"
+    DESCRIPTION = "Reports token usage, cost and throughput of the pack's LLM requests from the local usage ledger."
+
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        # The ledger changes with every request.
+        return float("nan")
+
+    def report(self, group_by, provider, limit):
+        provider = "" if provider == "all" else provider
+        rows = usage_ledger.summary(group_by, provider, limit)
+        totals = usage_ledger.totals(provider)
+        text = format_report(rows, totals, group_by)
+        near = near_cache.stats()
+        if near["lookups"]:
+            similarity = f", mean similarity {near['mean_hit_similarity']}" if near["hits"] else ""
+            text += (f"\nnear-duplicate cache: {near['hits']}/{near['lookups']} hits ({near['hit_rate']:.0%}){similarity}, "
+                     f"{near['entries']} entries")
+        shared = shared_cache.describe() if shared_cache is not None else None
+        if shared is not None:
+            text += (f"\nshared cache: {shared['hits']} hits ({shared['hit_rate']:.0%}), {shared['stores']} stores, "
+                     f"{shared['entries']} entries, {(shared['bytes'] or 0) / 1e6:.1f} MB")
+        connections = prewarm_stats()
+        text += format_connections(connections)
+        total_tokens = totals["prompt_tokens"] + totals["completion_tokens"]
+        return (text, totals["cost"], total_tokens,
+                dumps({"group_by": group_by, "rows": rows, "totals": totals, "near_duplicate_cache": near,
+                       "shared_cache": shared, "scheduler": schedulers.describe(), "connections": connections}, pretty=True))
@@ -0,0 +1,170 @@
+"""Local stand-in for an OpenAI compatible batch API (files + batches).
+
+Accepts the same uploads and batch requests as Groq, "processes" them in a
+background thread and serves the results, so batch jobs can be tested and
+resumed without spending quota:
+
+    python tools/batch_standin_server.py --port 8765 --delay 5
+
+then set the node's ``base_url`` to ``http://127.0.0.1:8765/openai/v1``.
+Each response echoes the request's last user message; ``--fail-every N``
+turns every Nth request into an error line.
+"""
+import argparse
+import email.parser
+import email.policy
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandInState:
+    def __init__(self, delay, fail_every):
+        self.delay = delay
+        self.fail_every = fail_every
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def add_file(self, content, filename, purpose):
+        file_id = f"file_{uuid.uuid4().hex[:24]}"
+        with self.lock:
+            self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "filename": filename, "purpose": purpose}
+
+    def create_batch(self, body):
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        batch = {"id": batch_id, "object": "batch", "endpoint": body.get("endpoint"),
+                 "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window"),
+                 "status": "validating", "created_at": int(time.time()), "output_file_id": None,
+                 "error_file_id": None, "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+        with self.lock:
+            self.batches[batch_id] = batch
+        threading.Thread(target=self.process, args=(batch_id,), daemon=True).start()
+        return batch
+
+    def process(self, batch_id):
+        batch = self.batches[batch_id]
+        lines = [json.loads(line) for line in self.files[batch["input_file_id"]].splitlines() if line.strip()]
+        batch["request_counts"]["total"] = len(lines)
+        batch["status"] = "in_progress"
+        outputs, errors = [], []
+        for index, line in enumerate(lines, 1):
+            time.sleep(self.delay / max(len(lines), 1))
+            if batch["status"] == "cancelling":
+                batch["status"] = "cancelled"
+                return
+            if self.fail_every and index % self.fail_every == 0:
+                errors.append({"id": f"batch_req_{index}", "custom_id": line["custom_id"], "response": None,
+                               "error": {"code": "stand_in_failure", "message": f"Simulated failure for request {index}"}})
+                batch["request_counts"]["failed"] += 1
+                continue
+            messages = line["body"].get("messages", [])
+            user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+            outputs.append({"id": f"batch_req_{index}", "custom_id": line["custom_id"], "error": None,
+                            "response": {"status_code": 200, "body": {
+                                "id": f"chatcmpl-{index}", "object": "chat.completion", "model": line["body"].get("model"),
+                                "choices": [{"index": 0, "finish_reason": "stop",
+                                             "message": {"role": "assistant", "content": f"[stand-in] {user}"}}]}}})
+            batch["request_counts"]["completed"] += 1
+        batch["status"] = "finalizing"
+        if outputs:
+            batch["output_file_id"] = self.add_file("\n".join(json.dumps(o) for o in outputs) + "\n", "output.jsonl", "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self.add_file("\n".join(json.dumps(e) for e in errors) + "\n", "errors.jsonl", "batch_output")["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            print("stand-in:", fmt % args)
+
+        def _send(self, status, body, content_type="application/json"):
+            data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self):
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_POST(self):
+            path = self.path.rstrip("/")
+            if path.endswith("/files"):
+                raw = self._body()
+                message = email.parser.BytesParser(policy=email.policy.default).parsebytes(
+                    b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + raw)
+                fields, content, filename = {}, None, "input.jsonl"
+                for part in message.iter_parts():
+                    name = part.get_param("name", header="content-disposition")
+                    if name == "file":
+                        content = part.get_payload(decode=True).decode("utf-8")
+                        filename = part.get_filename() or filename
+                    elif name:
+                        fields[name] = part.get_content().strip()
+                if content is None:
+                    return self._send(400, {"error": {"message": "missing file"}})
+                return self._send(200, state.add_file(content, filename, fields.get("purpose", "batch")))
+            if path.endswith("/batches"):
+                body = json.loads(self._body() or b"{}")
+                if body.get("input_file_id") not in state.files:
+                    return self._send(404, {"error": {"message": "input file not found"}})
+                return self._send(200, state.create_batch(body))
+            match = re.search(r"/batches/([^/]+)/cancel$", path)
+            if match and match.group(1) in state.batches:
+                self._body()
+                batch = state.batches[match.group(1)]
+                if batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+                    batch["status"] = "cancelling"
+                return self._send(200, batch)
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        def do_GET(self):
+            match = re.search(r"/batches/([^/]+)$", self.path)
+            if match:
+                batch = state.batches.get(match.group(1))
+                return self._send(200, batch) if batch else self._send(404, {"error": {"message": "batch not found"}})
+            match = re.search(r"/files/([^/]+)/content$", self.path)
+            if match:
+                content = state.files.get(match.group(1))
+                if content is None:
+                    return self._send(404, {"error": {"message": "file not found"}})
+                return self._send(200, content.encode("utf-8"), "application/jsonl")
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8765, delay=5.0, fail_every=0):
+    """Start the server in a background thread; returns it (``server_port`` has the port)."""
+    server = ThreadingHTTPServer((host, port), make_handler(StandInState(delay, fail_every)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=5.0, help="seconds to 'process' a whole batch")
+    parser.add_argument("--fail-every", type=int, default=0, help="fail every Nth request (0 = never)")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(StandInState(args.delay, args.fail_every)))
+    print(f"Stand-in batch API on http://{args.host}:{args.port}/openai/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
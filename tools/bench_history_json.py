@@ -0,0 +1,91 @@
+"""Benchmark the chat history JSON round-trip.
+
+Compares the original stdlib path (``json.loads`` + ``json.dump(indent=2)``)
+with ``utils.json_utils`` (orjson when installed, compact output) on history
+files of realistic sizes.
+
+    python tools/bench_history_json.py
+    python tools/bench_history_json.py --conversations 50 500 2000 --messages 12
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+
+import json_utils  # noqa: E402
+
+
+def make_history(conversations, messages, seed=0):
+    rng = random.Random(seed)
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(2000)]
+    history = OrderedDict()
+    for _ in range(conversations):
+        conversation_id = '%08x-%04x-%04x-%04x-%012x' % tuple(rng.getrandbits(b) for b in (32, 16, 16, 16, 48))
+        turns = [{"role": "system", "content": ' '.join(rng.choices(words, k=120))}]
+        for i in range(messages - 1):
+            role = "user" if i % 2 == 0 else "assistant"
+            turns.append({"role": role, "content": ', '.join(rng.choices(words, k=rng.randint(20, 90)))})
+        history[conversation_id] = turns
+    return history
+
+
+def stdlib_round_trip(path, history):
+    with open(path, 'r') as f:
+        loaded = OrderedDict(json.loads(f.read().strip()))
+    with open(path, 'w') as f:
+        json.dump(loaded, f, indent=2)
+    return json.dumps(history, indent=2)
+
+
+def fast_round_trip(path, history):
+    with open(path, 'rb') as f:
+        loaded = OrderedDict(json_utils.loads(f.read().strip()))
+    json_utils.dump_file(path, loaded)
+    return json_utils.dumps(history, pretty=True)
+
+
+def bench(fn, path, history, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(path, history)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--messages', type=int, default=10, help='Messages per conversation (incl. system)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"json_utils backend: {json_utils.BACKEND}")
+    print(f"{'conversations':>13} {'stdlib KiB':>11} {'compact KiB':>12} {'stdlib ms':>10} {'json_utils ms':>14} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.conversations:
+            history = make_history(count, args.messages)
+            path = os.path.join(tmp, 'history.json')
+
+            with open(path, 'w') as f:
+                json.dump(history, f, indent=2)
+            pretty_size = os.path.getsize(path)
+            stdlib_time = bench(stdlib_round_trip, path, history, args.repeat)
+
+            json_utils.dump_file(path, history)
+            compact_size = os.path.getsize(path)
+            fast_time = bench(fast_round_trip, path, history, args.repeat)
+
+            print(f"{count:>13} {pretty_size / 1024:>11.1f} {compact_size / 1024:>12.1f} "
+                  f"{stdlib_time * 1000:>10.2f} {fast_time * 1000:>14.2f} {stdlib_time / fast_time:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
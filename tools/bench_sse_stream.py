@@ -0,0 +1,119 @@
+"""Benchmark CPU time spent parsing a streamed completion.
+
+Compares the original path (``Response.iter_lines()``, a ``data:`` prefix
+check and ``json.loads`` per line, text accumulated with ``+=``) with
+``utils.sse_utils`` (bulk line splitting on 64 KiB reads, ``json_utils``
+loads, list accumulation) on a synthetic stream of chat deltas with the
+occasional keep-alive comment. Reported as CPU ms per 10k streamed tokens.
+The ``gzip`` rows serve the same stream with ``Content-Encoding: gzip``
+through urllib3, as requests does.
+
+    python tools/bench_sse_stream.py
+    python tools/bench_sse_stream.py --tokens 10000 100000 --repeat 7
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import random
+import string
+import sys
+import time
+
+import requests
+import urllib3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+
+import json_utils  # noqa: E402
+import sse_utils  # noqa: E402
+
+
+def make_stream(tokens, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    for i in range(tokens):
+        if i % 200 == 0:
+            parts.append(b": keep-alive\n\n")
+        word = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(1, 7)))
+        event = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 1700000000,
+                 "model": "llama-3.3-70b-versatile", "system_fingerprint": "fp_bench",
+                 "choices": [{"index": 0, "delta": {"content": " " + word}, "logprobs": None, "finish_reason": None}]}
+        parts.append(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n")
+    parts.append(b'data: {"choices":[],"x_groq":{"usage":{"prompt_tokens":20,"completion_tokens":%d}}}\n\n' % tokens)
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+
+def make_response(body, encoding=None):
+    response = requests.Response()
+    response.status_code = 200
+    if encoding is None:
+        response.raw = io.BytesIO(body)
+        return response
+    # What requests builds for a streamed response: decoding is left to the reader.
+    response.headers["Content-Encoding"] = encoding
+    response.raw = urllib3.HTTPResponse(body=io.BytesIO(gzip.compress(body)), headers={"Content-Encoding": encoding},
+                                        status=200, preload_content=False, decode_content=False)
+    return response
+
+
+def original_path(body, encoding=None):
+    text = ""
+    for line in make_response(body, encoding).iter_lines():
+        if not line.startswith(b"data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == b"[DONE]":
+            break
+        choices = json.loads(payload).get("choices")
+        if choices:
+            text += choices[0]["delta"].get("content") or ""
+    return text
+
+
+def sse_path(body, encoding=None):
+    parts = []
+    for event in sse_utils.iter_events(make_response(body, encoding)):
+        if event.data == b"[DONE]":
+            break
+        choices = json_utils.loads(event.data).get("choices")
+        if choices:
+            content = choices[0]["delta"].get("content")
+            if content:
+                parts.append(content)
+    return "".join(parts)
+
+
+def bench(fn, body, repeat, encoding=None):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.process_time()
+        fn(body, encoding)
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"json_utils backend: {json_utils.BACKEND}")
+    print(f"{'tokens':>8} {'encoding':>8} {'stream KiB':>11} {'original ms/10k':>16} {'sse_utils ms/10k':>17} {'speedup':>8}")
+    for tokens in args.tokens:
+        body = make_stream(tokens)
+        for encoding in (None, "gzip"):
+            expected = original_path(body, encoding)
+            assert expected and expected == sse_path(body, encoding)
+            scale = 10000 / tokens
+            original = bench(original_path, body, args.repeat, encoding) * scale
+            fast = bench(sse_path, body, args.repeat, encoding) * scale
+            print(f"{tokens:>8} {encoding or 'none':>8} {len(body) / 1024:>11.1f} {original * 1000:>16.2f} "
+                  f"{fast * 1000:>17.2f} {original / fast:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
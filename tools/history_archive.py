@@ -0,0 +1,105 @@
+"""Convert chat history files to and from the compressed conversation archive.
+
+    python tools/history_archive.py import nodes/groq/GROQ_CONTEXT.json groq.llmarc
+    python tools/history_archive.py export groq.llmarc GROQ_CONTEXT.json --pretty
+    python tools/history_archive.py list groq.llmarc
+    python tools/history_archive.py show groq.llmarc <conversation_id>
+    python tools/history_archive.py compact nodes/groq/GROQ_CONTEXT.json.archive.llmarc
+
+``import`` reads ``*_CONTEXT.json`` and ``Nova.json``, resolving forked
+conversations into full message lists. ``export`` writes the plain
+``{conversation_id: [messages]}`` layout back, which the history files
+still load. ``show``
+decompresses only the requested conversation. ``compact`` drops the dead
+bytes that appends leave behind; it also runs on its own after an append.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+
+import archive_utils  # noqa: E402
+import branch_utils  # noqa: E402
+import json_utils  # noqa: E402
+
+
+def cmd_import(args):
+    history = json_utils.load_file(args.history) or {}
+    if not isinstance(history, dict):
+        sys.exit(f"{args.history} is not a conversation history (expected an object of conversations)")
+    orphans = [cid for cid, record in history.items() if branch_utils.is_fork(record) and record["parent"] not in history]
+    if orphans:
+        print(f"warning: {len(orphans)} forks have no parent in {args.history}; only their own messages are kept")
+    count = archive_utils.pack_history(history, args.archive, codec=args.codec, level=args.level)
+    source, target = os.path.getsize(args.history), os.path.getsize(args.archive)
+    print(f"{count} conversations: {source:,} -> {target:,} bytes ({target / max(source, 1):.1%})")
+
+
+def cmd_export(args):
+    history = archive_utils.unpack_history(args.archive)
+    json_utils.dump_file(args.history, history, pretty=args.pretty)
+    print(f"{len(history)} conversations written to {args.history}")
+
+
+def cmd_list(args):
+    with archive_utils.ConversationArchive(args.archive) as archive:
+        for conversation_id in archive.ids():
+            print(conversation_id)
+
+
+def cmd_show(args):
+    with archive_utils.ConversationArchive(args.archive) as archive:
+        record = archive.get(args.conversation_id)
+    if record is None:
+        sys.exit(f"Conversation {args.conversation_id} not found")
+    print(json_utils.dumps(record, pretty=True))
+
+
+def cmd_compact(args):
+    before = os.path.getsize(args.archive)
+    with archive_utils.ConversationArchive(args.archive) as archive:
+        archive.compact()
+    after = os.path.getsize(args.archive)
+    print(f"{before:,} -> {after:,} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="history JSON -> archive")
+    p.add_argument("history")
+    p.add_argument("archive")
+    p.add_argument("--codec", choices=sorted(archive_utils.CODECS), default=archive_utils.DEFAULT_CODEC)
+    p.add_argument("--level", type=int, default=None)
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="archive -> history JSON")
+    p.add_argument("archive")
+    p.add_argument("history")
+    p.add_argument("--pretty", action="store_true", help="indented output like the old history files")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("list", help="print the conversation ids")
+    p.add_argument("archive")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("show", help="print one conversation")
+    p.add_argument("archive")
+    p.add_argument("conversation_id")
+    p.set_defaults(func=cmd_show)
+
+    p = sub.add_parser("compact", help="rewrite the archive without dead bytes")
+    p.add_argument("archive")
+    p.set_defaults(func=cmd_compact)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except archive_utils.ArchiveError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,10 @@ from colorama import init, Fore, Style
 import os
 import requests 
 
+from .json_utils import load_file_cached, parse_response
+from .catalog_utils import get_catalog
+from .http_utils import get_session
+
 init()  
 
 logger = logging.getLogger(__name__)
@@ -13,33 +17,32 @@ def load_prompt_options(prompt_files):
     for json_file in prompt_files:
         if os.path.exists(json_file): 
             try:
-                with open(json_file, 'r') as file:
-                    prompts = json.load(file)
-                    if isinstance(prompts, list): 
-                        prompt_options.update({prompt['name']: prompt['content'] for prompt in prompts})
-                    elif isinstance(prompts, dict): 
-                        prompt_options.update(prompts)
-                    else:
-                        logger.warning(f"Unexpected prompt format in {json_file}. Expected list or dict.")
-                logger.debug(f"Prompts loaded from {json_file}: {list(prompt_options.keys())}")
+                prompts = load_file_cached(json_file)
+                if isinstance(prompts, list): 
+                    prompt_options.update({prompt['name']: prompt['content'] for prompt in prompts})
+                elif isinstance(prompts, dict): 
+                    prompt_options.update(prompts)
+                else:
+                    logger.warning("Unexpected prompt format in %s. Expected list or dict.", json_file)
+                logger.debug("Prompts loaded from %s: %s", json_file, list(prompt_options.keys()))
             except json.JSONDecodeError as e:
                 print(Fore.RED + f"JSONDecodeError loading prompts from {json_file}: {e}" + Style.RESET_ALL)
-                logger.error(f"JSONDecodeError loading prompts from {json_file}: {e}")
+                logger.error("JSONDecodeError loading prompts from %s: %s", json_file, e)
             except FileNotFoundError:
                 print(Fore.YELLOW + f"Prompt file not found: {json_file}. Skipping." + Style.RESET_ALL)
-                logger.warning(f"Prompt file not found: {json_file}. Skipping.")
+                logger.warning("Prompt file not found: %s. Skipping.", json_file)
             except Exception as e:
                 print(Fore.RED + f"Error loading prompts from {json_file}: {e}" + Style.RESET_ALL)
-                logger.error(f"Error loading prompts from {json_file}: {e}")
+                logger.error("Error loading prompts from %s: %s", json_file, e)
         else:
             print(Fore.YELLOW + f"Prompt file does not exist: {json_file}. Skipping." + Style.RESET_ALL)
-            logger.warning(f"Prompt file does not exist: {json_file}. Skipping.")
+            logger.warning("Prompt file does not exist: %s. Skipping.", json_file)
     return prompt_options
 
 def get_prompt_content(prompt_options, prompt_name):
     content = prompt_options.get(prompt_name)
     if content:
-        logger.debug(f"Retrieved content for prompt '{prompt_name}': {content[:50]}...") 
+        logger.debug("Retrieved content for prompt '%s': %s...", prompt_name, content[:50]) 
     else:
         error_message = f"No content found for prompt '{prompt_name}'."
         print(Fore.YELLOW + error_message + Style.RESET_ALL) 
@@ -51,22 +54,33 @@ def fetch_cerebras_models(api_key, cerebras_api_base_url):
     headers = {'Authorization': f'Bearer {api_key}'} 
 
     try:
-        response = requests.get(models_url, headers=headers)
+        response = get_session().get(models_url, headers=headers, timeout=10)
         response.raise_for_status()
-        models_data = response.json()
+        models_data = parse_response(response)
 
         model_names = []
         if 'data' in models_data and isinstance(models_data['data'], list):
             for model_item in models_data['data']:
                 if 'id' in model_item:
                     model_names.append(model_item['id'])
+            # Keep the full metadata in the catalog for clamping and offline use.
+            get_catalog('cerebras').update_from_api(models_data['data'])
         else:
             print(Fore.YELLOW + "Unexpected model API response format. Cannot extract model names." + Style.RESET_ALL)
-            return []
+            return _cached_model_names()
 
         #print(f"Fetched Cerebras models from API: {model_names}")
         return model_names
 
     except requests.exceptions.RequestException as e:
         print(Fore.RED + f"Error fetching Cerebras models from API: {e}" + Style.RESET_ALL)
-        return [] 
\ No newline at end of file
+        return _cached_model_names()
+    except json.JSONDecodeError as e:
+        print(Fore.RED + f"Error decoding JSON response from Cerebras models API: {e}" + Style.RESET_ALL)
+        return _cached_model_names()
+
+def _cached_model_names():
+    model_names = get_catalog('cerebras').model_ids()
+    if model_names:
+        print(Fore.YELLOW + f"Using {len(model_names)} Cerebras models from the local model catalog." + Style.RESET_ALL)
+    return model_names
@@ -1,35 +1,88 @@
 import requests
-import json
-import time
-
-def make_api_request(data, headers, url, max_retries):
-    for attempt in range(max_retries):
-        response = requests.post(url, headers=headers, json=data)
-        #print(f"Response status: {response.status_code}, Response body: {response.text}")
-        if response.status_code == 200:
-            try:
-                response_json = json.loads(response.text)
-                if 'choices' in response_json and response_json['choices']:
-                    assistant_message = response_json['choices'][0]['message']['content']
-                    #print(f"Extracted message: {assistant_message}")
-                    return assistant_message, True, "200 OK"
-                else:
-                    return "No valid response content found.", False, "200 OK but no content"
-            except Exception as e:
-                print(f"Error parsing response: {str(e)}")
-                return "Error parsing JSON response.", False, "200 OK but failed to parse JSON"
-        else:
-            return "ERROR", False, f"{response.status_code} {response.reason}"
-        time.sleep(2)
+
+from .cancel_utils import CancelToken, DeadlineExceeded
+from .retry_utils import post_json_with_retry
+from .json_utils import parse_response, load_file_cached
+from .json_stream_utils import JSONStreamError, request_json_completion
+from .stop_utils import consume_stream
+from .stream_utils import stream_completion
+from .usage_utils import note_usage
+
+def make_api_request(data, headers, url, max_retries, token=None):
+    token = token or CancelToken()
+    try:
+        # 408/429/5xx and connection failures are retried with backoff.
+        response = post_json_with_retry(url, headers, data, max_retries, token=token)
+    except DeadlineExceeded:
+        return "Request exceeded its time budget.", False, "Deadline exceeded"
+    except requests.RequestException as e:
+        print(f"Request failed: {str(e)}")
+        return "Failed after all retries.", False, "Failed after all retries"
+    #print(f"Response status: {response.status_code}, Response body: {response.text}")
+    if response.status_code == 200:
+        try:
+            response_json = parse_response(response)
+            note_usage(response_json.get('usage'))
+            if 'choices' in response_json and response_json['choices']:
+                assistant_message = response_json['choices'][0]['message']['content']
+                #print(f"Extracted message: {assistant_message}")
+                return assistant_message, True, "200 OK"
+            else:
+                return "No valid response content found.", False, "200 OK but no content"
+        except Exception as e:
+            print(f"Error parsing response: {str(e)}")
+            return "Error parsing JSON response.", False, "200 OK but failed to parse JSON"
+    return "ERROR", False, f"{response.status_code} {response.reason}"
+
+def make_streaming_api_request(data, headers, url, max_retries, matcher, token=None):
+    """Streamed variant of make_api_request that enforces ``matcher`` client-side.
+
+    The connection is closed as soon as a stop sequence, the stop regex or the
+    character budget is hit. Only failures before any output are retried.
+    """
+    token = token or CancelToken()
+    try:
+        chunks = stream_completion(url, headers, data, token, max_attempts=max_retries)
+        text, stopped = consume_stream(chunks, matcher)
+        return text, True, "200 OK (client stop)" if stopped else "200 OK"
+    except DeadlineExceeded:
+        return "Request exceeded its time budget.", False, "Deadline exceeded"
+    except requests.HTTPError as e:
+        return "ERROR", False, f"{e.response.status_code} {e.response.reason}"
+    except requests.RequestException as e:
+        print(f"Streaming request failed: {str(e)}")
+        if matcher.text:
+            return matcher.text, False, "Stream interrupted"
     return "Failed after all retries.", False, "Failed after all retries"
 
+def make_json_api_request(data, headers, url, max_retries, token=None):
+    """JSON mode request. Returns ``(text, success, status, parsed_json)``.
+
+    Output is validated while it streams; invalid JSON aborts the stream and
+    retries just this call, up to ``max_retries`` attempts.
+    """
+    try:
+        parsed, text, attempts = request_json_completion(url, headers, data, token, max_attempts=max_retries,
+                                                          retries=max_retries)
+    except JSONStreamError as e:
+        return f"Invalid JSON output: {e}", False, "200 OK but invalid JSON", None
+    except DeadlineExceeded:
+        return "Request exceeded its time budget.", False, "Deadline exceeded", None
+    except requests.HTTPError as e:
+        print(f"JSON mode request rejected: {e.response.text[:500]}")
+        return "ERROR", False, f"{e.response.status_code} {e.response.reason}", None
+    except requests.RequestException as e:
+        print(f"JSON mode request failed: {str(e)}")
+        return "ERROR", False, "Request failed", None
+    status = "200 OK" if attempts == 1 else f"200 OK after {attempts} attempts"
+    return text, True, status, parsed
+
 def load_prompt_options(prompt_files):
     prompt_options = {}
     for json_file in prompt_files:
         try:
-            with open(json_file, 'r') as file:
-                prompts = json.load(file)
-                prompt_options.update({prompt['name']: prompt['content'] for prompt in prompts})
+            prompts = load_file_cached(json_file) or []
+            prompt_options.update({prompt['name']: prompt['content'] for prompt in prompts})
         except Exception as e:
             print(f"Failed to load prompts from {json_file}: {str(e)}")
     return prompt_options
@@ -4,86 +4,104 @@ import os
 import logging
 from collections import OrderedDict
 import time
+import threading
+
+from .branch_utils import fork, materialize_all, resolve, store
+from .json_utils import loads, dump_file
+from .path_utils import history_file_path
+from .profile_utils import timed
+from .registry_utils import shared
+from .retention_utils import RetentionPolicy, get_retention
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 class ChatHistoryManager:
     def __init__(self, history_file="GROQ_CONTEXT.json"):
         self.history_file = self.get_history_file_path(history_file)
-        logger.debug(f"Initializing ChatHistoryManager with file: {self.history_file}")
+        self.retention = get_retention(self.history_file, RetentionPolicy.for_provider('groq'))
+        # One lock per history file for every manager and thread of the process;
+        # load-modify-save sequences hold it throughout.
+        self.lock = shared.get("history_lock", self.history_file, threading.RLock)
+        logger.debug("Initializing ChatHistoryManager with file: %s", self.history_file)
         self.ensure_valid_file()
 
     def get_history_file_path(self, filename):
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        logger.debug(f"Starting directory: {current_dir}")
-
-        while os.path.basename(current_dir) != 'apachellmpack':
-            current_dir = os.path.dirname(current_dir)
-            logger.debug(f"Moving up to: {current_dir}")
-            if current_dir == os.path.dirname(current_dir):
-                raise FileNotFoundError("Could not find 'apachellmpack' directory")
-
-        json_path = os.path.join(current_dir, 'nodes', 'groq', filename)
-        logger.debug(f"Constructed JSON path: {json_path}")
-
-        os.makedirs(os.path.dirname(json_path), exist_ok=True)
+        json_path = history_file_path('groq', filename)
+        logger.debug("Constructed JSON path: %s", json_path)
         return json_path
 
     def ensure_valid_file(self):
         if not os.path.exists(self.history_file):
-            logger.debug(f"Creating new history file: {self.history_file}")
-            with open(self.history_file, 'w') as f:
-                json.dump({}, f)
+            logger.debug("Creating new history file: %s", self.history_file)
+            dump_file(self.history_file, {})
 
+    @timed("history.load")
     def load_history(self):
         max_retries = 5
         for attempt in range(max_retries):
             try:
-                with open(self.history_file, 'r') as f:
+                with self.lock, open(self.history_file, 'rb') as f:
                     content = f.read().strip()
                     if content:
-                        return OrderedDict(json.loads(content))
+                        return OrderedDict(loads(content))
                     else:
                         logger.warning("History file is empty")
                         return OrderedDict()
             except json.JSONDecodeError as e:
-                logger.error(f"Error decoding JSON (attempt {attempt+1}/{max_retries}): {e}")
+                logger.error("Error decoding JSON (attempt %s/%s): %s", attempt + 1, max_retries, e)
                 time.sleep(0.1)  
             except Exception as e:
-                logger.error(f"Unexpected error loading history (attempt {attempt+1}/{max_retries}): {e}")
+                logger.error("Unexpected error loading history (attempt %s/%s): %s", attempt + 1, max_retries, e)
                 time.sleep(0.1)  
         logger.error("Failed to load history after multiple attempts")
         return OrderedDict()
 
+    @timed("history.save")
     def save_history(self, conversations):
-        max_retries = 5
-        for attempt in range(max_retries):
-            try:
-                with open(self.history_file, 'w') as f:
-                    json.dump(conversations, f, indent=2)
-                logger.debug(f"History saved successfully. Total conversations: {len(conversations)}")
-                return
-            except Exception as e:
-                logger.error(f"Error saving history (attempt {attempt+1}/{max_retries}): {e}")
-                time.sleep(0.1) 
-        logger.error("Failed to save history after multiple attempts")
+        with self.lock:
+            self.retention.compact(conversations)
+            max_retries = 5
+            for attempt in range(max_retries):
+                try:
+                    dump_file(self.history_file, conversations)
+                    self.retention.flush(conversations)
+                    logger.debug("History saved successfully. Total conversations: %s", len(conversations))
+                    return
+                except Exception as e:
+                    logger.error("Error saving history (attempt %s/%s): %s", attempt + 1, max_retries, e)
+                    time.sleep(0.1) 
+            logger.error("Failed to save history after multiple attempts")
 
     def create_new_conversation(self):
-        conversations = self.load_history()
-        conversation_id = str(uuid.uuid4())
-        conversations[conversation_id] = []
-        self.save_history(conversations)
-        return conversation_id
+        with self.lock:
+            conversations = self.load_history()
+            conversation_id = str(uuid.uuid4())
+            conversations[conversation_id] = []
+            self.retention.touch(conversation_id)
+            self.save_history(conversations)
+            return conversation_id
+
+    def fork_conversation(self, parent_id, at=None):
+        """New conversation sharing the first ``at`` messages (default all) of ``parent_id``."""
+        with self.lock:
+            conversations = self.load_history()
+            conversation_id = fork(conversations, parent_id, at)
+            self.retention.touch(parent_id)
+            self.retention.touch(conversation_id)
+            self.save_history(conversations)
+            return conversation_id
 
     def get_history(self, conversation_id):
+        self.retention.touch(conversation_id)
         conversations = self.load_history()
-        return conversations.get(conversation_id, [])
+        return resolve(conversations, conversation_id)
 
     def update_history(self, conversation_id, messages):
-        conversations = self.load_history()
-        conversations[conversation_id] = messages
-        self.save_history(conversations)
+        with self.lock:
+            self.retention.touch(conversation_id)
+            conversations = self.load_history()
+            store(conversations, conversation_id, messages)
+            self.save_history(conversations)
 
     def get_all_conversations(self):
-        return self.load_history()
\ No newline at end of file
+        return materialize_all(self.load_history())
\ No newline at end of file
@@ -5,6 +5,11 @@ from colorama import init, Fore, Style
 import requests
 import json
 
+from .json_utils import parse_response
+from .catalog_utils import get_catalog
+from .http_utils import get_session
+from .provider_utils import get_api_key
+
 init() 
 
 NODE_FOLDER_PATH = os.path.dirname(os.path.dirname(__file__)) # Go up two levels from your current file
@@ -23,7 +28,7 @@ def load_config(filepath):
         return None
 
 def fetch_groq_models():
-    api_key = load_config(GROQ_CONFIG_PATH)
+    api_key = get_api_key('groq')
     if not api_key:
         print(Fore.RED + "Groq API key missing or invalid, cannot fetch models." + Style.RESET_ALL)
         return []
@@ -35,25 +40,33 @@ def fetch_groq_models():
     }
 
     try:
-        response = requests.get(url, headers=headers)
+        response = get_session().get(url, headers=headers, timeout=10)
         response.raise_for_status() 
-        models_data = response.json()
+        models_data = parse_response(response)
 
         model_ids = []
         if isinstance(models_data, dict) and 'data' in models_data and isinstance(models_data['data'], list):
             for model in models_data['data']:
                 if 'id' in model:
                     model_ids.append(model['id'])
+            # Keep the full metadata (context window, limits, active flag) in the catalog.
+            get_catalog('groq').update_from_api(models_data['data'])
         else:
             print(Fore.YELLOW + "Unexpected Groq model API response format. Cannot extract model names." + Style.RESET_ALL)
-            return []
+            return _cached_model_ids()
 
         #print(Fore.GREEN + f"{model_ids}" + Style.RESET_ALL)
         return model_ids
 
     except requests.exceptions.RequestException as e:
         print(Fore.RED + f"Error fetching Groq models from API. Check your API key and connection. Error: {e}" + Style.RESET_ALL)
-        return []
+        return _cached_model_ids()
     except json.JSONDecodeError as e:
         print(Fore.RED + f"Error decoding JSON response from Groq API: {e}. Check API response format. Error: {e}" + Style.RESET_ALL)
-        return []
\ No newline at end of file
+        return _cached_model_ids()
+
+def _cached_model_ids():
+    model_ids = get_catalog('groq').model_ids()
+    if model_ids:
+        print(Fore.YELLOW + f"Using {len(model_ids)} Groq models from the local model catalog." + Style.RESET_ALL)
+    return model_ids
\ No newline at end of file
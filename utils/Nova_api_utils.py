@@ -1,77 +1,65 @@
 import requests
 import json
-import time
 import logging
-from typing import Dict, Any, Generator, Tuple
+from typing import Dict, Any, Generator, Optional, Tuple
+
+from .cancel_utils import CancelToken, DeadlineExceeded
+from .retry_utils import post_json_with_retry
+from .json_utils import parse_response
+from .stream_utils import stream_completion
+from .usage_utils import note_usage
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def make_api_request(data: Dict[str, Any], headers: Dict[str, str], url: str, max_retries: int) -> Tuple[Any, bool, str]:
-    for attempt in range(max_retries):
+def make_api_request(data: Dict[str, Any], headers: Dict[str, str], url: str, max_retries: int,
+                     token: Optional[CancelToken] = None) -> Tuple[Any, bool, str]:
+    token = token or CancelToken()
+    try:
+        return _make_api_request(data, headers, url, max_retries, token)
+    except DeadlineExceeded:
+        logger.error("Request exceeded its time budget.")
+        return "Request exceeded its time budget.", False, "Deadline exceeded"
+
+def _make_api_request(data: Dict[str, Any], headers: Dict[str, str], url: str, max_retries: int,
+                      token: CancelToken) -> Tuple[Any, bool, str]:
+    try:
+        # 408/429/5xx and connection failures are retried with backoff, honouring Retry-After.
+        response = post_json_with_retry(url, headers, data, max_retries, token=token, timeout=(10, 30))
+    except requests.RequestException as e:
+        logger.error("Request failed: %s", e)
+        logger.error("Failed after all retries.")
+        return "Failed after all retries.", False, "Failed after all retries"
+
+    logger.debug("Response status: %s", response.status_code)
+
+    if response.status_code == 200:
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            logger.info(f"Response status: {response.status_code}")
-            logger.debug(f"Response headers: {response.headers}")
-            logger.debug(f"Response body: {response.text}")
-            
-            if response.status_code == 200:
-                try:
-                    response_json = response.json()
-                    if 'choices' in response_json and response_json['choices']:
-                        return response_json, True, "200 OK"
-                    else:
-                        logger.warning("No valid response content found.")
-                        return "No valid response content found.", False, "200 OK but no content"
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error parsing JSON response: {str(e)}")
-                    return "Error parsing JSON response.", False, "200 OK but failed to parse JSON"
-            elif response.status_code == 429:
-                logger.warning("Rate limit exceeded. Retrying after delay.")
-                retry_after = int(response.headers.get('Retry-After', 5))
-                time.sleep(retry_after)
+            response_json = parse_response(response)
+            note_usage(response_json.get('usage'))
+            if 'choices' in response_json and response_json['choices']:
+                return response_json, True, "200 OK"
             else:
-                logger.error(f"Request failed with status code {response.status_code}")
-                return response.text, False, f"{response.status_code} {response.reason}"
-        except requests.RequestException as e:
-            logger.error(f"Request failed on attempt {attempt + 1}: {str(e)}")
-        
-        if attempt < max_retries - 1:
-            time.sleep(2 ** attempt) 
-    
-    logger.error("Failed after all retries.")
-    return "Failed after all retries.", False, "Failed after all retries"
+                logger.warning("No valid response content found.")
+                return "No valid response content found.", False, "200 OK but no content"
+        except json.JSONDecodeError as e:
+            logger.error("Error parsing JSON response: %s", e)
+            return "Error parsing JSON response.", False, "200 OK but failed to parse JSON"
+    logger.error("Request failed with status code %s", response.status_code)
+    return response.text, False, f"{response.status_code} {response.reason}"
 
-def make_streaming_request(data: Dict[str, Any], headers: Dict[str, str], url: str) -> Generator[str, None, None]:
+def make_streaming_request(data: Dict[str, Any], headers: Dict[str, str], url: str,
+                           token: Optional[CancelToken] = None, max_retries: int = 1) -> Generator[str, None, None]:
+    token = token or CancelToken()
     try:
-        with requests.post(url, headers=headers, json=data, stream=True) as response:
-            if response.status_code == 200:
-                for line in response.iter_lines():
-                    if line:
-                        line = line.decode('utf-8')
-                        if line.startswith("data: "):
-                            if line.strip() == "data: [DONE]":
-                                logger.debug("Received end of stream")
-                                break
-                            try:
-                                json_str = line[len("data: "):]
-                                parsed_line = json.loads(json_str)
-                                if 'choices' in parsed_line and parsed_line['choices']:
-                                    content = parsed_line['choices'][0]['delta'].get('content', '')
-                                    if content:
-                                        yield content
-                                else:
-                                    logger.warning(f"Unexpected response format: {parsed_line}")
-                            except json.JSONDecodeError:
-                                logger.error(f"Failed to parse JSON: {json_str}")
-                        else:
-                            logger.warning(f"Unexpected line format: {line}")
-                    else:
-                        logger.debug("Received empty line in streaming response")
-            else:
-                error_message = f"Streaming request failed with status code {response.status_code}"
-                logger.error(error_message)
-                yield f"Error: {error_message}"
+        yield from stream_completion(url, headers, data, token, max_attempts=max_retries)
+    except DeadlineExceeded:
+        error_message = "Streaming request exceeded its time budget"
+        logger.error(error_message)
+        yield f"Error: {error_message}"
+    except requests.HTTPError as e:
+        error_message = f"Streaming request failed with status code {e.response.status_code}"
+        logger.error(error_message)
+        yield f"Error: {error_message}"
     except requests.RequestException as e:
         error_message = f"Streaming request failed: {str(e)}"
         logger.error(error_message)
@@ -87,10 +75,10 @@ def validate_api_key(api_key: str, base_url: str) -> bool:
         if response.status_code == 200:
             return True
         else:
-            logger.error(f"API key validation failed. Status code: {response.status_code}")
+            logger.error("API key validation failed. Status code: %s", response.status_code)
             return False
     except requests.RequestException as e:
-        logger.error(f"API key validation request failed: {str(e)}")
+        logger.error("API key validation request failed: %s", e)
         return False
 
 def fine_tune_model(api_key: str, base_url: str, model: str, training_data: str, hyperparameters: Dict[str, Any]) -> str:
@@ -109,8 +97,8 @@ def fine_tune_model(api_key: str, base_url: str, model: str, training_data: str,
             fine_tune_data = response.json()
             return fine_tune_data['id']
         else:
-            logger.error(f"Failed to start fine-tuning. Status code: {response.status_code}")
+            logger.error("Failed to start fine-tuning. Status code: %s", response.status_code)
             return ""
     except requests.RequestException as e:
-        logger.error(f"Request to start fine-tuning failed: {str(e)}")
+        logger.error("Request to start fine-tuning failed: %s", e)
         return ""
\ No newline at end of file
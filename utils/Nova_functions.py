@@ -1,9 +1,12 @@
 import json
 import logging
-from typing import Dict, Any, List, Optional
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional, Tuple
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def get_available_functions() -> Dict[str, Dict[str, Any]]:
@@ -42,6 +45,17 @@ def get_available_functions() -> Dict[str, Dict[str, Any]]:
         },
     }
 
+# Functions without side effects whose results may be cached and reused.
+IDEMPOTENT_FUNCTIONS = {"get_current_weather", "get_stock_price"}
+
+def get_tool_definitions(enabled: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Returns the available functions in the OpenAI compatible ``tools`` format.
+    """
+    functions = get_available_functions()
+    names = enabled or list(functions.keys())
+    return [{"type": "function", "function": functions[name]} for name in names if name in functions]
+
 def call_function(function_name: str, arguments: Dict[str, Any]) -> str:
     """
     Calls the specified function with the given arguments.
@@ -58,7 +72,7 @@ def call_function(function_name: str, arguments: Dict[str, Any]) -> str:
         else:
             return f"Error: Function '{function_name}' is not implemented."
     except Exception as e:
-        logger.error(f"Error calling function '{function_name}': {str(e)}")
+        logger.error("Error calling function '%s': %s", function_name, e)
         return f"Error: Failed to call function '{function_name}'."
 
 def get_current_weather(location: str, unit: str = "celsius") -> str:
@@ -107,9 +121,11 @@ def parse_function_call(function_call: Dict[str, Any]) -> Optional[Dict[str, Any
         logger.error("Invalid function call object")
         return None
 
+    arguments = function_call['arguments']
     try:
-        arguments = json.loads(function_call['arguments'])
-    except json.JSONDecodeError:
+        if not isinstance(arguments, dict):
+            arguments = json.loads(arguments or "{}")
+    except (json.JSONDecodeError, TypeError):
         logger.error("Failed to parse function arguments")
         return None
 
@@ -126,4 +142,93 @@ def execute_function_call(function_call: Dict[str, Any]) -> str:
     if parsed_call is None:
         return "Error: Failed to parse function call"
 
-    return call_function(parsed_call['name'], parsed_call['arguments'])
\ No newline at end of file
+    return call_function(parsed_call['name'], parsed_call['arguments'])
+
+class ToolResultCache:
+    """
+    Bounded LRU cache of results for idempotent tools, keyed by name and arguments.
+    """
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(name: str, arguments: Dict[str, Any]) -> Tuple[str, str]:
+        return name, json.dumps(arguments, sort_keys=True)
+
+    def get(self, name: str, arguments: Dict[str, Any]) -> Optional[str]:
+        key = self.key(name, arguments)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def put(self, name: str, arguments: Dict[str, Any], result: str) -> None:
+        key = self.key(name, arguments)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+tool_result_cache = ToolResultCache()
+
+def _run_tool_call(parsed_call: Dict[str, Any], cache: Optional[ToolResultCache]) -> str:
+    name, arguments = parsed_call['name'], parsed_call['arguments']
+    cacheable = cache is not None and name in IDEMPOTENT_FUNCTIONS
+    if cacheable:
+        cached = cache.get(name, arguments)
+        if cached is not None:
+            logger.debug("Tool cache hit for %s", name)
+            return cached
+    result = call_function(name, arguments)
+    if cacheable and not result.startswith("Error:"):
+        cache.put(name, arguments, result)
+    return result
+
+def execute_tool_calls(tool_calls: List[Dict[str, Any]], timeout: float = 30.0,
+                       cache: Optional[ToolResultCache] = tool_result_cache) -> List[str]:
+    """
+    Executes all ``tool_calls`` from one model turn concurrently.
+
+    Every call gets the same ``timeout`` measured from the start of the batch, so
+    the batch takes as long as the slowest tool, never the sum. Results are
+    returned in the order of ``tool_calls``; failures and timeouts become
+    "Error: ..." strings the model can read.
+    """
+    results: List[Optional[str]] = [None] * len(tool_calls)
+    pending = []
+    for index, tool_call in enumerate(tool_calls):
+        parsed_call = parse_function_call(tool_call.get('function', tool_call))
+        if parsed_call is None:
+            results[index] = "Error: Failed to parse function call"
+        else:
+            pending.append((index, parsed_call))
+    if not pending:
+        return results
+
+    executor = ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="apachellmpack-tool")
+    try:
+        deadline = time.monotonic() + timeout
+        futures = [(index, call, executor.submit(_run_tool_call, call, cache)) for index, call in pending]
+        for index, call, future in futures:
+            try:
+                results[index] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                logger.warning("Tool '%s' timed out after %ss", call['name'], timeout)
+                results[index] = f"Error: Function '{call['name']}' timed out after {timeout} seconds."
+            except Exception as e:
+                logger.error("Tool '%s' failed: %s", call['name'], e)
+                results[index] = f"Error: Failed to call function '{call['name']}'."
+    finally:
+        # Do not wait for tools that timed out.
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
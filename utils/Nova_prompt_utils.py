@@ -3,32 +3,32 @@ import os
 import logging
 from typing import Dict, List, Optional, Any
 
-logging.basicConfig(level=logging.INFO)
+from .json_utils import load_file_cached
+
 logger = logging.getLogger(__name__)
 
 def load_prompt_options(prompt_files: List[str]) -> Dict[str, str]:
     prompt_options = {}
     for json_file in prompt_files:
         try:
-            with open(json_file, 'r') as file:
-                prompts = json.load(file)
-                for prompt in prompts:
-                    if isinstance(prompt, dict) and 'name' in prompt and 'content' in prompt:
-                        prompt_options[prompt['name']] = prompt['content']
-                    else:
-                        logger.warning(f"Skipping invalid prompt in {json_file}")
+            prompts = load_file_cached(json_file) or []
+            for prompt in prompts:
+                if isinstance(prompt, dict) and 'name' in prompt and 'content' in prompt:
+                    prompt_options[prompt['name']] = prompt['content']
+                else:
+                    logger.warning("Skipping invalid prompt in %s", json_file)
         except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON in {json_file}: {str(e)}")
+            logger.error("Failed to parse JSON in %s: %s", json_file, e)
         except IOError as e:
-            logger.error(f"Failed to read file {json_file}: {str(e)}")
+            logger.error("Failed to read file %s: %s", json_file, e)
         except Exception as e:
-            logger.error(f"Unexpected error loading prompts from {json_file}: {str(e)}")
+            logger.error("Unexpected error loading prompts from %s: %s", json_file, e)
     return prompt_options
 
 def get_prompt_content(prompt_options: Dict[str, str], prompt_name: str) -> str:
     content = prompt_options.get(prompt_name)
     if content is None:
-        logger.warning(f"No content found for prompt: {prompt_name}")
+        logger.warning("No content found for prompt: %s", prompt_name)
         return "No content found for selected prompt"
     return content
 
@@ -50,10 +50,10 @@ def save_prompt(prompt_file: str, prompt_name: str, prompt_content: str) -> bool
         
         with open(prompt_file, 'w') as file:
             json.dump(prompts, file, indent=2)
-        logger.info(f"Saved prompt '{prompt_name}' to {prompt_file}")
+        logger.info("Saved prompt '%s' to %s", prompt_name, prompt_file)
         return True
     except Exception as e:
-        logger.error(f"Failed to save prompt '{prompt_name}' to {prompt_file}: {str(e)}")
+        logger.error("Failed to save prompt '%s' to %s: %s", prompt_name, prompt_file, e)
         return False
 
 def delete_prompt(prompt_file: str, prompt_name: str) -> bool:
@@ -66,13 +66,13 @@ def delete_prompt(prompt_file: str, prompt_name: str) -> bool:
             
             with open(prompt_file, 'w') as file:
                 json.dump(prompts, file, indent=2)
-            logger.info(f"Deleted prompt '{prompt_name}' from {prompt_file}")
+            logger.info("Deleted prompt '%s' from %s", prompt_name, prompt_file)
             return True
         else:
-            logger.warning(f"Prompt file {prompt_file} does not exist")
+            logger.warning("Prompt file %s does not exist", prompt_file)
             return False
     except Exception as e:
-        logger.error(f"Failed to delete prompt '{prompt_name}' from {prompt_file}: {str(e)}")
+        logger.error("Failed to delete prompt '%s' from %s: %s", prompt_name, prompt_file, e)
         return False
 
 def get_available_prompts(prompt_files: List[str]) -> List[str]:
@@ -0,0 +1,300 @@
+"""Compressed conversation archive with an mmap-able offset index.
+
+File layout (little endian)::
+
+    header   32 bytes  magic, codec, entry count, index offset, ids offset
+    blocks   one compressed JSON record per conversation
+    index    count * 32 bytes, sorted by key: key digest, block offset,
+             block length, offset of the id in the ids table
+    ids      u16 length + UTF-8 conversation id, per entry
+
+Looking up a conversation is a binary search over the fixed-size index
+entries straight from the memory map, followed by decompressing that one
+block. Appends write new blocks and a fresh index after the current end of
+file and only then rewrite the header, so a crash mid-append leaves the
+previous archive readable. Earlier indexes and replaced blocks become dead
+bytes; once they make up ``COMPACT_RATIO`` of the file, the live blocks are
+copied (still compressed) to a new file that replaces the old one.
+"""
+import os
+import mmap
+import logging
+import zlib
+import struct
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from .branch_utils import materialize_all
+    from .json_utils import dumps_bytes, loads
+except ImportError:
+    # Imported standalone by the scripts in tools/.
+    from branch_utils import materialize_all
+    from json_utils import dumps_bytes, loads
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LLMARC1\0"
+HEADER = struct.Struct("<8sB3xIQQ")
+ENTRY = struct.Struct("<16sQII")
+ID_LENGTH = struct.Struct("<H")
+
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+CODECS = {"zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+DEFAULT_CODEC = "zstd" if zstandard is not None else "zlib"
+
+# Compact after an append once this share of the file is dead bytes...
+COMPACT_RATIO = 0.5
+# ...and the file is at least this large.
+COMPACT_MIN_BYTES = 256 * 1024
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def _key(conversation_id: str) -> bytes:
+    return hashlib.blake2b(conversation_id.encode("utf-8"), digest_size=16).digest()
+
+
+def _compressor(codec: int, level: Optional[int]):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ArchiveError("zstd archives need the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=level if level is not None else 6).compress
+    return lambda data: zlib.compress(data, level if level is not None else 6)
+
+
+def _decompressor(codec: int):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ArchiveError("zstd archives need the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompress
+    if codec == CODEC_ZLIB:
+        return zlib.decompress
+    raise ArchiveError(f"Unknown archive codec {codec}")
+
+
+class ConversationArchive:
+    """Reader/appender for one archive file.
+
+    Records are JSON objects with an ``"id"`` key; appending a record with an
+    existing id replaces the indexed copy.
+    """
+
+    def __init__(self, path: str, codec: str = DEFAULT_CODEC, level: Optional[int] = None):
+        if codec not in CODECS:
+            raise ArchiveError(f"Unknown codec '{codec}'. Expected one of {list(CODECS)}")
+        self.path = path
+        self.codec = CODECS[codec]
+        self.level = level
+        self._lock = threading.Lock()
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._count = 0
+        self._index_offset = 0
+        self._ids_offset = 0
+        self._open()
+
+    # -- reading -----------------------------------------------------------
+
+    def _open(self) -> None:
+        self.close()
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER.size:
+            self._count = 0
+            return
+        self._file = open(self.path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, codec, count, index_offset, ids_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ArchiveError(f"{self.path} is not a conversation archive")
+        # An existing archive keeps its codec.
+        self.codec = codec
+        self._count, self._index_offset, self._ids_offset = count, index_offset, ids_offset
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _entry(self, i: int) -> Tuple[bytes, int, int, int]:
+        return ENTRY.unpack_from(self._map, self._index_offset + i * ENTRY.size)
+
+    def _find(self, conversation_id: str) -> Optional[Tuple[bytes, int, int, int]]:
+        key = _key(conversation_id)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._entry(mid)
+            if entry[0] < key:
+                lo = mid + 1
+            elif entry[0] > key:
+                hi = mid
+            else:
+                return entry
+        return None
+
+    def __contains__(self, conversation_id: str) -> bool:
+        with self._lock:
+            return self._map is not None and self._find(conversation_id) is not None
+
+    def _read_block(self, offset: int, length: int) -> Dict[str, Any]:
+        return loads(_decompressor(self.codec)(self._map[offset:offset + length]))
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """The record for ``conversation_id``; only its own block is decompressed."""
+        with self._lock:
+            if self._map is None:
+                return None
+            entry = self._find(conversation_id)
+            if entry is None:
+                return None
+            return self._read_block(entry[1], entry[2])
+
+    def _id_at(self, offset: int) -> str:
+        (length,) = ID_LENGTH.unpack_from(self._map, offset)
+        start = offset + ID_LENGTH.size
+        return self._map[start:start + length].decode("utf-8")
+
+    def ids(self) -> List[str]:
+        """Conversation ids in block (write) order."""
+        with self._lock:
+            if self._map is None:
+                return []
+            entries = sorted((self._entry(i) for i in range(self._count)), key=lambda e: e[1])
+            return [self._id_at(self._ids_offset + e[3]) for e in entries]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for conversation_id in self.ids():
+            record = self.get(conversation_id)
+            if record is not None:
+                yield record
+
+    # -- writing -----------------------------------------------------------
+
+    def _live_index(self) -> Dict[str, Tuple[int, int]]:
+        index: Dict[str, Tuple[int, int]] = {}
+        if self._map is not None:
+            for i in range(self._count):
+                entry = self._entry(i)
+                index[self._id_at(self._ids_offset + entry[3])] = (entry[1], entry[2])
+        return index
+
+    def _write_index(self, f, index: Dict[str, Tuple[int, int]]) -> int:
+        """Write index and ids at the current position, then the header; returns the file size."""
+        entries = sorted(((_key(cid), cid, pos) for cid, pos in index.items()), key=lambda e: e[0])
+        ids_table = bytearray()
+        index_bytes = bytearray()
+        for key, conversation_id, (offset, length) in entries:
+            encoded = conversation_id.encode("utf-8")
+            index_bytes += ENTRY.pack(key, offset, length, len(ids_table))
+            ids_table += ID_LENGTH.pack(len(encoded)) + encoded
+        index_offset = f.tell()
+        f.write(index_bytes)
+        ids_offset = f.tell()
+        f.write(ids_table)
+        size = f.tell()
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, self.codec, len(entries), index_offset, ids_offset))
+        f.flush()
+        return size
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Compress and add ``records``; returns how many were written."""
+        compress = _compressor(self.codec, self.level)
+        with self._lock:
+            index = self._live_index()
+            self.close()
+
+            written = 0
+            with open(self.path, "r+b" if os.path.exists(self.path) else "w+b") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() < HEADER.size:
+                    f.seek(0)
+                    f.write(HEADER.pack(MAGIC, self.codec, 0, 0, 0))
+                for record in records:
+                    block = compress(dumps_bytes(record))
+                    index[record["id"]] = (f.tell(), len(block))
+                    f.write(block)
+                    written += 1
+                size = self._write_index(f, index)
+            dead = size - HEADER.size - sum(length for _, length in index.values()) \
+                - len(index) * ENTRY.size - sum(ID_LENGTH.size + len(c.encode("utf-8")) for c in index)
+            if size >= COMPACT_MIN_BYTES and dead >= size * COMPACT_RATIO:
+                self._compact(index)
+            self._open()
+        return written
+
+    def compact(self) -> None:
+        """Rewrite the archive with only its live blocks."""
+        with self._lock:
+            if self._map is None:
+                return
+            index = self._live_index()
+            self.close()
+            self._compact(index)
+            self._open()
+
+    def _compact(self, index: Dict[str, Tuple[int, int]]) -> None:
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(self.path, "rb") as source, open(tmp_path, "w+b") as target:
+                target.write(HEADER.pack(MAGIC, self.codec, 0, 0, 0))
+                moved: Dict[str, Tuple[int, int]] = {}
+                # Blocks keep their write order, which ids() reports.
+                for conversation_id, (offset, length) in sorted(index.items(), key=lambda item: item[1][0]):
+                    source.seek(offset)
+                    moved[conversation_id] = (target.tell(), length)
+                    target.write(source.read(length))
+                self._write_index(target, moved)
+                os.fsync(target.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # E.g. another process still maps the file on Windows; the
+            # uncompacted archive stays valid.
+            logger.warning("Could not compact %s: %s", self.path, e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def pack_history(conversations: Dict[str, Any], path: str,
+                 codec: str = DEFAULT_CODEC, level: Optional[int] = None) -> int:
+    """Write a history file's conversations to a new archive at ``path``.
+
+    Forks (``{"parent", "at", "messages"}`` records) are stored resolved,
+    like the ones retention archives, so every record stands alone.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    with ConversationArchive(path, codec=codec, level=level) as archive:
+        return archive.append({"id": cid, "messages": messages} for cid, messages in materialize_all(conversations).items())
+
+
+def unpack_history(path: str) -> Dict[str, List[Dict[str, str]]]:
+    """Read an archive back into the ``{conversation_id: messages}`` history layout."""
+    with ConversationArchive(path) as archive:
+        return {record["id"]: record.get("messages", []) for record in archive}
@@ -0,0 +1,117 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from .cancel_utils import POLL_INTERVAL, CancelToken, background_execution
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 8
+# Finished handles are kept this long (and at most MAX_HANDLES of them), so an
+# Await node that re-runs while its Submit node is cached still finds them.
+HANDLE_TTL = 60 * 60
+MAX_HANDLES = 256
+
+
+class LLMJobs:
+    """Background executor for LLM node calls, addressed by string handles.
+
+    The handle is what flows between the Submit and Await nodes; the future
+    itself stays here, so the value passed through the graph is a small dict.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="apachellmpack-llm")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _run(self, fn: Callable[[], Any]) -> Any:
+        with background_execution():
+            return fn()
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for handle_id, job in list(self._jobs.items()):
+            expired = now - job["submitted_at"] > HANDLE_TTL
+            if (expired or len(self._jobs) > MAX_HANDLES) and job["future"].done():
+                del self._jobs[handle_id]
+
+    def submit(self, fn: Callable[[], Any], description: str = "") -> Dict[str, Any]:
+        """Start ``fn`` on a worker thread; returns the handle."""
+        handle = {"id": uuid.uuid4().hex, "description": description}
+        future = self._executor.submit(self._run, fn)
+        with self._lock:
+            self._prune()
+            self._jobs[handle["id"]] = {"future": future, "submitted_at": time.monotonic()}
+        logger.debug("Submitted %s as %s", description, handle["id"])
+        return handle
+
+    def future(self, handle: Dict[str, Any]) -> Future:
+        with self._lock:
+            job = self._jobs.get(handle.get("id") if isinstance(handle, dict) else None)
+        if job is None:
+            raise KeyError(f"Unknown or expired LLM handle {handle!r}; run its Submit node again.")
+        return job["future"]
+
+    def wait(self, handle: Dict[str, Any], token: Optional[CancelToken] = None) -> Any:
+        """Block until the job finishes; interruptible through ``token``."""
+        token = token or CancelToken()
+        future = self.future(handle)
+        while True:
+            token.raise_if_cancelled()
+            try:
+                return future.result(timeout=token.cap(POLL_INTERVAL))
+            except FutureTimeout:
+                continue
+
+
+llm_jobs = LLMJobs()
+
+
+_EXHAUSTED = object()
+
+
+def imap_bounded(fn: Callable[[Any], Any], items: Iterable[Any], concurrency: int,
+                 token: Optional[CancelToken] = None) -> Iterator[Tuple[int, Any]]:
+    """Yield ``(index, fn(item))`` as calls finish, at most ``concurrency`` at a time.
+
+    ``items`` is pulled only when a slot frees up, so a lazy generator of
+    requests is never expanded further than the window. Exceptions from
+    ``fn`` propagate; a cancelled ``token`` or an abandoned iterator stops
+    pulling and cancels the pending calls.
+    """
+    token = token or CancelToken()
+    items = iter(items)
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="apachellmpack-sweep")
+    in_flight: Dict[Future, int] = {}
+    index = 0
+
+    def run(item: Any) -> Any:
+        with background_execution():
+            return fn(item)
+
+    try:
+        while True:
+            while len(in_flight) < max(1, concurrency):
+                token.raise_if_cancelled()
+                item = next(items, _EXHAUSTED)
+                if item is _EXHAUSTED:
+                    break
+                in_flight[executor.submit(run, item)] = index
+                index += 1
+            if not in_flight:
+                return
+            token.raise_if_cancelled()
+            done, _ = wait(list(in_flight), timeout=token.cap(POLL_INTERVAL), return_when=FIRST_COMPLETED)
+            for future in done:
+                yield in_flight.pop(future), future.result()
+    except BaseException:
+        token.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
@@ -0,0 +1,256 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .cancel_utils import CancelToken
+from .http_utils import request as http_request
+from .json_utils import dump_file, dumps_bytes, load_file, loads, parse_response
+from .provider_utils import PROVIDERS, get_api_key, get_base_url, get_provider
+from .retry_utils import idempotency_headers, retry_call
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+DEFAULT_POLL_INTERVAL = 30.0
+DOWNLOAD_CHUNK = 64 * 1024
+MAX_RETRIES = 4
+
+BATCH_PROVIDERS = [name for name, spec in PROVIDERS.items() if spec.get("supports_batch")]
+
+
+class BatchError(RuntimeError):
+    pass
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name.strip()) or "batch"
+
+
+def custom_id(index: int) -> str:
+    return f"req-{index:06d}"
+
+
+def fingerprint(payloads: Iterable[Dict[str, Any]]) -> str:
+    digest = hashlib.sha256()
+    for payload in payloads:
+        digest.update(dumps_bytes(payload))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def write_batch_input(path: str, payloads: Iterable[Dict[str, Any]], endpoint: str = BATCH_ENDPOINT) -> int:
+    """Write chat completion payloads as a batch input JSONL file."""
+    count = 0
+    with open(path, "wb") as f:
+        for index, payload in enumerate(payloads):
+            f.write(dumps_bytes({"custom_id": custom_id(index), "method": "POST", "url": endpoint, "body": payload}))
+            f.write(b"\n")
+            count += 1
+    return count
+
+
+def iter_batch_output(path: str) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+    """Yield ``(custom_id, text, error)`` for each line of a batch output/error file."""
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = loads(line)
+            response = record.get("response") or {}
+            body = response.get("body") or {}
+            error = record.get("error")
+            choices = body.get("choices") if isinstance(body, dict) else None
+            if choices and response.get("status_code", 200) == 200:
+                yield record.get("custom_id"), choices[0]["message"]["content"], None
+            else:
+                message = error or (body.get("error") if isinstance(body, dict) else None) or f"HTTP {response.get('status_code')}"
+                if isinstance(message, dict):
+                    message = message.get("message", str(message))
+                yield record.get("custom_id"), None, str(message)
+
+
+class BatchClient:
+    """Files + batches endpoints of an OpenAI compatible provider."""
+
+    def __init__(self, provider: str, base_url: str = "", api_key: str = ""):
+        if not get_provider(provider).get("supports_batch"):
+            raise BatchError(f"Provider '{provider}' has no batch API. Batch capable: {BATCH_PROVIDERS}")
+        self.provider = provider
+        self.base_url = (base_url or get_base_url(provider)).rstrip("/")
+        self.headers = {"Authorization": f"Bearer {api_key or get_api_key(provider)}"}
+
+    def _call(self, method: str, path: str, token: Optional[CancelToken] = None, idempotent: bool = True,
+              rewind=None, **kwargs):
+        """Send one request, retrying transient failures.
+
+        POSTs that create something pass ``idempotent=False``: they carry an
+        ``Idempotency-Key`` and are only resent when the provider cannot have
+        processed them. ``rewind`` is called before each attempt (file uploads).
+        """
+        headers = kwargs.pop("headers", self.headers)
+        if not idempotent:
+            headers = idempotency_headers(headers)
+
+        def send():
+            if rewind:
+                rewind()
+            return http_request(method, f"{self.base_url}{path}", token=token, headers=headers, **kwargs)
+
+        response = retry_call(send, MAX_RETRIES, token, idempotent=idempotent, description=f"{method} {path}")
+        if response.status_code >= 400:
+            raise BatchError(f"{method} {path} failed: {response.status_code} {response.text[:500]}")
+        return response
+
+    def upload(self, path: str, token: Optional[CancelToken] = None) -> str:
+        with open(path, "rb") as f:
+            response = self._call("POST", "/files", token, idempotent=False, rewind=lambda: f.seek(0),
+                                  data={"purpose": "batch"},
+                                  files={"file": (os.path.basename(path), f, "application/jsonl")})
+        return parse_response(response)["id"]
+
+    def create(self, input_file_id: str, completion_window: str = "24h", token: Optional[CancelToken] = None) -> Dict[str, Any]:
+        body = {"input_file_id": input_file_id, "endpoint": BATCH_ENDPOINT, "completion_window": completion_window}
+        return parse_response(self._call("POST", "/batches", token, idempotent=False, data=dumps_bytes(body),
+                                         headers=dict(self.headers, **{"Content-Type": "application/json"})))
+
+    def get(self, batch_id: str, token: Optional[CancelToken] = None) -> Dict[str, Any]:
+        return parse_response(self._call("GET", f"/batches/{batch_id}", token))
+
+    def cancel(self, batch_id: str, token: Optional[CancelToken] = None) -> Dict[str, Any]:
+        return parse_response(self._call("POST", f"/batches/{batch_id}/cancel", token))
+
+    def download(self, file_id: str, path: str, token: Optional[CancelToken] = None) -> int:
+        """Stream a result file to ``path`` without holding it in memory."""
+        response = self._call("GET", f"/files/{file_id}/content", token, stream=True)
+        size = 0
+        tmp_path = path + ".part"
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                    f.write(chunk)
+                    size += len(chunk)
+        finally:
+            response.close()
+        os.replace(tmp_path, path)
+        return size
+
+
+class BatchJob:
+    """A named batch job whose progress is persisted, so it resumes after a restart.
+
+    State lives in ``<jobs_dir>/<name>.json``; the input JSONL and the result
+    files sit next to it unless ``output_dir`` says otherwise. Each step
+    (write input, upload, create, poll, download) is recorded before the next
+    one starts, and ``run`` continues from the last recorded step.
+    """
+
+    def __init__(self, name: str, provider: str, jobs_dir: str, output_dir: str = "",
+                 base_url: str = "", api_key: str = ""):
+        self.name = _safe_name(name)
+        self.provider = provider
+        self.jobs_dir = jobs_dir
+        self.output_dir = output_dir or jobs_dir
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.state_path = os.path.join(self.jobs_dir, f"{self.name}.json")
+        self.client = BatchClient(provider, base_url, api_key)
+        self._lock = threading.Lock()
+        self.state: Dict[str, Any] = self._load() or {"name": self.name, "provider": provider, "status": "new"}
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.state_path):
+            return None
+        try:
+            return load_file(self.state_path)
+        except Exception as e:
+            raise BatchError(f"Could not read batch job state {self.state_path}: {e}")
+
+    def _save(self, **changes) -> None:
+        with self._lock:
+            self.state.update(changes, updated_at=time.time())
+            tmp_path = self.state_path + ".tmp"
+            dump_file(tmp_path, self.state, pretty=True)
+            os.replace(tmp_path, self.state_path)
+
+    @property
+    def input_path(self) -> str:
+        return os.path.join(self.jobs_dir, f"{self.name}.input.jsonl")
+
+    @property
+    def output_path(self) -> str:
+        return os.path.join(self.output_dir, f"{self.name}.output.jsonl")
+
+    @property
+    def error_path(self) -> str:
+        return os.path.join(self.output_dir, f"{self.name}.errors.jsonl")
+
+    @property
+    def done(self) -> bool:
+        return self.state.get("status") in TERMINAL_STATUSES and self.state.get("downloaded", False)
+
+    def submit(self, payloads: Optional[List[Dict[str, Any]]] = None, completion_window: str = "24h",
+               token: Optional[CancelToken] = None) -> str:
+        """Write, upload and create the batch unless an earlier run already did."""
+        if "request_count" not in self.state:
+            if payloads is None:
+                raise BatchError(f"Batch job '{self.name}' has no saved requests to resume")
+            count = write_batch_input(self.input_path, payloads)
+            self._save(request_count=count, fingerprint=fingerprint(payloads), status="written")
+        if "input_file_id" not in self.state:
+            self._save(input_file_id=self.client.upload(self.input_path, token), status="uploaded")
+            logger.info("Batch %s: uploaded %d requests", self.name, self.state["request_count"])
+        if "batch_id" not in self.state:
+            batch = self.client.create(self.state["input_file_id"], completion_window, token)
+            self._save(batch_id=batch["id"], status=batch.get("status", "validating"))
+            logger.info("Batch %s: created %s", self.name, batch["id"])
+        return self.state["batch_id"]
+
+    def poll(self, token: Optional[CancelToken] = None) -> str:
+        batch = self.client.get(self.state["batch_id"], token)
+        status = batch.get("status", "unknown")
+        if status != self.state.get("status") or batch.get("request_counts") != self.state.get("request_counts"):
+            self._save(status=status, request_counts=batch.get("request_counts"),
+                       output_file_id=batch.get("output_file_id"), error_file_id=batch.get("error_file_id"))
+            logger.info("Batch %s: %s %s", self.name, status, batch.get("request_counts") or "")
+        return status
+
+    def fetch_results(self, token: Optional[CancelToken] = None) -> None:
+        if self.state.get("output_file_id"):
+            self.client.download(self.state["output_file_id"], self.output_path, token)
+        if self.state.get("error_file_id"):
+            self.client.download(self.state["error_file_id"], self.error_path, token)
+        self._save(downloaded=True)
+
+    def results(self) -> List[Dict[str, Any]]:
+        """Results in request order: ``{"custom_id", "text", "error"}``."""
+        by_id: Dict[str, Dict[str, Any]] = {}
+        for path in (self.output_path, self.error_path):
+            if os.path.exists(path):
+                for cid, text, error in iter_batch_output(path):
+                    by_id[cid] = {"custom_id": cid, "text": text, "error": error}
+        return [by_id.get(custom_id(i), {"custom_id": custom_id(i), "text": None, "error": "missing from batch output"})
+                for i in range(self.state.get("request_count", 0))]
+
+    def run(self, payloads: Optional[List[Dict[str, Any]]] = None, completion_window: str = "24h",
+            wait: bool = True, poll_interval: float = DEFAULT_POLL_INTERVAL,
+            token: Optional[CancelToken] = None) -> str:
+        """Submit (or resume) and optionally wait; returns the batch status."""
+        token = token or CancelToken()
+        saved = self.state.get("fingerprint")
+        if payloads is not None and saved and saved != fingerprint(payloads):
+            raise BatchError(f"Batch job '{self.name}' was submitted with different requests; use a new job name.")
+        if self.done:
+            return self.state["status"]
+        self.submit(payloads, completion_window, token)
+        status = self.poll(token)
+        while wait and status not in TERMINAL_STATUSES:
+            token.sleep(poll_interval)
+            status = self.poll(token)
+        if status in TERMINAL_STATUSES and not self.state.get("downloaded"):
+            self.fetch_results(token)
+        return status
@@ -0,0 +1,114 @@
+import uuid
+import logging
+from collections import OrderedDict
+from itertools import chain
+from typing import Any, Dict, List, MutableMapping, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# A conversation in a history file is either a plain message list or a fork:
+#
+#     {"parent": "<conversation_id>", "at": N, "messages": [...]}
+#
+# meaning "the first N messages of the parent, then these". Only the messages
+# added after the fork point are stored, so branching a long conversation
+# costs nothing until the branch diverges, and every branch shares the
+# parent's message objects in memory.
+
+
+def is_fork(record: Any) -> bool:
+    return isinstance(record, dict) and "parent" in record
+
+
+def resolve(conversations: MutableMapping[str, Any], conversation_id: str) -> List[Dict[str, Any]]:
+    """Full message list of a conversation, following fork parents.
+
+    Works from the leaf up so only the needed part of each ancestor is
+    touched: O(messages returned + fork depth). A missing parent (deleted
+    by hand) resolves to an empty prefix.
+    """
+    segments = []
+    limit: Optional[int] = None
+    seen: Set[str] = set()
+    record = conversations.get(conversation_id)
+    while is_fork(record) and conversation_id not in seen:
+        seen.add(conversation_id)
+        own, at = record.get("messages") or [], record.get("at", 0)
+        if limit is None:
+            segments.append(own)
+            limit = at
+        else:
+            segments.append(own[:max(0, limit - at)])
+            limit = min(at, limit)
+        conversation_id = record["parent"]
+        record = conversations.get(conversation_id)
+    if is_fork(record):
+        logger.error("Fork cycle at conversation %s; ignoring its prefix", conversation_id)
+        record = None
+    root = record or []
+    segments.append(root if limit is None else root[:limit])
+    if len(segments) == 1:
+        return list(segments[0])
+    return list(chain.from_iterable(reversed(segments)))
+
+
+def fork(conversations: MutableMapping[str, Any], parent_id: str, at: Optional[int] = None) -> str:
+    """Add a branch of ``parent_id`` sharing its first ``at`` messages (all by default)."""
+    if parent_id not in conversations:
+        raise ValueError(f"Cannot fork unknown conversation '{parent_id}'")
+    length = len(resolve(conversations, parent_id))
+    if at is None:
+        at = length
+    if not 0 <= at <= length:
+        raise ValueError(f"Fork point {at} is outside conversation '{parent_id}' ({length} messages)")
+    conversation_id = str(uuid.uuid4())
+    conversations[conversation_id] = {"parent": parent_id, "at": at, "messages": []}
+    return conversation_id
+
+
+def _same_prefix(messages: List[Any], prefix: List[Any]) -> bool:
+    if len(messages) < len(prefix):
+        return False
+    # Unchanged messages are usually the very same objects as the parent's.
+    return all(a is b or a == b for a, b in zip(messages, prefix))
+
+
+def store(conversations: MutableMapping[str, Any], conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+    """Save ``messages`` for a conversation, keeping only a fork's own tail.
+
+    Copy-on-write: if the shared prefix was edited, the fork is detached and
+    stored as a plain list from then on. Likewise, if the stored messages
+    themselves were edited rather than only extended, forks of this
+    conversation are detached first so they keep the prefix they were
+    made from.
+    """
+    record = conversations.get(conversation_id)
+    if conversation_id in referenced_parents(conversations) \
+            and not _same_prefix(messages, resolve(conversations, conversation_id)):
+        logger.info("Conversation %s was edited; detaching its forks", conversation_id)
+        detach_children(conversations, conversation_id)
+    if is_fork(record):
+        at = record.get("at", 0)
+        if _same_prefix(messages, resolve(conversations, record["parent"])[:at]):
+            conversations[conversation_id] = dict(record, messages=list(messages[at:]))
+            return
+        logger.info("Shared prefix of conversation %s changed; storing it detached", conversation_id)
+    conversations[conversation_id] = list(messages)
+
+
+def referenced_parents(conversations: MutableMapping[str, Any]) -> Set[str]:
+    return {record["parent"] for record in conversations.values() if is_fork(record)}
+
+
+def detach_children(conversations: MutableMapping[str, Any], parent_id: str) -> List[str]:
+    """Store the forks of ``parent_id`` as plain lists (before removing the parent)."""
+    children = [cid for cid, record in conversations.items() if is_fork(record) and record["parent"] == parent_id]
+    resolved = {cid: resolve(conversations, cid) for cid in children}
+    for cid, messages in resolved.items():
+        conversations[cid] = messages
+    return children
+
+
+def materialize_all(conversations: MutableMapping[str, Any]) -> "OrderedDict[str, List[Dict[str, Any]]]":
+    """``{conversation_id: messages}`` with every fork resolved."""
+    return OrderedDict((cid, resolve(conversations, cid)) for cid in conversations)
@@ -0,0 +1,141 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from .cancel_utils import CancelToken, POLL_INTERVAL
+from .json_utils import dumps_bytes
+from .shared_cache_utils import shared_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 256
+# Prefetched results older than this are dropped unused.
+DEFAULT_TTL = 15 * 60
+
+
+def _canonical(value: Any) -> Any:
+    """Recursively sort dict keys so equal payloads serialize identically."""
+    if isinstance(value, dict):
+        return {k: _canonical(value[k]) for k in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def request_key(provider: str, url: str, payload: Dict[str, Any]) -> str:
+    """Stable cache key for one provider request."""
+    digest = hashlib.sha256()
+    digest.update(f"{provider}\n{url}\n".encode("utf-8"))
+    digest.update(dumps_bytes(_canonical(payload)))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """In-memory LRU/TTL store of provider responses keyed by ``request_key``.
+
+    Entries are filled ahead of time (see ``prefetch_utils``) and consumed by
+    the node execution that would have made the same request. A request that
+    is still in flight is waited for instead of being sent twice.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._pending: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.stats = {"filled": 0, "hits": 0, "waited": 0, "misses": 0, "expired": 0}
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries or key in self._pending
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def fill(self, key: str, fn: Callable[[], Any]) -> bool:
+        """Run ``fn`` and store its result unless ``key`` is cached or in flight.
+
+        ``fn`` returns ``None`` for results that must not be reused (errors).
+        """
+        with self._lock:
+            if key in self._entries or key in self._pending:
+                return False
+            event = self._pending[key] = threading.Event()
+        value = None
+        try:
+            value = shared_cache.get(key) if shared_cache is not None else None
+            if value is None:
+                value = fn()
+        except Exception as e:
+            logger.debug("Prefetch of %s failed: %s", key[:12], e)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+                if value is not None:
+                    self._store(key, value)
+                    self.stats["filled"] += 1
+            event.set()
+        return value is not None
+
+    def take(self, key: str, token: Optional[CancelToken] = None) -> Any:
+        """Remove and return the result for ``key``, waiting if it is in flight.
+
+        Returns ``None`` on a miss.
+        """
+        with self._lock:
+            event = self._pending.get(key)
+        if event is not None:
+            self.stats["waited"] += 1
+            while not event.wait(POLL_INTERVAL):
+                if token is not None:
+                    token.raise_if_cancelled()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                self.stats["expired"] += 1
+                return None
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def take_or_call(key: str, fn: Callable[[], Any], token: Optional[CancelToken] = None,
+                 cacheable: Callable[[Any], bool] = lambda value: True) -> Any:
+    """Use a prefetched or shared-cache result for ``key`` if there is one, otherwise call ``fn``.
+
+    With the shared cache enabled, results that pass ``cacheable`` are
+    written to it for the other processes on the host.
+    """
+    value = response_cache.take(key, token)
+    if value is not None:
+        logger.info("Using prefetched response %s", key[:12])
+    elif shared_cache is not None:
+        value = shared_cache.get(key)
+        if value is not None:
+            logger.info("Using shared cache response %s", key[:12])
+            return value
+    if value is None:
+        value = fn()
+    if shared_cache is not None and value is not None and cacheable(value):
+        shared_cache.put(key, value)
+    return value
@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import comfy.model_management as model_management
+    from comfy.model_management import InterruptProcessingException
+except ImportError:
+    model_management = None
+
+    class InterruptProcessingException(Exception):
+        pass
+
+# How often blocked waits wake up to look at the ComfyUI interrupt flag.
+POLL_INTERVAL = 0.1
+
+
+class ExecutionCancelled(Exception):
+    """Raised when a request is cancelled outside of a ComfyUI interrupt."""
+
+
+class DeadlineExceeded(ExecutionCancelled):
+    """Raised when a node's overall time budget runs out."""
+
+
+def comfy_interrupted() -> bool:
+    return model_management is not None and model_management.processing_interrupted()
+
+
+_thread_state = threading.local()
+
+
+def in_background() -> bool:
+    """True on a worker thread running a node outside ComfyUI's executor."""
+    return getattr(_thread_state, "background", False)
+
+
+@contextmanager
+def background_execution() -> Iterator[None]:
+    _thread_state.background = True
+    try:
+        yield
+    finally:
+        _thread_state.background = False
+
+
+class CancelToken:
+    """Per-execution cancellation token with an optional deadline.
+
+    The transport, the streaming readers and the retry loops all check the same
+    token, so a ComfyUI "Cancel", an explicit ``cancel()`` or an expired budget
+    stops every stage of a request.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel(self) -> None:
+        self._event.set()
+        self._fire_callbacks()
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set() or self.expired or comfy_interrupted()
+
+    def raise_if_cancelled(self) -> None:
+        if comfy_interrupted():
+            self._fire_callbacks()
+            if in_background():
+                # Leave the flag to the node running on ComfyUI's own thread.
+                raise ExecutionCancelled("Interrupted")
+            # Clears the flag and raises InterruptProcessingException, which
+            # ComfyUI reports as an interrupt rather than a node error.
+            model_management.throw_exception_if_processing_interrupted()
+        if self._event.is_set():
+            raise ExecutionCancelled("Request was cancelled")
+        if self.expired:
+            self._fire_callbacks()
+            raise DeadlineExceeded("Request exceeded its time budget")
+
+    def cap(self, seconds: float) -> float:
+        """Clamp a timeout or delay so it never runs past the deadline."""
+        remaining = self.remaining()
+        if remaining is None:
+            return seconds
+        return max(0.0, min(seconds, remaining))
+
+    def cap_timeout(self, timeout):
+        """Clamp a ``requests`` style timeout (number or ``(connect, read)`` tuple)."""
+        if self.deadline is None or timeout is None:
+            return timeout
+        if isinstance(timeout, tuple):
+            return tuple(self.cap(t) if t is not None else self.remaining() for t in timeout)
+        return self.cap(timeout)
+
+    def sleep(self, seconds: float) -> None:
+        """Interruptible replacement for ``time.sleep`` in backoff loops."""
+        end = time.monotonic() + self.cap(seconds)
+        while True:
+            self.raise_if_cancelled()
+            left = end - time.monotonic()
+            if left <= 0:
+                return
+            self._event.wait(min(left, POLL_INTERVAL))
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run ``callback`` as soon as the token is cancelled.
+
+        Used to close in-flight responses so a blocked socket read returns
+        immediately. Returns a function that unregisters the callback.
+        """
+        with self._lock:
+            self._callbacks.append(callback)
+        _monitor.watch(self)
+
+        def remove():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+        return remove
+
+    def _fire_callbacks(self) -> None:
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug("Cancel callback failed: %s", e)
+
+
+class _CancelMonitor:
+    """Single background thread that fires callbacks of watched tokens.
+
+    Needed because the ComfyUI interrupt flag is polled, not signalled.
+    """
+
+    def __init__(self):
+        self._tokens = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, token: CancelToken) -> None:
+        with self._lock:
+            self._tokens.add(token)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="apachellmpack-cancel-monitor", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            with self._lock:
+                tokens = list(self._tokens)
+                if not tokens:
+                    self._thread = None
+                    return
+            for token in tokens:
+                if token.cancelled:
+                    token._fire_callbacks()
+                    with self._lock:
+                        self._tokens.discard(token)
+                elif not token._callbacks:
+                    with self._lock:
+                        self._tokens.discard(token)
+
+
+_monitor = _CancelMonitor()
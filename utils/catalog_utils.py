@@ -0,0 +1,248 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from .http_utils import get_session
+from .json_utils import dump_file, load_file, parse_response
+from .provider_utils import get_base_url, get_headers, get_provider
+from .registry_utils import shared
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILENAME = "models_catalog.json"
+# Metadata older than this is refreshed in the background.
+MAX_AGE = 6 * 60 * 60
+# Measurements are flushed to disk at most this often.
+SAVE_INTERVAL = 60
+# Weight of the newest sample in the latency/throughput moving averages.
+EWMA_ALPHA = 0.2
+# Rough characters-per-token ratio used when no tokenizer is available.
+CHARS_PER_TOKEN = 4
+# After a failed or empty model list fetch, wait this long before the next one.
+FETCH_RETRY_INTERVAL = 60
+
+_fetch_failed_at: Dict[str, float] = {}
+
+
+def estimate_tokens(messages) -> int:
+    """Cheap token estimate for a string or a list of chat messages."""
+    if isinstance(messages, str):
+        return len(messages) // CHARS_PER_TOKEN + 1
+    total = 0
+    for message in messages:
+        # A few tokens of per-message overhead for role and separators.
+        total += len(message.get("content") or "") // CHARS_PER_TOKEN + 4
+    return total
+
+
+def _normalize_model(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Map the different ``/models`` layouts onto one set of fields."""
+    return {
+        "context_window": item.get("context_window") or item.get("context_length"),
+        "max_output_tokens": item.get("max_completion_tokens") or item.get("max_output_tokens"),
+        "active": item.get("active", True),
+        "owned_by": item.get("owned_by"),
+    }
+
+
+class ModelCatalog:
+    """Per-provider model metadata persisted next to the provider's config.
+
+    Holds what ``/models`` reports (context window, max output tokens, active
+    flag) plus our own measured latency and throughput. Works offline from the
+    last saved copy and refreshes itself in the background when stale.
+    """
+
+    def __init__(self, provider: str, path: Optional[str] = None):
+        self.provider = provider
+        self.path = path or os.path.join(get_provider(provider)["dir"], CATALOG_FILENAME)
+        self.models: Dict[str, Dict[str, Any]] = {}
+        self.fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._dirty = False
+        self._saved_at = 0.0
+        self.load()
+
+    # -- persistence -------------------------------------------------------
+
+    def load(self) -> None:
+        try:
+            data = load_file(self.path) if os.path.exists(self.path) else None
+        except Exception as e:
+            logger.warning("Could not read model catalog %s: %s", self.path, e)
+            data = None
+        if data:
+            with self._lock:
+                self.models = data.get("models", {})
+                self.fetched_at = data.get("fetched_at", 0.0)
+
+    def save(self) -> None:
+        with self._lock:
+            snapshot = {"provider": self.provider, "fetched_at": self.fetched_at, "models": self.models}
+            self._dirty = False
+            self._saved_at = time.monotonic()
+            tmp_path = self.path + ".tmp"
+            try:
+                dump_file(tmp_path, snapshot, pretty=True)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning("Could not save model catalog %s: %s", self.path, e)
+
+    def save_if_dirty(self) -> None:
+        if self._dirty:
+            self.save()
+
+    # -- refresh -----------------------------------------------------------
+
+    @property
+    def stale(self) -> bool:
+        return time.time() - self.fetched_at > MAX_AGE
+
+    def update_from_api(self, items: Iterable[Dict[str, Any]]) -> None:
+        """Merge a ``/models`` ``data`` list, keeping our own measurements."""
+        with self._lock:
+            seen = set()
+            for item in items:
+                model_id = item.get("id")
+                if not model_id:
+                    continue
+                seen.add(model_id)
+                entry = self.models.setdefault(model_id, {})
+                entry.update({k: v for k, v in _normalize_model(item).items() if v is not None})
+            for model_id, entry in self.models.items():
+                if model_id not in seen:
+                    entry["active"] = False
+            self.fetched_at = time.time()
+        self.save()
+
+    def refresh(self, timeout: float = 10.0) -> bool:
+        url = f"{get_base_url(self.provider)}/models"
+        try:
+            response = get_session().get(url, headers=get_headers(self.provider), timeout=timeout)
+            response.raise_for_status()
+            data = parse_response(response).get("data")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("Could not refresh %s model catalog: %s", self.provider, e)
+            return False
+        if not isinstance(data, list):
+            logger.warning("Unexpected %s /models response format", self.provider)
+            return False
+        self.update_from_api(data)
+        return True
+
+    def refresh_in_background(self, force: bool = False) -> None:
+        with self._lock:
+            if self._refreshing or not (force or self.stale):
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name=f"apachellmpack-catalog-{self.provider}", daemon=True).start()
+
+    # -- queries -----------------------------------------------------------
+
+    def get(self, model: str) -> Dict[str, Any]:
+        return dict(self.models.get(model, {}))
+
+    def model_ids(self, active_only: bool = True) -> List[str]:
+        return sorted(m for m, entry in self.models.items() if entry.get("active", True) or not active_only)
+
+    def fit_request(self, model: str, messages, max_tokens: int) -> Tuple[int, Optional[str]]:
+        """Clamp ``max_tokens`` to what the model allows.
+
+        Returns ``(max_tokens, error)``; ``error`` is set when the prompt alone
+        cannot fit the context window, so the request is not worth sending.
+        Unknown models pass through unchanged.
+        """
+        entry = self.models.get(model)
+        if not entry:
+            return max_tokens, None
+        if entry.get("active") is False:
+            return max_tokens, f"Model '{model}' is not active on {self.provider}."
+        limit = entry.get("max_output_tokens")
+        if limit:
+            max_tokens = min(max_tokens, limit)
+        context_window = entry.get("context_window")
+        if context_window:
+            prompt_tokens = estimate_tokens(messages)
+            available = context_window - prompt_tokens
+            if available <= 0:
+                return max_tokens, (f"Prompt (~{prompt_tokens} tokens) does not fit the "
+                                    f"{context_window} token context window of '{model}'.")
+            max_tokens = min(max_tokens, available)
+        return max(1, max_tokens), None
+
+    def record(self, model: str, latency: float, output_tokens: int) -> None:
+        """Fold one measured request into the model's latency/throughput averages."""
+        with self._lock:
+            entry = self.models.setdefault(model, {})
+            throughput = output_tokens / latency if latency > 0 else 0.0
+            samples = entry.get("samples", 0)
+            if samples:
+                entry["latency"] = round((1 - EWMA_ALPHA) * entry.get("latency", latency) + EWMA_ALPHA * latency, 4)
+                entry["tokens_per_second"] = round((1 - EWMA_ALPHA) * entry.get("tokens_per_second", throughput) + EWMA_ALPHA * throughput, 2)
+            else:
+                entry["latency"] = round(latency, 4)
+                entry["tokens_per_second"] = round(throughput, 2)
+            entry["samples"] = samples + 1
+            self._dirty = True
+            due = time.monotonic() - self._saved_at > SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def fastest(self, models: Optional[Iterable[str]] = None, by: str = "tokens_per_second") -> Optional[str]:
+        """Pick the measured-fastest model (highest throughput or lowest latency)."""
+        candidates = [m for m in (models or self.model_ids()) if self.models.get(m, {}).get(by) is not None]
+        if not candidates:
+            return None
+        if by == "latency":
+            return min(candidates, key=lambda m: self.models[m]["latency"])
+        return max(candidates, key=lambda m: self.models[m][by])
+
+
+def get_catalog(provider: str) -> ModelCatalog:
+    provider = provider.lower()
+    return shared.get("catalog", provider, lambda: ModelCatalog(provider))
+
+
+def model_choices(provider: str, fetch: Callable[[], List[str]]) -> List[str]:
+    """Model ids for a node's model combo.
+
+    ``fetch`` (a blocking ``/models`` call) runs once per process; after that
+    the list comes from the catalog, which refreshes itself in the background
+    when stale. An empty fetch result (offline, bad key) is not kept, but the
+    next fetch waits ``FETCH_RETRY_INTERVAL`` seconds; until then the catalog
+    is used as is, possibly empty.
+    """
+    provider = provider.lower()
+    failed_at = _fetch_failed_at.get(provider)
+    if failed_at is not None and time.monotonic() - failed_at < FETCH_RETRY_INTERVAL:
+        fetched = []
+    else:
+        fetched = shared.get("models", provider, fetch)
+        if fetched:
+            _fetch_failed_at.pop(provider, None)
+        else:
+            shared.discard("models", provider)
+            _fetch_failed_at[provider] = time.monotonic()
+            logger.warning("No %s models fetched; not retrying for %ds", provider, FETCH_RETRY_INTERVAL)
+    catalog = get_catalog(provider)
+    catalog.refresh_in_background()
+    return catalog.model_ids() or list(fetched or [])
+
+
+@atexit.register
+def _save_catalogs() -> None:
+    for catalog in shared.items("catalog").values():
+        catalog.save_if_dirty()
@@ -0,0 +1,252 @@
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cancel_utils import CancelToken, DeadlineExceeded, ExecutionCancelled, POLL_INTERVAL
+from .json_utils import dumps_bytes
+from .log_utils import log_payload
+from .priority_utils import current_priority, estimate_cost, schedulers
+from .profile_utils import timed
+from .registry_utils import shared
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts applied to every provider call; a node budget can
+# only make them shorter.
+DEFAULT_TIMEOUT = (10, 120)
+# Connections kept alive per provider host; covers Best-of-N fan-out.
+POOL_MAXSIZE = 32
+
+_warm_hosts = set()
+_host_stats: Dict[str, Dict[str, Any]] = {}
+_stats_lock = threading.Lock()
+
+
+def _new_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Process-wide session so DNS, TCP and TLS setup is paid once per host."""
+    return shared.get("http", "session", _new_session)
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def _record(url: str, elapsed: float) -> None:
+    host = _host(url)
+    with _stats_lock:
+        stats = _host_stats.get(host)
+        if stats is None:
+            warm = host in _warm_hosts
+            _host_stats[host] = {"first_request": round(elapsed, 4), "first_request_warm": warm,
+                                 "requests": 1, "total_time": elapsed}
+            logger.info("First request to %s took %.3fs (%s)", host, elapsed, "warm" if warm else "cold")
+            return
+        stats["requests"] += 1
+        stats["total_time"] += elapsed
+
+
+def connection_stats() -> Dict[str, Dict[str, Any]]:
+    """Per host: first request latency, whether it hit a prewarmed pool, and the mean of the rest."""
+    result = {}
+    with _stats_lock:
+        for host, stats in _host_stats.items():
+            later = stats["requests"] - 1
+            steady = (stats["total_time"] - stats["first_request"]) / later if later else None
+            result[host] = {"first_request": stats["first_request"], "first_request_warm": stats["first_request_warm"],
+                            "steady_state": round(steady, 4) if steady is not None else None,
+                            "requests": stats["requests"]}
+    return result
+
+
+def warm_connection(url: str, headers: Optional[Dict[str, str]] = None, timeout=DEFAULT_TIMEOUT) -> bool:
+    """Open a pooled keep-alive connection to ``url``'s host with a cheap GET.
+
+    Any HTTP status counts as success: the point is the finished handshake
+    that stays in the pool for the first real request.
+    """
+    try:
+        response = get_session().get(url, headers=headers, timeout=timeout)
+        response.close()
+    except requests.exceptions.RequestException as e:
+        logger.debug("Warm-up of %s failed: %s", url, e)
+        return False
+    mark_warm(url)
+    return True
+
+
+def mark_warm(url: str) -> None:
+    """Note that the pool already holds a connection to ``url``'s host."""
+    with _stats_lock:
+        _warm_hosts.add(_host(url))
+
+
+def _send(method: str, url: str, timeout, stream: bool = False, on_headers=None, **kwargs) -> requests.Response:
+    """Send a request; a non-streamed body is read here as ``requests`` would.
+
+    ``on_headers`` gets the response before its body is read, so the read
+    can be aborted by closing the response.
+    """
+    start = time.perf_counter()
+    response = get_session().request(method, url, timeout=timeout, stream=True, **kwargs)
+    if not stream:
+        if on_headers is not None:
+            on_headers(response)
+        try:
+            response.content
+        except BaseException:
+            response.close()
+            raise
+        # Streamed bodies are never logged.
+        log_payload(logger, response.content, "%s %s -> %s", method, url, response.status_code)
+    _record(url, time.perf_counter() - start)
+    return response
+
+
+def _once(callback):
+    lock = threading.Lock()
+    state = {"called": callback is None}
+
+    def call():
+        with lock:
+            if state["called"]:
+                return
+            state["called"] = True
+        callback()
+    return call
+
+
+def _finish_on_close(response: requests.Response, finish) -> requests.Response:
+    original_close = response.close
+
+    def close():
+        finish()
+        original_close()
+    response.close = close
+    return response
+
+
+def request(method: str, url: str, token: Optional[CancelToken] = None, timeout=DEFAULT_TIMEOUT,
+            on_finish=None, **kwargs) -> requests.Response:
+    """``requests.request`` on the shared session that honours a ``CancelToken``.
+
+    The blocking call runs on a helper thread while the caller waits on the
+    token, so an interrupt or an expired budget releases the ComfyUI worker at
+    once. The response is closed on cancellation, which aborts the socket read
+    in progress: the body of a plain request (read on the helper thread) or
+    the stream of a streamed one. While the server has not sent the headers
+    yet, the helper thread can only be abandoned.
+
+    ``on_finish`` runs once the connection is no longer in use: when the
+    helper thread is done, or for a stream, when the response is closed.
+    """
+    finish = _once(on_finish)
+    stream = kwargs.get("stream", False)
+    if token is None:
+        try:
+            response = _send(method, url, timeout, **kwargs)
+        except BaseException:
+            finish()
+            raise
+        if stream:
+            return _finish_on_close(response, finish)
+        finish()
+        return response
+
+    try:
+        token.raise_if_cancelled()
+    except BaseException:
+        finish()
+        raise
+    timeout = token.cap_timeout(timeout)
+    state: Dict[str, Any] = {"abandoned": False, "remove": lambda: None}
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def watch(response):
+        with lock:
+            if state["abandoned"]:
+                response.close()
+            else:
+                state["remove"] = token.on_cancel(response.close)
+
+    def run():
+        handed_over = False
+        try:
+            response = _send(method, url, timeout, on_headers=watch, **kwargs)
+        except BaseException as e:
+            state["error"] = e
+        else:
+            state["remove"]()
+            with lock:
+                if state["abandoned"]:
+                    response.close()
+                else:
+                    state["response"] = response
+                    handed_over = stream
+        finally:
+            if not handed_over:
+                finish()
+            done.set()
+
+    threading.Thread(target=run, name="apachellmpack-http", daemon=True).start()
+    while not done.wait(POLL_INTERVAL):
+        if token.cancelled:
+            with lock:
+                state["abandoned"] = True
+            logger.info("Abandoning %s %s: request cancelled", method, url)
+            token.raise_if_cancelled()
+            raise ExecutionCancelled("Request was cancelled")
+
+    if "error" in state:
+        error = state["error"]
+        token.raise_if_cancelled()
+        # Socket timeouts are capped by the budget, so a timeout right at the
+        # deadline is the budget running out.
+        if isinstance(error, requests.Timeout) and token.deadline is not None and token.remaining() <= POLL_INTERVAL:
+            raise DeadlineExceeded("Request exceeded its time budget") from error
+        raise error
+    response = state["response"]
+    if stream:
+        remove = token.on_cancel(response.close)
+        # Unregister once the caller is done with the response.
+        original_close = response.close
+
+        def close():
+            remove()
+            original_close()
+        response.close = close
+        _finish_on_close(response, finish)
+    return response
+
+
+@timed("http.post")
+def post_json(url: str, headers: Dict[str, str], payload: Dict[str, Any], token: Optional[CancelToken] = None,
+              stream: bool = False, timeout=DEFAULT_TIMEOUT) -> requests.Response:
+    """POST ``payload`` as JSON once the provider's scheduler admits it.
+
+    The request waits in its priority class (see ``priority_utils``) and
+    holds a slot while its connection is in use: until the response is read
+    or, for a stream, closed. A cancelled request keeps its slot until its
+    helper thread lets go of the connection.
+    """
+    headers = dict(headers)
+    headers.setdefault("Content-Type", "application/json")
+    log_payload(logger, payload, "POST %s", url)
+    scheduler = schedulers.get(url)
+    priority = current_priority()
+    scheduler.acquire(priority, estimate_cost(payload), token)
+    return request("POST", url, token=token, timeout=timeout, on_finish=lambda: scheduler.release(priority),
+                   headers=headers, data=dumps_bytes(payload), stream=stream)
@@ -0,0 +1,284 @@
+import json
+import logging
+import re
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+from .cancel_utils import CancelToken
+from .retry_utils import post_json_with_retry
+from .json_utils import loads, parse_response
+from .stream_utils import stream_completion
+from .usage_utils import note_usage
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = " \t\n\r"
+_DIGITS = "0123456789"
+# Run of string characters that need no special handling.
+_PLAIN = re.compile(r'[^"\\\x00-\x1f]*')
+
+# Parser states
+_VALUE, _ARRAY_FIRST, _OBJECT_FIRST, _KEY, _COLON, _AFTER_VALUE, _DONE = range(7)
+_STRING, _ESCAPE, _UNICODE, _NUMBER, _LITERAL = range(7, 12)
+
+# Number sub-states; the ones in _NUMBER_END may legally end a number.
+_N_SIGN, _N_ZERO, _N_INT, _N_DOT, _N_FRAC, _N_E, _N_ESIGN, _N_EXP = range(8)
+_NUMBER_END = (_N_ZERO, _N_INT, _N_FRAC, _N_EXP)
+
+_LITERALS = {"t": "true", "f": "false", "n": "null"}
+
+# A 400 whose error names this is a rejection of streaming in JSON mode.
+_STREAM_PARAM = re.compile(r'\bstream', re.IGNORECASE)
+
+
+class JSONStreamError(ValueError):
+    """Raised as soon as streamed output can no longer be valid JSON."""
+
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} at char {position}")
+        self.position = position
+
+
+class IncrementalJSONValidator:
+    """Validates a JSON document chunk by chunk without buffering it.
+
+    ``feed`` raises ``JSONStreamError`` on the first character that makes the
+    document invalid, so a bad generation can be aborted mid-stream. ``finish``
+    raises if the document is incomplete.
+    """
+
+    def __init__(self, require_object: bool = False):
+        self.require_object = require_object
+        self._stack = []
+        self._state = _VALUE
+        self._key = False
+        self._number = None
+        self._literal = ""
+        self._unicode = 0
+        self.position = 0
+
+    @property
+    def complete(self) -> bool:
+        return self._state == _DONE or (
+            self._state == _NUMBER and not self._stack and self._number in _NUMBER_END)
+
+    def _fail(self, message: str, offset: int):
+        raise JSONStreamError(message, self.position + offset)
+
+    def _end_value(self) -> None:
+        self._state = _AFTER_VALUE if self._stack else _DONE
+
+    def feed(self, chunk: str) -> None:
+        i, n = 0, len(chunk)
+        while i < n:
+            state = self._state
+
+            if state == _STRING:
+                i = _PLAIN.match(chunk, i).end()
+                if i >= n:
+                    break
+                c = chunk[i]
+                if c == '"':
+                    if self._key:
+                        self._state = _COLON
+                    else:
+                        self._end_value()
+                elif c == "\\":
+                    self._state = _ESCAPE
+                else:
+                    self._fail("Unescaped control character in string", i)
+                i += 1
+                continue
+
+            c = chunk[i]
+
+            if state == _ESCAPE:
+                if c == "u":
+                    self._unicode = 4
+                    self._state = _UNICODE
+                elif c in '"\\/bfnrt':
+                    self._state = _STRING
+                else:
+                    self._fail(f"Invalid escape '\\{c}'", i)
+            elif state == _UNICODE:
+                if c not in "0123456789abcdefABCDEF":
+                    self._fail("Invalid unicode escape", i)
+                self._unicode -= 1
+                if not self._unicode:
+                    self._state = _STRING
+            elif state == _NUMBER:
+                number = self._number
+                if c in _DIGITS:
+                    if number in (_N_SIGN,):
+                        self._number = _N_ZERO if c == "0" else _N_INT
+                    elif number == _N_ZERO:
+                        self._fail("Leading zero in number", i)
+                    elif number == _N_DOT:
+                        self._number = _N_FRAC
+                    elif number in (_N_E, _N_ESIGN):
+                        self._number = _N_EXP
+                elif c == "." and number in (_N_ZERO, _N_INT):
+                    self._number = _N_DOT
+                elif c in "eE" and number in (_N_ZERO, _N_INT, _N_FRAC):
+                    self._number = _N_E
+                elif c in "+-" and number == _N_E:
+                    self._number = _N_ESIGN
+                elif number in _NUMBER_END:
+                    # The number ended; re-read this character in the next state.
+                    self._end_value()
+                    continue
+                else:
+                    self._fail("Malformed number", i)
+            elif state == _LITERAL:
+                if c != self._literal[0]:
+                    self._fail("Invalid literal", i)
+                self._literal = self._literal[1:]
+                if not self._literal:
+                    self._end_value()
+            elif c in _WHITESPACE:
+                pass
+            elif state == _AFTER_VALUE:
+                top = self._stack[-1]
+                if c == ",":
+                    self._state = _KEY if top == "{" else _VALUE
+                elif (c == "}" and top == "{") or (c == "]" and top == "["):
+                    self._stack.pop()
+                    self._end_value()
+                else:
+                    self._fail(f"Unexpected '{c}' after value", i)
+            elif state == _COLON:
+                if c != ":":
+                    self._fail("Expected ':' after object key", i)
+                self._state = _VALUE
+            elif state in (_OBJECT_FIRST, _KEY):
+                if c == '"':
+                    self._key = True
+                    self._state = _STRING
+                elif c == "}" and state == _OBJECT_FIRST:
+                    self._stack.pop()
+                    self._end_value()
+                else:
+                    self._fail("Expected object key", i)
+            elif state == _DONE:
+                self._fail("Unexpected data after JSON document", i)
+            elif state == _ARRAY_FIRST and c == "]":
+                self._stack.pop()
+                self._end_value()
+            else:
+                # _VALUE or the first element of an array
+                if self.require_object and not self._stack and c != "{":
+                    self._fail("Expected a JSON object", i)
+                if c in "{[":
+                    self._stack.append(c)
+                    self._state = _OBJECT_FIRST if c == "{" else _ARRAY_FIRST
+                elif c == '"':
+                    self._key = False
+                    self._state = _STRING
+                elif c == "-" or c in _DIGITS:
+                    self._state = _NUMBER
+                    self._number = _N_SIGN if c == "-" else (_N_ZERO if c == "0" else _N_INT)
+                elif c in _LITERALS:
+                    self._literal = _LITERALS[c][1:]
+                    self._state = _LITERAL
+                else:
+                    self._fail(f"Unexpected '{c}' where a value was expected", i)
+            i += 1
+        self.position += n
+
+    def finish(self) -> None:
+        if not self.complete:
+            raise JSONStreamError("Incomplete JSON document", self.position)
+
+
+def _request_json_text(url: str, headers: Dict[str, str], payload: Dict[str, Any], token: CancelToken,
+                       stream: bool, retries: int = 1) -> str:
+    """Fetch one JSON-mode completion, validating it while it streams."""
+    validator = IncrementalJSONValidator(require_object=True)
+    if not stream:
+        response = post_json_with_retry(url, headers, payload, retries, token=token)
+        response.raise_for_status()
+        body = parse_response(response)
+        note_usage(body.get('usage'))
+        text = body['choices'][0]['message']['content']
+        validator.feed(text)
+        validator.finish()
+        return text
+
+    parts = []
+    chunks = stream_completion(url, headers, payload, token, max_attempts=retries)
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            validator.feed(chunk)
+    finally:
+        # Closes the connection when the validator aborts mid-stream.
+        chunks.close()
+    validator.finish()
+    return "".join(parts)
+
+
+def _api_error(response: requests.Response) -> Dict[str, Any]:
+    try:
+        error = loads(response.content).get("error")
+    except (ValueError, AttributeError):
+        return {"message": response.text[:500]}
+    return error if isinstance(error, dict) else {"message": str(error or "")}
+
+
+def _invalid_generation(error: Dict[str, Any]) -> bool:
+    # Groq reports JSON-mode output that failed its own validation this way.
+    return error.get("code") == "json_validate_failed" or "failed_generation" in error
+
+
+def _rejects_streaming(error: Dict[str, Any]) -> bool:
+    # ``failed_generation`` is model output and may mention anything.
+    return any(isinstance(error.get(field), str) and _STREAM_PARAM.search(error[field])
+               for field in ("param", "code", "message"))
+
+
+def request_json_completion(url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                            token: Optional[CancelToken] = None, max_attempts: int = 2,
+                            retries: int = 3) -> Tuple[Any, str, int]:
+    """Run a chat completion in JSON mode and return ``(parsed, raw_text, attempts)``.
+
+    Sends ``response_format`` and validates the streamed output incrementally.
+    Invalid output aborts the stream at once and only this call is retried,
+    with the seed bumped so the retry does not reproduce the same output.
+    A 400 carrying the provider's invalid-generation error counts as invalid
+    output too. A 400 whose error names the ``stream`` parameter means the
+    model does not stream in JSON mode; the remaining attempts use blocking
+    requests. Any other 400 is raised as the ``requests.HTTPError``.
+    Raises ``JSONStreamError`` if every attempt fails. Transport failures
+    (429, 5xx, resets) are retried separately, up to ``retries`` times each.
+    """
+    token = token or CancelToken()
+    payload = dict(payload, response_format={"type": "json_object"})
+    stream = True
+    last_error = None
+    for attempt in range(max(1, max_attempts)):
+        attempt_payload = payload
+        if attempt and "seed" in payload:
+            attempt_payload = dict(payload, seed=payload["seed"] + attempt)
+        try:
+            while True:
+                try:
+                    text = _request_json_text(url, headers, attempt_payload, token, stream, retries)
+                    break
+                except requests.HTTPError as e:
+                    if e.response is None or e.response.status_code != 400:
+                        raise
+                    error = _api_error(e.response)
+                    if _invalid_generation(error):
+                        raise JSONStreamError(f"{error.get('code') or 'HTTP 400'}: {error.get('message', '')}", 0) from e
+                    if not stream or not _rejects_streaming(error):
+                        # A bad request (no "json" in the messages, context too long, ...) fails every retry.
+                        raise
+                # Some models reject streaming in JSON mode; validate the full body instead.
+                logger.info("Streaming JSON mode rejected by %s, falling back to a blocking request", url)
+                stream = False
+            return loads(text), text, attempt + 1
+        except (JSONStreamError, json.JSONDecodeError) as e:
+            last_error = e
+            logger.warning("JSON mode output invalid (attempt %d/%d): %s", attempt + 1, max_attempts, e)
+    raise JSONStreamError(f"No valid JSON after {max_attempts} attempts: {last_error}", getattr(last_error, "position", 0))
@@ -0,0 +1,113 @@
+import os
+import json
+import threading
+from typing import Any, Dict, Tuple
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers can keep
+# catching ``json.JSONDecodeError`` whichever backend is active.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+# Compact separators for everything a human does not read directly
+# (history files on disk, request bodies, cache entries).
+_COMPACT_SEPARATORS = (",", ":")
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON from ``str``, ``bytes`` or ``bytearray``."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Serialize ``obj`` to compact UTF-8 JSON bytes, suitable for request bodies."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=_COMPACT_SEPARATORS, ensure_ascii=False).encode("utf-8")
+
+
+def dumps(obj: Any, pretty: bool = False) -> str:
+    """Serialize ``obj`` to a JSON string.
+
+    ``pretty`` output uses a two space indent and is meant for values shown to
+    the user (e.g. the ``chat_history`` node output); everything else is compact.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option).decode("utf-8")
+    if pretty:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=_COMPACT_SEPARATORS, ensure_ascii=False)
+
+
+def load_file(path: str) -> Any:
+    """Read and parse a JSON file. An empty file parses to ``None``."""
+    with open(path, "rb") as f:
+        content = f.read().strip()
+    if not content:
+        return None
+    return loads(content)
+
+
+_file_cache: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+_file_cache_lock = threading.Lock()
+
+
+def load_file_cached(path: str) -> Any:
+    """``load_file`` memoized on the file's mtime and size.
+
+    Meant for small read-mostly files such as prompt presets that are read on
+    every node construction. The returned value is shared, so callers must not
+    mutate it.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _file_cache_lock:
+        cached = _file_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    value = load_file(path)
+    with _file_cache_lock:
+        _file_cache[path] = (key, value)
+    return value
+
+
+def dump_file(path: str, obj: Any, pretty: bool = False) -> None:
+    """Write ``obj`` to ``path`` as JSON (compact unless ``pretty``).
+
+    The data goes to a temporary file that then replaces ``path``, so a
+    concurrent reader sees the old or the new content, never a truncated
+    file.
+    """
+    if pretty:
+        data = dumps(obj, pretty=True).encode("utf-8")
+    else:
+        data = dumps_bytes(obj)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def parse_response(response) -> Any:
+    """Parse a ``requests.Response`` body without going through ``response.text``."""
+    return loads(response.content)
+
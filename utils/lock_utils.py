@@ -0,0 +1,43 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# How often a Windows waiter retries a held lock.
+RETRY_INTERVAL = 0.01
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Exclusive lock on ``path`` (created if missing), held across processes.
+
+    Every caller opens its own handle, so threads of one process exclude
+    each other too.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(RETRY_INTERVAL)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
@@ -0,0 +1,136 @@
+import os
+import time
+import random
+import logging
+import threading
+from typing import Any
+
+# Every module logs through ``logging.getLogger(__name__)``, so all loggers sit
+# under the pack's package logger. The pack never configures the root logger;
+# ComfyUI (or the user) decides where records go.
+PACK_LOGGER_NAME = __name__.rsplit(".", 2)[0]
+pack_logger = logging.getLogger(PACK_LOGGER_NAME)
+request_logger = logging.getLogger(PACK_LOGGER_NAME + ".requests")
+
+# Level of the pack's loggers only, e.g. DEBUG while troubleshooting.
+LOG_LEVEL_ENV = "APACHELLMPACK_LOG_LEVEL"
+# Share of request/response payloads to log (0 = off, 1 = all, 0.05 = 5%).
+LOG_PAYLOADS_ENV = "APACHELLMPACK_LOG_PAYLOADS"
+# Upper bound on logged payloads per minute, whatever the sample rate.
+LOG_PAYLOADS_PER_MINUTE_ENV = "APACHELLMPACK_LOG_PAYLOADS_PER_MINUTE"
+# Set to 1 for one logfmt line per request on the "<pack>.requests" logger.
+LOG_SUMMARY_ENV = "APACHELLMPACK_LOG_SUMMARY"
+
+DEFAULT_PAYLOADS_PER_MINUTE = 30
+MAX_PAYLOAD_CHARS = 2000
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name, "").strip().lower()
+    if value in ("true", "yes", "on"):
+        return 1.0
+    try:
+        return float(value) if value else default
+    except ValueError:
+        return default
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class PayloadSampler:
+    """Random sampling plus a per-minute token bucket for payload logs."""
+
+    def __init__(self, rate: float = 0.0, per_minute: float = DEFAULT_PAYLOADS_PER_MINUTE):
+        self.rate = max(0.0, min(1.0, rate))
+        self.per_minute = per_minute
+        self._tokens = per_minute
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def should_log(self) -> bool:
+        if self.rate <= 0.0 or (self.rate < 1.0 and random.random() >= self.rate):
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.per_minute, self._tokens + (now - self._refilled_at) * self.per_minute / 60.0)
+            self._refilled_at = now
+            if self._tokens < 1.0:
+                self.dropped += 1
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+payload_sampler = PayloadSampler(_env_float(LOG_PAYLOADS_ENV, 0.0),
+                                 _env_float(LOG_PAYLOADS_PER_MINUTE_ENV, DEFAULT_PAYLOADS_PER_MINUTE))
+summary_enabled = _env_flag(LOG_SUMMARY_ENV)
+
+
+class _Payload:
+    """Renders a payload only if the record is actually emitted."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        value = self.value
+        if isinstance(value, (bytes, bytearray)):
+            text = bytes(value[:MAX_PAYLOAD_CHARS * 4]).decode("utf-8", "replace")
+        elif isinstance(value, str):
+            text = value
+        else:
+            from .json_utils import dumps
+            text = dumps(value)
+        if len(text) > MAX_PAYLOAD_CHARS:
+            text = f"{text[:MAX_PAYLOAD_CHARS]}... [{len(text) - MAX_PAYLOAD_CHARS} more chars]"
+        return text
+
+
+def log_payload(logger: logging.Logger, payload: Any, label: str, *args: Any) -> None:
+    """Log ``payload`` (bytes, text or JSON-able) if payload logging samples it in.
+
+    ``label`` and ``args`` are %-formatted like a normal log message. Off by
+    default, and then costs one float comparison.
+    """
+    if payload_sampler.rate <= 0.0 or not payload_sampler.should_log():
+        return
+    logger.info(label + ": %s", *args, _Payload(payload))
+
+
+def _logfmt_value(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    text = str(value)
+    if not text or any(c in text for c in ' ="'):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return text
+
+
+def log_request_summary(**fields: Any) -> None:
+    """One ``key=value`` line per request on the requests logger, when enabled."""
+    if not summary_enabled or not request_logger.isEnabledFor(logging.INFO):
+        return
+    request_logger.info("%s", " ".join(f"{key}={_logfmt_value(value)}" for key, value in fields.items()))
+
+
+def configure() -> None:
+    if not any(isinstance(h, logging.NullHandler) for h in pack_logger.handlers):
+        pack_logger.addHandler(logging.NullHandler())
+    level = os.environ.get(LOG_LEVEL_ENV, "").strip().upper()
+    if level:
+        if isinstance(logging.getLevelName(level), int):
+            pack_logger.setLevel(level)
+        else:
+            pack_logger.warning("Ignoring unknown %s=%s", LOG_LEVEL_ENV, level)
+
+
+configure()
@@ -0,0 +1,192 @@
+import copy
+import random
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+from .cache_utils import request_key
+from .json_utils import dumps_bytes
+
+logger = logging.getLogger(__name__)
+
+# MinHash signature length, split into LSH bands of ROWS slots. Two prompts
+# become candidates when any band matches; with 16 bands of 4 that is ~99%
+# likely at Jaccard similarity 0.7 and ~64% at 0.5.
+NUM_PERM = 64
+ROWS = 4
+BANDS = NUM_PERM // ROWS
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5eed)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize_text(text: str) -> str:
+    """Case, width, punctuation and whitespace folded away: ``"A  cat, (red)!"`` -> ``"a cat red"``."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return " ".join("".join(c if c.isalnum() else " " for c in text).split())
+
+
+def shingles(normalized: str) -> FrozenSet[str]:
+    """Words and word pairs, so both word choice and order count."""
+    words = normalized.split()
+    return frozenset(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+
+def _hash64(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash(items: FrozenSet[str]) -> Tuple[int, ...]:
+    hashes = [_hash64(item) for item in items]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def scope_key(provider: str, url: str, payload: Dict[str, Any], **extra: Any) -> str:
+    """Everything about a request except the last user message.
+
+    Only requests with the same scope (model, system prompt/preset, sampling
+    parameters, ``extra`` node options) can share a cached answer.
+    """
+    messages = list(payload.get("messages") or [])
+    if messages and messages[-1].get("role") == "user":
+        messages[-1] = dict(messages[-1], content="")
+    return request_key(provider, url, dict(payload, messages=messages, **{f"_{k}": v for k, v in extra.items()}))
+
+
+class _Entry(NamedTuple):
+    scope: str
+    normalized: str
+    shingles: FrozenSet[str]
+    signature: Tuple[int, ...]
+    value: Any
+    size: int
+
+
+class NearHit(NamedTuple):
+    value: Any
+    similarity: float
+    matched: str
+
+
+class NearDuplicateCache:
+    """Approximate response cache keyed on the similarity of the user input.
+
+    Inputs are normalized and fingerprinted with MinHash; an LSH band index
+    finds earlier inputs of the same scope that are likely similar, and the
+    best one by exact Jaccard similarity of the shingle sets is served when
+    it reaches the caller's threshold. Everything is computed locally.
+    Entries are evicted least recently used first, by count and by size.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[int]] = {}
+        self._next_id = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._similarity_sum = 0.0
+        self.counters = {"lookups": 0, "hits": 0, "exact_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self.last_similarity: Optional[float] = None
+
+    @staticmethod
+    def _bands(signature: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        return [signature[i * ROWS:(i + 1) * ROWS] for i in range(BANDS)]
+
+    def lookup(self, scope: str, text: str, threshold: float) -> Optional[NearHit]:
+        """Best cached answer for ``text`` in ``scope`` with similarity >= ``threshold``."""
+        normalized = normalize_text(text)
+        items = shingles(normalized)
+        signature = minhash(items) if items else ()
+        with self._lock:
+            self.counters["lookups"] += 1
+            best_id, best = self._exact.get((scope, normalized)), 0.0
+            if best_id is not None:
+                best = 1.0
+            elif signature:
+                candidates = set()
+                for band, rows in enumerate(self._bands(signature)):
+                    candidates |= self._buckets.get((scope, band, rows), set())
+                for entry_id in candidates:
+                    similarity = jaccard(items, self._entries[entry_id].shingles)
+                    if similarity > best:
+                        best_id, best = entry_id, similarity
+            self.last_similarity = round(best, 4) if best_id is not None else None
+            if best_id is None or best < threshold:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            if best == 1.0:
+                self.counters["exact_hits"] += 1
+            self._similarity_sum += best
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+        # Callers may modify what they get back (parsed JSON objects).
+        return NearHit(copy.deepcopy(entry.value), round(best, 4), entry.normalized)
+
+    def store(self, scope: str, text: str, value: Any) -> None:
+        normalized = normalize_text(text)
+        items = shingles(normalized)
+        if not items:
+            return
+        signature = minhash(items)
+        size = len(dumps_bytes(value)) + len(normalized) + sum(len(s) for s in items) + 8 * NUM_PERM
+        with self._lock:
+            previous = self._exact.get((scope, normalized))
+            if previous is not None:
+                self._remove(previous)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(scope, normalized, items, signature, value, size)
+            self._exact[(scope, normalized)] = entry_id
+            for band, rows in enumerate(self._bands(signature)):
+                self._buckets.setdefault((scope, band, rows), set()).add(entry_id)
+            self._bytes += size
+            self.counters["stores"] += 1
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self._exact.pop((entry.scope, entry.normalized), None)
+        for band, rows in enumerate(self._bands(entry.signature)):
+            key = (entry.scope, band, rows)
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+        self._bytes -= entry.size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters, entries=len(self._entries), bytes=self._bytes,
+                         last_similarity=self.last_similarity)
+            stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+            stats["mean_hit_similarity"] = round(self._similarity_sum / stats["hits"], 4) if stats["hits"] else None
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._exact.clear()
+            self._buckets.clear()
+            self._bytes = 0
+
+
+near_cache = NearDuplicateCache()
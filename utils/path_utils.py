@@ -0,0 +1,27 @@
+import os
+from functools import lru_cache
+
+PACK_DIRNAME = 'apachellmpack'
+
+
+@lru_cache(maxsize=None)
+def find_pack_root() -> str:
+    """Walk up from this package to the ``apachellmpack`` directory.
+
+    The result is cached for the life of the process, so the walk happens once
+    instead of on every history manager construction.
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    while os.path.basename(current_dir) != PACK_DIRNAME:
+        current_dir = os.path.dirname(current_dir)
+        if current_dir == os.path.dirname(current_dir):
+            raise FileNotFoundError(f"Could not find '{PACK_DIRNAME}' directory")
+    return current_dir
+
+
+@lru_cache(maxsize=None)
+def history_file_path(provider_dir: str, filename: str) -> str:
+    """Path of a history file under ``nodes/<provider_dir>``, creating the folder once."""
+    json_path = os.path.join(find_pack_root(), 'nodes', provider_dir, filename)
+    os.makedirs(os.path.dirname(json_path), exist_ok=True)
+    return json_path
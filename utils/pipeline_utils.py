@@ -0,0 +1,342 @@
+import re
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .cancel_utils import POLL_INTERVAL, CancelToken, background_execution
+from .json_utils import loads
+
+logger = logging.getLogger(__name__)
+
+# Where a downstream stage cuts the upstream text into requests, and what it
+# puts between the outputs of consecutive segments.
+BOUNDARIES = {
+    "sentence": " ",
+    "paragraph": "\n\n",
+    "json_object": "\n",
+    "complete": "",
+}
+# Sentences shorter than this are merged with the next one, so a stage does
+# not pay a request per "Yes." or list bullet.
+MIN_SENTENCE_CHARS = 40
+# Streams are kept this long after they finish (and at most MAX_STREAMS), so a
+# Collect node that re-runs while its stream node is cached still finds them.
+STREAM_TTL = 60 * 60
+MAX_STREAMS = 256
+
+_SENTENCE_END = re.compile(r'[.!?…。！？]+["\'\)\]”’]*\s+')
+_PARAGRAPH_END = re.compile(r'\n[ \t]*\n\s*')
+
+
+class StreamError(RuntimeError):
+    """Raised to readers of a stream whose producer failed."""
+
+
+class TokenStream:
+    """Append-only text stream written by one stage and read by any number of others.
+
+    Every reader starts from the first token, so a stream can feed a
+    downstream stage and a Collect node at the same time.
+    """
+
+    def __init__(self, description: str = "", token: Optional[CancelToken] = None,
+                 upstream: Optional["TokenStream"] = None):
+        self.description = description
+        self.token = token or CancelToken()
+        self.upstream = upstream
+        self._parts: List[str] = []
+        self._condition = threading.Condition()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.started_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.segments = 0
+
+    def put(self, text: str) -> None:
+        if not text:
+            return
+        with self._condition:
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+            self._parts.append(text)
+            self._condition.notify_all()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        with self._condition:
+            self.done = True
+            self.error = error
+            self.finished_at = time.monotonic()
+            self._condition.notify_all()
+
+    def cancel(self) -> None:
+        """Stop this stage and every stage feeding it."""
+        stream = self
+        while stream is not None:
+            stream.token.cancel()
+            stream = stream.upstream
+
+    def iter(self, token: Optional[CancelToken] = None) -> Iterator[str]:
+        """Tokens as they arrive; raises ``StreamError`` if the producer failed."""
+        token = token or CancelToken()
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self._parts) and not self.done:
+                    token.raise_if_cancelled()
+                    self._condition.wait(token.cap(POLL_INTERVAL))
+                parts = self._parts[index:]
+                index = len(self._parts)
+                finished, error = self.done and index == len(self._parts), self.error
+            yield from parts
+            if finished:
+                if error is not None:
+                    raise StreamError(f"{self.description or 'Upstream stage'} failed: {error}") from error
+                return
+
+    def text(self, token: Optional[CancelToken] = None) -> str:
+        """Wait for the end of the stream and return all of it."""
+        return "".join(self.iter(token))
+
+    def stats(self) -> Dict[str, Any]:
+        def since_start(moment):
+            return round(moment - self.started_at, 3) if moment is not None else None
+        with self._condition:
+            return {
+                "stage": self.description,
+                "segments": self.segments,
+                "chars": sum(len(part) for part in self._parts),
+                "first_token_s": since_start(self.first_token_at),
+                "finished_s": since_start(self.finished_at),
+                "error": str(self.error) if self.error else None,
+            }
+
+
+class Segmenter:
+    """Cuts streamed text at a boundary; ``feed`` returns the completed segments."""
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        return []
+
+    def flush(self) -> List[str]:
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+
+class _RegexSegmenter(Segmenter):
+    PATTERN = _PARAGRAPH_END
+    MIN_CHARS = 1
+
+    def feed(self, text: str) -> List[str]:
+        # Only the tail can hold a boundary that spans the new text.
+        search_from = max(0, len(self._buffer) - 8)
+        self._buffer += text
+        segments = []
+        cut = 0
+        for match in self.PATTERN.finditer(self._buffer, search_from):
+            if len(self._buffer[cut:match.start()].strip()) >= self.MIN_CHARS and match.end() < len(self._buffer):
+                segments.append(self._buffer[cut:match.end()].strip())
+                cut = match.end()
+        self._buffer = self._buffer[cut:]
+        return segments
+
+
+class SentenceSegmenter(_RegexSegmenter):
+    PATTERN = _SENTENCE_END
+    MIN_CHARS = MIN_SENTENCE_CHARS
+
+
+class ParagraphSegmenter(_RegexSegmenter):
+    PATTERN = _PARAGRAPH_END
+
+
+class JSONObjectSegmenter(Segmenter):
+    """Outermost ``{...}`` objects, also inside an array; prose around them is dropped."""
+
+    def __init__(self):
+        super().__init__()
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[str]:
+        segments = []
+        start = 0 if self._depth else None
+        for i, c in enumerate(text):
+            if self._depth == 0:
+                if c == '{':
+                    self._depth, start = 1, i
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in '{[':
+                self._depth += 1
+            elif c in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    segments.append(self._buffer + text[start:i + 1])
+                    self._buffer, start = "", None
+        if start is not None:
+            self._buffer += text[start:]
+        valid = []
+        for segment in segments:
+            try:
+                loads(segment)
+            except ValueError:
+                logger.warning("Skipping invalid JSON object in stream: %.200s", segment)
+                continue
+            valid.append(segment)
+        return valid
+
+    def flush(self) -> List[str]:
+        if self._buffer.strip():
+            logger.warning("Stream ended inside a JSON object; dropping %d chars", len(self._buffer))
+        self._buffer = ""
+        return []
+
+
+SEGMENTERS = {
+    "sentence": SentenceSegmenter,
+    "paragraph": ParagraphSegmenter,
+    "json_object": JSONObjectSegmenter,
+    "complete": Segmenter,
+}
+
+
+def iter_segments(chunks: Iterable[str], boundary: str) -> Iterator[str]:
+    """Segments of streamed text, each yielded as soon as its boundary arrives."""
+    segmenter = SEGMENTERS[boundary]()
+    for chunk in chunks:
+        yield from segmenter.feed(chunk)
+    yield from segmenter.flush()
+
+
+class _StreamRegistry:
+    def __init__(self):
+        self._streams: "OrderedDict[str, TokenStream]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for stream_id, stream in list(self._streams.items()):
+            expired = stream.finished_at is not None and now - stream.finished_at > STREAM_TTL
+            if (expired or len(self._streams) > MAX_STREAMS) and stream.done:
+                del self._streams[stream_id]
+
+    def add(self, stream: TokenStream) -> Dict[str, Any]:
+        handle = {"id": uuid.uuid4().hex, "description": stream.description}
+        with self._lock:
+            self._prune()
+            self._streams[handle["id"]] = stream
+        return handle
+
+    def get(self, handle: Dict[str, Any]) -> TokenStream:
+        with self._lock:
+            stream = self._streams.get(handle.get("id") if isinstance(handle, dict) else None)
+        if stream is None:
+            raise KeyError(f"Unknown or expired LLM stream {handle!r}; run its stream node again.")
+        return stream
+
+
+streams = _StreamRegistry()
+
+
+def _fill(part: TokenStream, request: Callable[[Optional[str]], Iterator[str]], segment: Optional[str]) -> None:
+    try:
+        with background_execution():
+            for delta in request(segment):
+                part.put(delta)
+    except BaseException as e:
+        part.close(e)
+    else:
+        part.close()
+
+
+def _produce(segments: Iterable[str], request: Callable[[Optional[str]], Iterator[str]],
+             executor: ThreadPoolExecutor, pending: "queue.Queue") -> None:
+    try:
+        with background_execution():
+            for segment in segments:
+                part = TokenStream()
+                executor.submit(_fill, part, request, segment)
+                pending.put(part)
+    except BaseException as e:
+        pending.put(e)
+    else:
+        pending.put(None)
+
+
+def _run_stage(out: TokenStream, upstream: Optional[TokenStream], boundary: str,
+               request: Callable[[Optional[str]], Iterator[str]], parallel: int) -> None:
+    token = out.token
+    if upstream is None:
+        _fill(out, request, None)
+        out.segments = 1
+        return
+    executor = ThreadPoolExecutor(max_workers=max(1, parallel), thread_name_prefix="apachellmpack-stream")
+    pending: "queue.Queue" = queue.Queue()
+    segments = iter_segments(upstream.iter(token), boundary)
+    threading.Thread(target=_produce, args=(segments, request, executor, pending),
+                     name="apachellmpack-stream-reader", daemon=True).start()
+    try:
+        with background_execution():
+            while True:
+                try:
+                    item = pending.get(timeout=token.cap(POLL_INTERVAL))
+                except queue.Empty:
+                    token.raise_if_cancelled()
+                    continue
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                if out.segments and BOUNDARIES[boundary]:
+                    out.put(BOUNDARIES[boundary])
+                # Segments are forwarded in order; later ones are already
+                # running and buffered while this one streams.
+                for delta in item.iter(token):
+                    out.put(delta)
+                out.segments += 1
+    except BaseException as e:
+        token.cancel()
+        out.close(e)
+    else:
+        out.close()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def start_stage(description: str, request: Callable[[Optional[str]], Iterator[str]],
+                upstream: Optional[TokenStream] = None, boundary: str = "sentence", parallel: int = 1,
+                token: Optional[CancelToken] = None) -> Tuple[Dict[str, Any], TokenStream]:
+    """Run one pipeline stage in the background; returns its handle and output stream.
+
+    Without ``upstream``, ``request(None)`` runs once. Otherwise the upstream
+    text is cut at ``boundary`` and ``request(segment)`` starts as soon as
+    each segment is complete, up to ``parallel`` at a time, so this stage
+    overlaps with the ones before it. ``request`` yields text deltas.
+    """
+    if boundary not in BOUNDARIES:
+        raise ValueError(f"Unknown boundary {boundary!r}; expected one of {', '.join(BOUNDARIES)}")
+    out = TokenStream(description, token, upstream)
+    handle = streams.add(out)
+    threading.Thread(target=_run_stage, args=(out, upstream, boundary, request, parallel),
+                     name="apachellmpack-stream-stage", daemon=True).start()
+    logger.debug("Started stream stage %s as %s", description, handle["id"])
+    return handle, out
@@ -0,0 +1,169 @@
+import os
+import logging
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Set to 1/true/yes/on to prefetch LLM results for queued prompts.
+PREFETCH_ENV = "APACHELLMPACK_PREFETCH"
+SCAN_INTERVAL = 0.5
+MAX_WORKERS = 4
+# Executed prompts whose node outputs may still be in ComfyUI's cache.
+HISTORY_LOOKBACK = 1
+
+
+def prefetch_enabled() -> bool:
+    return os.environ.get(PREFETCH_ENV, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def is_link(value: Any) -> bool:
+    """ComfyUI encodes a connected input as ``[source_node_id, output_index]``."""
+    return (isinstance(value, list) and len(value) == 2
+            and isinstance(value[0], str) and isinstance(value[1], int))
+
+
+def _comfy_queue() -> Tuple[list, list]:
+    from server import PromptServer
+    return PromptServer.instance.prompt_queue.get_current_queue()
+
+
+def _comfy_history() -> Iterable[Dict[str, Any]]:
+    """Prompts of the last executed queue items that completed."""
+    from server import PromptServer
+    history = PromptServer.instance.prompt_queue.get_history(max_items=HISTORY_LOOKBACK)
+    return [item["prompt"][2] for item in history.values() if item.get("status", {}).get("completed", True)]
+
+
+class PrefetchService:
+    """Looks ahead in the ComfyUI prompt queue and starts LLM calls early.
+
+    Every queued node whose class has a ``prefetch(**inputs)`` method and whose
+    inputs are all literal widget values is handed to that method on a worker
+    thread. The node stores the result in ``cache_utils.response_cache``, and
+    the real execution later picks it up instead of waiting on the network.
+
+    A node ComfyUI will answer from its own output cache never executes, so
+    it is not prefetched: one with the same class, inputs and ``IS_CHANGED``
+    value as a node of the last executed prompt or of a prompt queued ahead
+    of it.
+    """
+
+    def __init__(self, node_classes: Dict[str, type], get_queue: Callable[[], Tuple[list, list]] = _comfy_queue,
+                 interval: float = SCAN_INTERVAL, max_workers: int = MAX_WORKERS,
+                 get_history: Callable[[], Iterable[Dict[str, Any]]] = _comfy_history):
+        self.node_classes = {name: cls for name, cls in node_classes.items() if callable(getattr(cls, "prefetch", None))}
+        self.get_queue = get_queue
+        self.get_history = get_history
+        self.interval = interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="apachellmpack-prefetch")
+        self._instances: Dict[type, Any] = {}
+        self._instances_lock = threading.Lock()
+        self._seen: Set[Tuple[str, str]] = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="apachellmpack-prefetch-scan", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.scan_once()
+            except Exception as e:
+                logger.debug("Prefetch scan failed: %s", e)
+
+    def _signature(self, node_id: str, node: Dict[str, Any]) -> Optional[Hashable]:
+        """What ComfyUI's output cache knows a literal-input node by; ``None`` if it always runs."""
+        class_type = node.get("class_type")
+        cls = self.node_classes.get(class_type)
+        if cls is None:
+            return None
+        inputs = node.get("inputs", {})
+        if any(is_link(value) for value in inputs.values()):
+            return None
+        changed = None
+        if callable(getattr(cls, "IS_CHANGED", None)):
+            try:
+                changed = cls.IS_CHANGED(**inputs)
+            except Exception:
+                return None
+            if changed != changed:
+                # NaN: never cached.
+                return None
+        signature = (class_type, repr(changed), tuple(sorted((name, repr(value)) for name, value in inputs.items())))
+        if getattr(cls, "NOT_IDEMPOTENT", False):
+            signature += (node_id,)
+        return signature
+
+    def scan_once(self) -> int:
+        """Submit prefetches for newly queued nodes; returns how many were submitted."""
+        running, pending = self.get_queue()
+        cached = set()
+        for prompt in self.get_history():
+            cached.update(self._signature(node_id, node) for node_id, node in prompt.items())
+        submitted = 0
+        live = set()
+        # Queue items are (number, prompt_id, prompt, ...); pending is a heap.
+        for item in list(running) + sorted(pending, key=lambda item: item[0]):
+            prompt_id, prompt = item[1], item[2]
+            ahead = []
+            for node_id, node in prompt.items():
+                cls = self.node_classes.get(node.get("class_type"))
+                if cls is None:
+                    continue
+                key = (prompt_id, node_id)
+                live.add(key)
+                inputs = node.get("inputs", {})
+                if key in self._seen or any(is_link(value) for value in inputs.values()):
+                    continue
+                self._seen.add(key)
+                signature = self._signature(node_id, node)
+                ahead.append(signature)
+                if signature is not None and signature in cached:
+                    logger.debug("Not prefetching %s of %s: its output will come from ComfyUI's cache", node_id, prompt_id)
+                    continue
+                self._executor.submit(self._prefetch, cls, dict(inputs))
+                submitted += 1
+            cached.update(ahead)
+        # Forget prompts that have left the queue.
+        self._seen &= live
+        return submitted
+
+    def _instance(self, cls: type) -> Any:
+        with self._instances_lock:
+            instance = self._instances.get(cls)
+            if instance is None:
+                instance = self._instances[cls] = cls()
+            return instance
+
+    def _prefetch(self, cls: type, inputs: Dict[str, Any]) -> None:
+        try:
+            if self._instance(cls).prefetch(**inputs):
+                logger.debug("Prefetched %s", cls.__name__)
+        except Exception as e:
+            logger.debug("Prefetch for %s skipped: %s", cls.__name__, e)
+
+
+_service: Optional[PrefetchService] = None
+
+
+def start_prefetch(node_classes: Dict[str, type]) -> Optional[PrefetchService]:
+    """Start the queue lookahead if enabled and running inside ComfyUI."""
+    global _service
+    if _service is not None or not prefetch_enabled():
+        return _service
+    if importlib.util.find_spec("server") is None:
+        logger.info("Prefetch disabled: not running inside ComfyUI")
+        return None
+    _service = PrefetchService(node_classes)
+    _service.start()
+    logger.info("Prefetching LLM results for %d node types", len(_service.node_classes))
+    return _service
@@ -0,0 +1,237 @@
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+from urllib.parse import urlsplit
+
+from .cancel_utils import POLL_INTERVAL, CancelToken
+
+logger = logging.getLogger(__name__)
+
+# Share of the provider's concurrency and token rate each class gets while
+# all of them have requests waiting.
+WEIGHTS = {"interactive": 8.0, "normal": 3.0, "bulk": 1.0}
+PRIORITIES = tuple(WEIGHTS)
+DEFAULT_PRIORITY = "normal"
+
+# Defaults for the optional ``[API]`` settings of a provider config.
+DEFAULT_MAX_CONCURRENCY = 32
+# Slots only interactive requests may use, so they never queue behind
+# background work.
+DEFAULT_INTERACTIVE_RESERVE = 2
+# Share of the token rate kept for interactive requests.
+INTERACTIVE_TOKEN_SHARE = 0.2
+# Waits longer than this are logged.
+SLOW_WAIT = 0.25
+
+_current_priority: ContextVar[str] = ContextVar("apachellmpack_priority", default=DEFAULT_PRIORITY)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+@contextmanager
+def request_priority(priority: str) -> Iterator[None]:
+    """Requests sent inside the block are scheduled in ``priority``'s class."""
+    if priority not in WEIGHTS:
+        raise ValueError(f"Unknown priority {priority!r}; expected one of {', '.join(PRIORITIES)}")
+    reset = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(reset)
+
+
+def with_priority(priority: str) -> Callable:
+    """Decorator form of ``request_priority`` for node methods."""
+    def decorate(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with request_priority(priority):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def estimate_cost(payload: Dict[str, Any]) -> int:
+    """Tokens a request may use against a tokens-per-minute limit."""
+    prompt = payload.get("messages") or payload.get("prompt") or ""
+    chars = len(prompt) if isinstance(prompt, str) else sum(len(str(m.get("content") or "")) for m in prompt)
+    return chars // 4 + int(payload.get("max_tokens") or payload.get("max_completion_tokens") or 0)
+
+
+class _Waiter:
+    __slots__ = ("priority", "cost", "tag", "enqueued_at")
+
+    def __init__(self, priority: str, cost: int, tag: float):
+        self.priority = priority
+        self.cost = cost
+        self.tag = tag
+        self.enqueued_at = time.monotonic()
+
+
+class FairScheduler:
+    """Weighted-fair admission of requests to one provider.
+
+    Each waiting request gets a virtual finish tag that grows by
+    ``1 / weight`` per request of its class, and the startable request
+    with the smallest tag goes first. A busy bulk class therefore cannot
+    delay an interactive request by more than a few tags, however long
+    its queue is. On top of that, ``interactive_reserve`` slots and a
+    share of the token rate are kept free of other classes, so an
+    interactive request finds capacity at once even while bulk work
+    saturates everything else.
+    """
+
+    def __init__(self, name: str, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 interactive_reserve: int = DEFAULT_INTERACTIVE_RESERVE, tokens_per_minute: float = 0.0):
+        self.name = name
+        self._condition = threading.Condition()
+        self._queues: Dict[str, Deque[_Waiter]] = {p: deque() for p in PRIORITIES}
+        self._last_tag = {p: 0.0 for p in PRIORITIES}
+        self._virtual_time = 0.0
+        self._active = {p: 0 for p in PRIORITIES}
+        self._tokens = 0.0
+        self._refilled_at = time.monotonic()
+        self.stats = {p: {"requests": 0, "waited": 0, "wait_time": 0.0, "max_wait": 0.0} for p in PRIORITIES}
+        self.configure(max_concurrency, interactive_reserve, tokens_per_minute)
+
+    def configure(self, max_concurrency: int, interactive_reserve: int, tokens_per_minute: float) -> None:
+        with self._condition:
+            self.max_concurrency = max(1, max_concurrency)
+            self.interactive_reserve = max(0, min(interactive_reserve, self.max_concurrency - 1))
+            if tokens_per_minute != getattr(self, "tokens_per_minute", None):
+                self._tokens = tokens_per_minute
+            self.tokens_per_minute = tokens_per_minute
+            self._condition.notify_all()
+
+    def _refill(self, now: float) -> None:
+        if self.tokens_per_minute > 0:
+            self._tokens = min(self.tokens_per_minute,
+                               self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60.0)
+        self._refilled_at = now
+
+    def _can_start(self, waiter: _Waiter) -> bool:
+        interactive = waiter.priority == "interactive"
+        limit = self.max_concurrency if interactive else self.max_concurrency - self.interactive_reserve
+        if sum(self._active.values()) >= limit:
+            return False
+        if self.tokens_per_minute > 0:
+            floor = 0.0 if interactive else self.tokens_per_minute * INTERACTIVE_TOKEN_SHARE
+            # A request larger than the whole bucket waits for a full one.
+            if self._tokens - floor < min(waiter.cost, self.tokens_per_minute - floor):
+                return False
+        return True
+
+    def _next(self) -> Optional[_Waiter]:
+        heads = sorted((queue[0] for queue in self._queues.values() if queue), key=lambda w: w.tag)
+        for waiter in heads:
+            if self._can_start(waiter):
+                return waiter
+        return None
+
+    def acquire(self, priority: str, cost: int = 0, token: Optional[CancelToken] = None) -> float:
+        """Block until the request may be sent; returns the time spent waiting."""
+        token = token or CancelToken()
+        with self._condition:
+            tag = max(self._virtual_time, self._last_tag[priority]) + 1.0 / WEIGHTS[priority]
+            self._last_tag[priority] = tag
+            waiter = _Waiter(priority, cost, tag)
+            self._queues[priority].append(waiter)
+            try:
+                while True:
+                    self._refill(time.monotonic())
+                    if self._next() is waiter:
+                        break
+                    token.raise_if_cancelled()
+                    self._condition.wait(token.cap(POLL_INTERVAL))
+            except BaseException:
+                self._queues[priority].remove(waiter)
+                self._condition.notify_all()
+                raise
+            self._queues[priority].popleft()
+            self._virtual_time = tag
+            self._active[priority] += 1
+            if self.tokens_per_minute > 0:
+                self._tokens -= cost
+            waited = time.monotonic() - waiter.enqueued_at
+            stats = self.stats[priority]
+            stats["requests"] += 1
+            if waited > POLL_INTERVAL / 2:
+                stats["waited"] += 1
+            stats["wait_time"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+            # Others may be startable now too (e.g. a freed token budget).
+            self._condition.notify_all()
+        if waited > SLOW_WAIT:
+            logger.debug("%s request to %s waited %.2fs for capacity", priority, self.name, waited)
+        return waited
+
+    def release(self, priority: str) -> None:
+        with self._condition:
+            self._active[priority] -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str, cost: int = 0, token: Optional[CancelToken] = None) -> Iterator[None]:
+        self.acquire(priority, cost, token)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def describe(self) -> Dict[str, Any]:
+        with self._condition:
+            classes = {}
+            for priority, stats in self.stats.items():
+                classes[priority] = dict(stats, wait_time=round(stats["wait_time"], 4), max_wait=round(stats["max_wait"], 4),
+                                         active=self._active[priority], queued=len(self._queues[priority]),
+                                         mean_wait=round(stats["wait_time"] / stats["requests"], 4) if stats["requests"] else 0.0)
+            return {"max_concurrency": self.max_concurrency, "interactive_reserve": self.interactive_reserve,
+                    "tokens_per_minute": self.tokens_per_minute, "classes": classes}
+
+
+class _Schedulers:
+    """One scheduler per provider host, with limits from the provider config."""
+
+    def __init__(self):
+        self._schedulers: Dict[str, FairScheduler] = {}
+        self._configs: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _provider_config(host: str):
+        from .provider_utils import PROVIDER_NAMES, get_base_url, load_provider_config
+        for provider in PROVIDER_NAMES:
+            if urlsplit(get_base_url(provider)).netloc == host:
+                return load_provider_config(provider)
+        return None
+
+    def get(self, url: str) -> FairScheduler:
+        host = urlsplit(url).netloc
+        config = self._provider_config(host)
+        with self._lock:
+            scheduler = self._schedulers.get(host)
+            if scheduler is None:
+                scheduler = self._schedulers[host] = FairScheduler(host)
+            if config is None or self._configs.get(host) is config:
+                return scheduler
+            # Shared configs are replaced on reload, so identity means unchanged.
+            self._configs[host] = config
+        scheduler.configure(config.getint('API', 'max_concurrency', fallback=DEFAULT_MAX_CONCURRENCY),
+                            config.getint('API', 'interactive_reserve', fallback=DEFAULT_INTERACTIVE_RESERVE),
+                            config.getfloat('API', 'tokens_per_minute', fallback=0.0))
+        return scheduler
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            schedulers = dict(self._schedulers)
+        return {host: scheduler.describe() for host, scheduler in schedulers.items()}
+
+
+schedulers = _Schedulers()
@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Dict, List, Optional
+
+from .path_utils import find_pack_root
+
+logger = logging.getLogger(__name__)
+
+# Set to 1 to profile every execution of the wrapped node methods; the
+# ``profile`` input of a node turns it on for that node only.
+PROFILE_ENV = "APACHELLMPACK_PROFILE"
+# ``collapsed``: sampling profiler, one ``frame;frame;frame count`` line per
+# stack (flamegraph.pl, speedscope). ``pstats``: cProfile, for ``pstats``/snakeviz.
+PROFILE_FORMAT_ENV = "APACHELLMPACK_PROFILE_FORMAT"
+# Write one file per this many executions of a node.
+PROFILE_EVERY_ENV = "APACHELLMPACK_PROFILE_EVERY"
+PROFILE_INTERVAL_ENV = "APACHELLMPACK_PROFILE_INTERVAL"
+# Set to 0 to skip tracemalloc, which slows allocations down noticeably.
+PROFILE_MEMORY_ENV = "APACHELLMPACK_PROFILE_MEMORY"
+PROFILE_DIR_ENV = "APACHELLMPACK_PROFILE_DIR"
+
+FORMATS = ("collapsed", "pstats")
+DEFAULT_INTERVAL = 0.005
+PROFILES_DIRNAME = 'profiles'
+MEMORY_TOP = 25
+MAX_STACK_DEPTH = 128
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name, "").strip().lower()
+    if not value:
+        return default
+    return value in ("1", "true", "yes", "on")
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, "") or default)
+    except ValueError:
+        logger.warning("Ignoring invalid %s", name)
+        return default
+
+
+enabled = _env_flag(PROFILE_ENV)
+profile_format = os.environ.get(PROFILE_FORMAT_ENV, "collapsed").strip().lower()
+if profile_format not in FORMATS:
+    logger.warning("Unknown %s=%s; using collapsed", PROFILE_FORMAT_ENV, profile_format)
+    profile_format = "collapsed"
+
+_local = threading.local()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class StackSampler:
+    """Samples one thread's Python stack every ``interval`` seconds.
+
+    Time spent waiting (network, locks, sleeps) shows up under the frame
+    that waits, so the counts are wall-clock rather than CPU time.
+    """
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="apachellmpack-profiler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[str] = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class _Session:
+    """What one profiled execution collects."""
+
+    def __init__(self, label: str, memory: bool, interval: float):
+        self.label = label
+        self.timings: Dict[str, List[float]] = {}
+        self.started_at = time.perf_counter()
+        self.wall = 0.0
+        self.sampler = None
+        self.profile = None
+        self.memory = memory and not tracemalloc.is_tracing()
+        self.memory_start = None
+        self.memory_end = None
+        self.memory_peak = 0
+        if profile_format == "pstats":
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.sampler = StackSampler(threading.get_ident(), interval)
+            self.sampler.start()
+        # Traced after the profiler started, so its own setup is not counted.
+        if self.memory:
+            tracemalloc.start()
+            self.memory_start = tracemalloc.take_snapshot()
+
+    def finish(self) -> None:
+        if self.profile is not None:
+            self.profile.disable()
+        if self.memory:
+            self.memory_peak = tracemalloc.get_traced_memory()[1]
+            ignored = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            self.memory_end = tracemalloc.take_snapshot().filter_traces(ignored)
+            tracemalloc.stop()
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.wall = time.perf_counter() - self.started_at
+
+
+class _Aggregate:
+    """Executions of one node label since its last written file."""
+
+    def __init__(self):
+        self.executions = 0
+        self.wall = 0.0
+        self.stacks: Counter = Counter()
+        self.stats = None
+        self.timings: Dict[str, List[float]] = {}
+        self.memory: Counter = Counter()
+        self.memory_peak = 0
+
+    def add(self, session: _Session) -> None:
+        self.executions += 1
+        self.wall += session.wall
+        if session.sampler is not None:
+            self.stacks.update(session.sampler.stacks)
+        if session.profile is not None:
+            import pstats
+            if self.stats is None:
+                self.stats = pstats.Stats(session.profile)
+            else:
+                self.stats.add(session.profile)
+        for name, (count, total, longest) in session.timings.items():
+            timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += count
+            timing[1] += total
+            timing[2] = max(timing[2], longest)
+        self.memory_peak = max(self.memory_peak, session.memory_peak)
+        if session.memory_end is not None:
+            for stat in session.memory_end.compare_to(session.memory_start, "lineno"):
+                frame = stat.traceback[0]
+                self.memory[f"{frame.filename}:{frame.lineno}"] += stat.size_diff
+
+
+class ProfileWriter:
+    """Collects profiled executions per node and writes them every ``every`` runs."""
+
+    def __init__(self, directory: Optional[str] = None, every: int = 1):
+        self._directory = directory
+        self.every = max(1, every)
+        self._aggregates: Dict[str, _Aggregate] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> str:
+        return self._directory or os.path.join(find_pack_root(), PROFILES_DIRNAME)
+
+    def add(self, session: _Session) -> Optional[str]:
+        with self._lock:
+            aggregate = self._aggregates.setdefault(session.label, _Aggregate())
+            aggregate.add(session)
+            if aggregate.executions < self.every:
+                return None
+            del self._aggregates[session.label]
+        return self.write(session.label, aggregate)
+
+    def write(self, label: str, aggregate: _Aggregate) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        base = os.path.join(self.directory, f"{label}-{stamp}")
+        if aggregate.stats is not None:
+            path = base + ".pstats"
+            aggregate.stats.dump_stats(path)
+        else:
+            path = base + ".collapsed"
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in aggregate.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        lines = [f"{label}: {aggregate.executions} execution(s), {aggregate.wall:.3f}s wall",
+                 f"{'timer':<24} {'calls':>7} {'total s':>9} {'max s':>9}"]
+        for name, (count, total, longest) in sorted(aggregate.timings.items()):
+            lines.append(f"{name:<24} {count:>7} {total:>9.4f} {longest:>9.4f}")
+        if aggregate.memory:
+            lines.append("")
+            lines.append(f"peak traced memory: {aggregate.memory_peak} bytes")
+            lines.append(f"allocation growth, top {MEMORY_TOP} lines (bytes):")
+            for place, size in aggregate.memory.most_common(MEMORY_TOP):
+                lines.append(f"{size:>12} {place}")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        logger.info("Wrote profile of %s to %s", label, path)
+        return path
+
+
+writer = ProfileWriter(os.environ.get(PROFILE_DIR_ENV) or None, int(_env_number(PROFILE_EVERY_ENV, 1)))
+
+
+def profiled(label: str) -> Callable:
+    """Profile a node method when profiling is on (env or its ``profile`` input).
+
+    The ``profile`` keyword is consumed here. With profiling off the cost is
+    one flag check per call.
+    """
+    def decorate(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not kwargs.pop("profile", False) and not enabled:
+                return fn(*args, **kwargs)
+            if getattr(_local, "session", None) is not None:
+                return fn(*args, **kwargs)
+            session = _Session(label, _env_flag(PROFILE_MEMORY_ENV, True),
+                               _env_number(PROFILE_INTERVAL_ENV, DEFAULT_INTERVAL))
+            _local.session = session
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _local.session = None
+                session.finish()
+                try:
+                    writer.add(session)
+                except OSError as e:
+                    logger.warning("Could not write profile of %s: %s", label, e)
+        return wrapper
+    return decorate
+
+
+def timed(name: str) -> Callable:
+    """Record calls of the wrapped function in the running profile, if any."""
+    def decorate(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            session = getattr(_local, "session", None)
+            if session is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                timing = session.timings.setdefault(name, [0, 0.0, 0.0])
+                timing[0] += 1
+                timing[1] += elapsed
+                timing[2] = max(timing[2], elapsed)
+        return wrapper
+    return decorate
@@ -0,0 +1,121 @@
+import os
+import logging
+from configparser import ConfigParser
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cancel_utils import CancelToken
+from .retry_utils import post_json_with_retry
+from .json_utils import parse_response
+from .registry_utils import SharedConfig, shared
+from .usage_utils import note_usage
+
+logger = logging.getLogger(__name__)
+
+NODES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'nodes')
+
+# Provider-agnostic description of the three OpenAI compatible backends, used
+# by nodes that are not tied to a single provider.
+PROVIDERS = {
+    "groq": {
+        "dir": os.path.join(NODES_DIR, 'groq'),
+        "config": os.path.join(NODES_DIR, 'groq', 'GroqConfig.ini'),
+        "base_url": "https://api.groq.com/openai/v1",
+        "supports_seed": True,
+        "supports_batch": True,
+    },
+    "cerebras": {
+        "dir": os.path.join(NODES_DIR, 'cerebras'),
+        "config": os.path.join(NODES_DIR, 'cerebras', 'cerebrasConfig.ini'),
+        "base_url": "https://api.cerebras.ai/v1",
+        "supports_seed": True,
+        "supports_batch": False,
+    },
+    "sambanova": {
+        "dir": os.path.join(NODES_DIR, 'Nova'),
+        "config": os.path.join(NODES_DIR, 'Nova', 'SambaNovaConfig.ini'),
+        "base_url": "https://api.sambanova.ai/v1",
+        "supports_seed": False,
+        "supports_batch": False,
+    },
+}
+
+PROVIDER_NAMES = list(PROVIDERS.keys())
+
+
+def get_provider(provider: str) -> Dict[str, Any]:
+    try:
+        return PROVIDERS[provider.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown provider '{provider}'. Expected one of {PROVIDER_NAMES}")
+
+
+def load_provider_config(provider: str) -> ConfigParser:
+    """The provider's shared config (file plus environment overrides); read-only."""
+    provider = provider.lower()
+    path = get_provider(provider)["config"]
+    return shared.get("config", provider, lambda: SharedConfig(provider, path)).current()
+
+
+def prompt_files(provider: str) -> List[str]:
+    """The provider's default and user preset files."""
+    directory = get_provider(provider)["dir"]
+    return [os.path.join(directory, 'DefaultPrompts.json'), os.path.join(directory, 'UserPrompts.json')]
+
+
+def get_api_key(provider: str) -> str:
+    return load_provider_config(provider).get('API', 'key', fallback='')
+
+
+def get_base_url(provider: str) -> str:
+    spec = get_provider(provider)
+    return load_provider_config(provider).get('API', 'base_url', fallback=spec["base_url"]).rstrip('/')
+
+
+def get_headers(provider: str) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {get_api_key(provider)}", "Content-Type": "application/json"}
+
+
+def build_chat_payload(provider: str, model: str, messages: List[Dict[str, str]], **params) -> Dict[str, Any]:
+    payload = {"model": model, "messages": messages}
+    for name, value in params.items():
+        if value is None:
+            continue
+        if name == "seed" and not get_provider(provider)["supports_seed"]:
+            continue
+        payload[name] = value
+    return payload
+
+
+def chat_completion(provider: str, model: str, messages: List[Dict[str, str]],
+                    token: Optional[CancelToken] = None, max_retries: int = 3,
+                    **params) -> Tuple[str, Dict[str, Any]]:
+    """Run one chat completion against ``provider``; returns ``(text, response_json)``.
+
+    Transient failures are retried up to ``max_retries`` attempts. Raises
+    ``requests`` exceptions for transport/HTTP errors and ``ValueError`` for a
+    response without choices.
+    """
+    url = f"{get_base_url(provider)}/chat/completions"
+    payload = build_chat_payload(provider, model, messages, **params)
+    response = post_json_with_retry(url, get_headers(provider), payload, max_retries, token=token)
+    response.raise_for_status()
+    body = parse_response(response)
+    note_usage(body.get('usage'))
+    choices = body.get('choices')
+    if not choices:
+        raise ValueError("Unexpected API response format: no choices")
+    return choices[0]['message']['content'], body
+
+
+def parse_targets(text: str, default_provider: str, default_model: str) -> List[Tuple[str, str]]:
+    """Parse ``provider:model`` lines; an empty input yields the defaults."""
+    targets = []
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        provider, _, model = line.partition(':')
+        provider = provider.strip().lower()
+        get_provider(provider)
+        targets.append((provider, model.strip() or default_model))
+    return targets or [(default_provider, default_model)]
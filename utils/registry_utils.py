@@ -0,0 +1,158 @@
+import os
+import time
+import logging
+import threading
+from configparser import ConfigParser
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# A config file is stat()ed at most this often to pick up edits.
+CONFIG_CHECK_INTERVAL = 2.0
+# ``APACHELLMPACK_<PROVIDER>__<SECTION>__<OPTION>`` overrides any config value,
+# e.g. ``APACHELLMPACK_GROQ__API__BASE_URL``.
+ENV_PREFIX = "APACHELLMPACK_"
+# Conventional API key variables, applied to ``[API] key``.
+API_KEY_ENV = {
+    "groq": "GROQ_API_KEY",
+    "cerebras": "CEREBRAS_API_KEY",
+    "sambanova": "SAMBANOVA_API_KEY",
+}
+# Spelling of the sections the pack reads, for overrides of absent sections.
+KNOWN_SECTIONS = ("API", "History", "Pricing")
+
+
+class SharedRegistry:
+    """Process-wide home of the resources nodes used to build per instance.
+
+    Entries are keyed by ``(kind, name)`` — e.g. ``("config", "groq")`` or
+    ``("history", "cerebras")`` — and created once by their factory, so node
+    constructors and ``INPUT_TYPES`` only borrow warm objects. Factories run
+    outside the registry lock; concurrent first calls for the same key wait
+    for a single construction.
+    """
+
+    def __init__(self):
+        self._entries: Dict[tuple, Any] = {}
+        self._pending: Dict[tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, name: str, factory: Callable[[], Any]) -> Any:
+        key = (kind, name)
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    return self._entries[key]
+                waiter = self._pending.get(key)
+                if waiter is None:
+                    waiter = self._pending[key] = threading.Event()
+                    break
+            waiter.wait()
+        try:
+            value = factory()
+            with self._lock:
+                self._entries[key] = value
+            return value
+        finally:
+            with self._lock:
+                del self._pending[key]
+            waiter.set()
+
+    def peek(self, kind: str, name: str) -> Any:
+        with self._lock:
+            return self._entries.get((kind, name))
+
+    def items(self, kind: str) -> Dict[str, Any]:
+        with self._lock:
+            return {name: value for (k, name), value in self._entries.items() if k == kind}
+
+    def discard(self, kind: str, name: Optional[str] = None) -> None:
+        """Drop one entry, or every entry of ``kind``; the next ``get`` rebuilds it."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == kind and (name is None or key[1] == name)]:
+                del self._entries[key]
+
+    def describe(self) -> Dict[str, List[str]]:
+        result: Dict[str, List[str]] = {}
+        with self._lock:
+            for kind, name in self._entries:
+                result.setdefault(kind, []).append(name)
+        return result
+
+
+shared = SharedRegistry()
+
+
+def _section_name(config: ConfigParser, name: str) -> str:
+    """Environment names are upper case; match them to the file's sections."""
+    for section in list(config.sections()) + list(KNOWN_SECTIONS):
+        if section.lower() == name.lower():
+            return section
+    return name
+
+
+def _env_overrides(provider: str) -> Dict[str, Dict[str, str]]:
+    overrides: Dict[str, Dict[str, str]] = {}
+    prefix = f"{ENV_PREFIX}{provider.upper()}__"
+    for name, value in os.environ.items():
+        if not name.startswith(prefix):
+            continue
+        section, _, option = name[len(prefix):].partition("__")
+        if section and option:
+            overrides.setdefault(section, {})[option.lower()] = value
+    key = os.environ.get(API_KEY_ENV.get(provider, ""), "")
+    if key:
+        overrides.setdefault("API", {})["key"] = key
+    return overrides
+
+
+class SharedConfig:
+    """A provider's ``.ini`` file with environment overrides, reloaded on change.
+
+    ``current()`` returns a parser that is replaced, never modified, when the
+    file's mtime or size changes, so callers must treat it as read-only.
+    Environment variables win over the file.
+    """
+
+    def __init__(self, provider: str, path: str):
+        self.provider = provider
+        self.path = path
+        self._stamp = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._config = self._load()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> ConfigParser:
+        config = ConfigParser()
+        self._stamp = self._file_stamp()
+        if self._stamp is None:
+            logger.warning("Config file %s not found; using defaults and environment overrides", self.path)
+        else:
+            config.read(self.path)
+        for section, options in _env_overrides(self.provider).items():
+            section = _section_name(config, section)
+            if not config.has_section(section):
+                config.add_section(section)
+            for option, value in options.items():
+                config.set(section, option, value.replace("%", "%%"))
+        self._checked_at = time.monotonic()
+        return config
+
+    def current(self) -> ConfigParser:
+        if time.monotonic() - self._checked_at < CONFIG_CHECK_INTERVAL:
+            return self._config
+        with self._lock:
+            if time.monotonic() - self._checked_at >= CONFIG_CHECK_INTERVAL:
+                if self._file_stamp() != self._stamp:
+                    logger.info("Reloading %s config from %s", self.provider, self.path)
+                    self._config = self._load()
+                else:
+                    self._checked_at = time.monotonic()
+            return self._config
@@ -0,0 +1,216 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from .archive_utils import ConversationArchive
+from .branch_utils import is_fork, resolve
+from .json_utils import dump_file, dumps_bytes, load_file
+from .provider_utils import load_provider_config
+
+logger = logging.getLogger(__name__)
+
+ACCESS_SUFFIX = ".access.json"
+ARCHIVE_SUFFIX = ".archive.llmarc"
+
+# Defaults when the provider config has no [History] section. Limits are
+# opt-in: evicted conversation ids start over with an empty history.
+DEFAULT_MAX_CONVERSATIONS = 0
+DEFAULT_MAX_TOTAL_BYTES = 0
+DEFAULT_TTL_DAYS = 0.0
+# At most this many TTL evictions per save, so a long idle period is paid
+# off over several saves instead of one large pass.
+DEFAULT_COMPACTION_BATCH = 32
+
+
+class RetentionPolicy:
+    """Limits for one history file; 0 disables a limit.
+
+    ``max_conversations`` and ``max_total_bytes`` are enforced on every save,
+    oldest-accessed first. A store over a limit is trimmed to a little below
+    it (``compaction_batch`` conversations, at most 10% of the limit), so
+    evictions and archive appends come in batches rather than one per new
+    conversation. ``ttl`` (seconds since last access) is applied
+    incrementally, ``compaction_batch`` conversations per save.
+    """
+
+    def __init__(self, max_conversations: int = DEFAULT_MAX_CONVERSATIONS,
+                 max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES, ttl: float = DEFAULT_TTL_DAYS * 86400,
+                 compaction_batch: int = DEFAULT_COMPACTION_BATCH, archive: bool = True):
+        self.max_conversations = max_conversations
+        self.max_total_bytes = max_total_bytes
+        self.ttl = ttl
+        self.compaction_batch = compaction_batch
+        self.archive = archive
+
+    @classmethod
+    def for_provider(cls, provider: str, **defaults) -> "RetentionPolicy":
+        """Build a policy from the ``[History]`` section of the provider config."""
+        policy = cls(**defaults)
+        try:
+            config = load_provider_config(provider)
+        except Exception as e:
+            logger.debug("No retention config for %s: %s", provider, e)
+            return policy
+        if not config.has_section('History'):
+            return policy
+        section = config['History']
+        policy.max_conversations = section.getint('max_conversations', fallback=policy.max_conversations)
+        policy.max_total_bytes = section.getint('max_total_bytes', fallback=policy.max_total_bytes)
+        policy.ttl = section.getfloat('ttl_days', fallback=policy.ttl / 86400) * 86400
+        policy.compaction_batch = section.getint('compaction_batch', fallback=policy.compaction_batch)
+        policy.archive = section.getboolean('archive', fallback=policy.archive)
+        return policy
+
+
+class ConversationRetention:
+    """Tracks last access per conversation and evicts by policy during saves.
+
+    Access times live in memory and are flushed to a small sidecar file with
+    each history save, so reads never cause extra writes. One instance is
+    shared by every manager of the same history file (see ``get_retention``).
+    """
+
+    def __init__(self, history_file: str, policy: RetentionPolicy):
+        self.history_file = history_file
+        self.policy = policy
+        self.access_file = history_file + ACCESS_SUFFIX
+        self.archive_file = history_file + ARCHIVE_SUFFIX
+        self._lock = threading.Lock()
+        self._access: Dict[str, float] = {}
+        # Conversations without a recorded access count as accessed now, so
+        # existing histories are not evicted all at once on upgrade.
+        self._baseline = time.time()
+        self._warned = False
+        self._load_access()
+
+    def _load_access(self) -> None:
+        try:
+            data = load_file(self.access_file) if os.path.exists(self.access_file) else None
+        except Exception as e:
+            logger.warning("Could not read access times %s: %s", self.access_file, e)
+            data = None
+        if isinstance(data, dict):
+            self._access = {k: float(v) for k, v in data.items()}
+
+    def touch(self, conversation_id: str) -> None:
+        with self._lock:
+            self._access[conversation_id] = time.time()
+
+    def forget(self, conversation_ids: Iterable[str]) -> None:
+        with self._lock:
+            for conversation_id in conversation_ids:
+                self._access.pop(conversation_id, None)
+
+    def last_access(self, conversation_id: str) -> float:
+        return self._access.get(conversation_id, self._baseline)
+
+    def compact(self, conversations: "OrderedDict[str, Any]") -> List[str]:
+        """Evict from ``conversations`` in place; returns the evicted ids.
+
+        Evicted conversations are appended to the compressed cold archive
+        (``archive_utils``), one block each.
+        """
+        policy = self.policy
+        now = time.time()
+        with self._lock:
+            # Least recently accessed first; insertion order breaks ties.
+            order = sorted(conversations, key=self.last_access)
+            evict = []
+
+            if policy.ttl > 0:
+                for conversation_id in order:
+                    if len(evict) >= policy.compaction_batch or now - self.last_access(conversation_id) <= policy.ttl:
+                        break
+                    evict.append(conversation_id)
+
+            evicted = set(evict)
+            remaining = [c for c in order if c not in evicted]
+            if policy.max_conversations > 0:
+                excess = len(remaining) - policy.max_conversations
+                if excess > 0:
+                    # Never evict the most recent conversation (the one being saved).
+                    excess = min(excess + min(policy.compaction_batch, policy.max_conversations // 10), len(remaining) - 1)
+                    evict.extend(remaining[:excess])
+                    remaining = remaining[excess:]
+
+            if policy.max_total_bytes > 0:
+                # The file size from the previous save is a good enough
+                # estimate and saves serializing the whole history twice.
+                size = os.path.getsize(self.history_file) if os.path.exists(self.history_file) else 0
+                size -= sum(len(dumps_bytes(conversations[c])) for c in evict)
+                if size > policy.max_total_bytes:
+                    target = policy.max_total_bytes - policy.max_total_bytes // 10
+                    while size > target and len(remaining) > 1:
+                        conversation_id = remaining.pop(0)
+                        evict.append(conversation_id)
+                        size -= len(dumps_bytes(conversations[conversation_id]))
+
+            evict = self._keep_fork_parents(conversations, evict)
+            if not evict:
+                return []
+            # Archived forks are stored resolved, so the archive stands alone.
+            records = [{"id": c, "evicted_at": now, "last_access": self.last_access(c), "messages": resolve(conversations, c)}
+                       for c in evict]
+            for conversation_id in evict:
+                del conversations[conversation_id]
+                self._access.pop(conversation_id, None)
+
+        if policy.archive:
+            try:
+                with ConversationArchive(self.archive_file) as archive:
+                    archive.append(records)
+            except (OSError, ValueError) as e:
+                logger.error("Could not archive %d evicted conversations: %s", len(records), e)
+        if not self._warned:
+            self._warned = True
+            logger.warning("History retention evicted %d conversations from %s (max_conversations=%d, max_total_bytes=%d, "
+                           "ttl_days=%g)%s. Their ids start over with an empty history. Change the [History] section of "
+                           "the provider config to keep more.", len(evict), self.history_file, policy.max_conversations,
+                           policy.max_total_bytes, policy.ttl / 86400,
+                           f"; they are kept in {self.archive_file}" if policy.archive else "")
+        else:
+            logger.info("Evicted %d conversations from %s", len(evict), os.path.basename(self.history_file))
+        return evict
+
+    @staticmethod
+    def _keep_fork_parents(conversations: "OrderedDict[str, Any]", evict: List[str]) -> List[str]:
+        """Drop conversations that a staying fork still shares messages with."""
+        evicted = set(evict)
+        while True:
+            needed = {record["parent"] for cid, record in conversations.items()
+                      if cid not in evicted and is_fork(record)} & evicted
+            if not needed:
+                return [c for c in evict if c in evicted]
+            evicted -= needed
+
+    def flush(self, conversations: Optional[Iterable[str]] = None) -> None:
+        """Persist access times, dropping entries for conversations that no longer exist."""
+        with self._lock:
+            if conversations is not None:
+                live = set(conversations)
+                self._access = {k: v for k, v in self._access.items() if k in live}
+            snapshot = dict(self._access)
+        tmp_path = self.access_file + ".tmp"
+        try:
+            dump_file(tmp_path, snapshot)
+            os.replace(tmp_path, self.access_file)
+        except OSError as e:
+            logger.warning("Could not save access times %s: %s", self.access_file, e)
+
+
+_retentions: Dict[str, ConversationRetention] = {}
+_retentions_lock = threading.Lock()
+
+
+def get_retention(history_file: str, policy: RetentionPolicy) -> ConversationRetention:
+    """Shared retention state for ``history_file``; the latest policy wins."""
+    with _retentions_lock:
+        retention = _retentions.get(history_file)
+        if retention is None:
+            retention = _retentions[history_file] = ConversationRetention(history_file, policy)
+        else:
+            retention.policy = policy
+        return retention
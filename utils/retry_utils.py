@@ -0,0 +1,173 @@
+import time
+import uuid
+import random
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Optional
+
+import requests
+
+from .cancel_utils import CancelToken, ExecutionCancelled
+from .http_utils import post_json
+from .usage_utils import note_request
+
+logger = logging.getLogger(__name__)
+
+BASE_DELAY = 0.5
+MAX_DELAY = 20.0
+# Statuses where the provider did not process the request, so even a
+# non-idempotent call may be sent again.
+SAFE_STATUSES = (408, 429, 503)
+NOT_RETRYABLE_5XX = (501, 505)
+
+
+class RetryBudget:
+    """Process-wide cap on retries as a share of recent traffic.
+
+    Over a sliding ``window`` at most ``min_retries + ratio * requests``
+    retries are allowed. During a provider outage this keeps retries from
+    multiplying the load, and the queue latency, by ``max_retries``.
+    """
+
+    def __init__(self, ratio: float = 0.2, window: float = 60.0, min_retries: int = 10):
+        self.ratio = ratio
+        self.window = window
+        self.min_retries = min_retries
+        self._requests = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+        self.denied = 0
+
+    def _trim(self, now: float) -> None:
+        horizon = now - self.window
+        for events in (self._requests, self._retries):
+            while events and events[0] < horizon:
+                events.popleft()
+
+    def record_request(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_acquire(self) -> bool:
+        """Take one retry from the budget; False when it is used up."""
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+                self.denied += 1
+                return False
+            self._retries.append(now)
+            return True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            return {"requests": len(self._requests), "retries": len(self._retries), "denied": self.denied}
+
+
+retry_budget = RetryBudget()
+
+
+def retryable_status(status: int, idempotent: bool = True) -> bool:
+    if status in SAFE_STATUSES:
+        return True
+    return idempotent and 500 <= status < 600 and status not in NOT_RETRYABLE_5XX
+
+
+def retryable_exception(error: BaseException, idempotent: bool = True) -> bool:
+    """Connection failures and timeouts; HTTP errors by their status."""
+    if isinstance(error, ExecutionCancelled):
+        return False
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return retryable_status(error.response.status_code, idempotent)
+    if isinstance(error, requests.ConnectTimeout):
+        # Never reached the server.
+        return True
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+        # Reset or read timeout: the server may have processed the request.
+        return idempotent
+    return False
+
+
+def _retry_after(response: Optional[requests.Response]) -> Optional[float]:
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, base: float = BASE_DELAY, cap: float = MAX_DELAY) -> float:
+    """Full jitter: uniform in ``[0, min(cap, base * 2**attempt)]``."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_call(fn: Callable[[], Any], max_attempts: int, token: Optional[CancelToken] = None,
+               idempotent: bool = True, retry_if: Optional[Callable[[BaseException], bool]] = None,
+               budget: RetryBudget = retry_budget, description: str = "request") -> Any:
+    """Call ``fn`` until it succeeds, retrying transient failures.
+
+    ``fn`` either raises or returns a result; a ``requests.Response`` result
+    with a retryable status is retried as well and returned as-is once
+    attempts run out. Delays use full-jitter backoff (or ``Retry-After``)
+    and are never longer than what is left of the token's deadline. Every
+    retry has to be granted by the process-wide ``budget``.
+    """
+    token = token or CancelToken()
+    attempts = max(1, max_attempts)
+    for attempt in range(attempts):
+        token.raise_if_cancelled()
+        if attempt == 0:
+            budget.record_request()
+        response = None
+        try:
+            result = fn()
+        except Exception as e:
+            if attempt == attempts - 1 or not retryable_exception(e, idempotent) or (retry_if and not retry_if(e)):
+                raise
+            failure: Any = e
+            if isinstance(e, requests.HTTPError):
+                response = e.response
+        else:
+            if not isinstance(result, requests.Response) or not retryable_status(result.status_code, idempotent) \
+                    or attempt == attempts - 1:
+                return result
+            failure = f"{result.status_code} {result.reason}"
+            response = result
+
+        delay = _retry_after(response)
+        delay = min(delay, MAX_DELAY) if delay is not None else backoff_delay(attempt)
+        remaining = token.remaining()
+        give_up = None
+        if remaining is not None and delay >= remaining:
+            give_up = "not enough time left before the deadline"
+        elif not budget.try_acquire():
+            give_up = "retry budget exhausted"
+        if give_up:
+            logger.warning("Not retrying %s after %s: %s", description, failure, give_up)
+            if isinstance(failure, BaseException):
+                raise failure
+            return result
+
+        if isinstance(failure, str):
+            result.close()
+        logger.info("Retrying %s in %.2fs (attempt %d/%d) after %s", description, delay, attempt + 2, attempts, failure)
+        token.sleep(delay)
+
+
+def idempotency_headers(headers: dict) -> dict:
+    """Copy of ``headers`` with an ``Idempotency-Key`` that stays the same across retries."""
+    return dict(headers, **{"Idempotency-Key": str(uuid.uuid4())})
+
+
+def post_json_with_retry(url: str, headers: dict, payload: dict, max_attempts: int,
+                         token: Optional[CancelToken] = None, idempotent: bool = True, **kwargs) -> requests.Response:
+    """``http_utils.post_json`` through ``retry_call``; returns the final response."""
+    note_request()
+    return retry_call(lambda: post_json(url, headers, payload, token=token, **kwargs), max_attempts, token,
+                      idempotent=idempotent, description=f"POST {url}")
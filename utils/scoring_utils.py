@@ -0,0 +1,80 @@
+import re
+import json
+import logging
+from typing import Callable, Dict
+
+from .json_utils import loads
+
+logger = logging.getLogger(__name__)
+
+# name -> fn(text, argument) -> float, higher is better
+SCORERS: Dict[str, Callable[[str, str], float]] = {}
+
+
+def register_scorer(name: str):
+    """Decorator to add a scorer to the registry used by the Best-of-N node."""
+    def decorator(fn):
+        SCORERS[name] = fn
+        return fn
+    return decorator
+
+
+@register_scorer("length")
+def score_length(text: str, argument: str = "") -> float:
+    """Longest wins, or closest to a target character count if one is given."""
+    argument = argument.strip()
+    if argument:
+        target = max(1, int(argument))
+        return 1.0 - abs(len(text) - target) / target
+    return float(len(text))
+
+
+@register_scorer("keyword_coverage")
+def score_keyword_coverage(text: str, argument: str = "") -> float:
+    """Fraction of the comma separated keywords that appear in the text."""
+    keywords = [k.strip().lower() for k in argument.split(',') if k.strip()]
+    if not keywords:
+        return 0.0
+    lowered = text.lower()
+    return sum(1 for keyword in keywords if keyword in lowered) / len(keywords)
+
+
+@register_scorer("json_valid")
+def score_json_valid(text: str, argument: str = "") -> float:
+    """1.0 for valid JSON; with comma separated keys, the share of keys present."""
+    try:
+        value = loads(text)
+    except (json.JSONDecodeError, ValueError):
+        return 0.0
+    keys = [k.strip() for k in argument.split(',') if k.strip()]
+    if not keys:
+        return 1.0
+    if not isinstance(value, dict):
+        return 0.0
+    return sum(1 for key in keys if key in value) / len(keys)
+
+
+@register_scorer("regex")
+def score_regex(text: str, argument: str = "") -> float:
+    """Number of matches of the regular expression."""
+    if not argument:
+        return 0.0
+    return float(len(re.findall(argument, text)))
+
+
+def score(name: str, text: str, argument: str = "") -> float:
+    try:
+        scorer = SCORERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown scorer '{name}'. Expected one of {list(SCORERS)}")
+    return scorer(text, argument)
+
+
+def check_argument(name: str, argument: str = "") -> None:
+    """Raise ``ValueError`` if ``argument`` is not usable by scorer ``name``."""
+    try:
+        score(name, "", argument)
+    except re.error as e:
+        raise ValueError(f"Invalid regex for scorer '{name}': {e}") from e
+    except ValueError as e:
+        raise ValueError(f"Invalid argument {argument!r} for scorer '{name}': {e}") from e
@@ -0,0 +1,180 @@
+import os
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from .json_utils import dumps_bytes, loads
+from .path_utils import find_pack_root
+
+logger = logging.getLogger(__name__)
+
+# Opt in with ``1`` (``<pack>/cache/responses.sqlite3``) or a database path.
+# Every ComfyUI process on the host that points at the same file shares it.
+SHARED_CACHE_ENV = "APACHELLMPACK_SHARED_CACHE"
+SHARED_CACHE_MB_ENV = "APACHELLMPACK_SHARED_CACHE_MB"
+SHARED_CACHE_TTL_ENV = "APACHELLMPACK_SHARED_CACHE_TTL"
+
+CACHE_DIRNAME = 'cache'
+CACHE_FILENAME = 'responses.sqlite3'
+DEFAULT_MAX_MB = 256
+DEFAULT_TTL = 7 * 24 * 60 * 60
+# How long a writer waits for another process's transaction.
+BUSY_TIMEOUT = 10.0
+# A read refreshes an entry's LRU time at most this often, so hot entries do
+# not turn every read into a write.
+TOUCH_INTERVAL = 60.0
+# Expired rows are swept on insert at most this often.
+SWEEP_INTERVAL = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+CREATE INDEX IF NOT EXISTS responses_created ON responses (created);
+"""
+
+
+class SharedResponseCache:
+    """Provider responses in a SQLite database shared by all local processes.
+
+    The database runs in WAL mode, so readers never block each other or the
+    single writer. Each insert, together with the evictions it causes, is
+    one ``BEGIN IMMEDIATE`` transaction: other processes see the complete
+    entry or nothing. Entries expire ``ttl`` seconds after they were written
+    and the least recently read ones go first once ``max_bytes`` is
+    exceeded. Any database error counts as a miss; the cache never fails a
+    request.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._swept_at = 0.0
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and process; a forked worker opens its own.
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(_SCHEMA)
+        self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += n
+
+    def get(self, key: str) -> Any:
+        """The cached value for ``key``, or ``None``."""
+        try:
+            connection = self._connection()
+            row = connection.execute("SELECT value, created, accessed FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            now = time.time()
+            if now - row[1] > self.ttl:
+                connection.execute("DELETE FROM responses WHERE key = ? AND created = ?", (key, row[1]))
+                self._count("expired")
+                return None
+            if now - row[2] > TOUCH_INTERVAL:
+                connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            value = loads(zlib.decompress(row[0]))
+        except (sqlite3.Error, OSError, ValueError, zlib.error) as e:
+            logger.warning("Shared response cache read failed: %s", e)
+            self._count("errors")
+            return None
+        self._count("hits")
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        data = zlib.compress(dumps_bytes(value), 1)
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                                   (key, data, len(data), now, now))
+                evicted = self._evict(connection, now)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Shared response cache write failed: %s", e)
+            self._count("errors")
+            return
+        self._count("stores")
+        if evicted:
+            self._count("evictions", evicted)
+
+    def _evict(self, connection: sqlite3.Connection, now: float) -> int:
+        evicted = 0
+        if now - self._swept_at > SWEEP_INTERVAL:
+            self._swept_at = now
+            evicted += connection.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        while total > self.max_bytes:
+            rows = connection.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        return evicted
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        try:
+            entries, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        except sqlite3.Error:
+            entries, size = None, None
+        lookups = stats["hits"] + stats["misses"] + stats["expired"]
+        return dict(stats, path=self.path, entries=entries, bytes=size,
+                    hit_rate=round(stats["hits"] / lookups, 4) if lookups else 0.0)
+
+
+def _from_environment() -> Optional[SharedResponseCache]:
+    setting = os.environ.get(SHARED_CACHE_ENV, "").strip()
+    if setting.lower() in ("", "0", "false", "no", "off"):
+        return None
+    if setting.lower() in ("1", "true", "yes", "on"):
+        path = os.path.join(find_pack_root(), CACHE_DIRNAME, CACHE_FILENAME)
+    else:
+        path = os.path.expanduser(setting)
+    try:
+        max_mb = float(os.environ.get(SHARED_CACHE_MB_ENV, "") or DEFAULT_MAX_MB)
+        ttl = float(os.environ.get(SHARED_CACHE_TTL_ENV, "") or DEFAULT_TTL)
+    except ValueError:
+        logger.warning("Ignoring invalid %s / %s", SHARED_CACHE_MB_ENV, SHARED_CACHE_TTL_ENV)
+        max_mb, ttl = DEFAULT_MAX_MB, DEFAULT_TTL
+    logger.info("Shared response cache at %s (%.0f MB, ttl %.0fs)", path, max_mb, ttl)
+    return SharedResponseCache(path, int(max_mb * 1024 * 1024), ttl)
+
+
+shared_cache = _from_environment()
@@ -0,0 +1,115 @@
+import logging
+from typing import Iterator, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for one socket read; reads return as soon as any bytes arrive.
+READ_SIZE = 64 * 1024
+_BOM = b"\xef\xbb\xbf"
+
+
+class SSEEvent(NamedTuple):
+    event: str
+    data: bytes
+    id: Optional[str]
+
+
+class SSEParser:
+    """Incremental ``text/event-stream`` parser working on raw bytes.
+
+    Follows the WHATWG event stream format: CRLF, LF or CR line endings (also
+    split across reads), comment lines (``: keep-alive``), multi-line
+    ``data`` fields joined with newlines, ``event``, ``id`` and ``retry``.
+    Lines are split in bulk per read and only ``data`` is kept, undecoded,
+    so the caller parses exactly one JSON document per event.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._data: List[bytes] = []
+        self._event = b""
+        self._started = False
+        self.last_event_id: Optional[str] = None
+        self.retry: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """Add bytes; returns the events completed by them."""
+        buffer = self._buffer + chunk if self._buffer else chunk
+        if not self._started:
+            if len(buffer) < len(_BOM) and _BOM.startswith(buffer):
+                self._buffer = buffer
+                return []
+            self._started = True
+            if buffer.startswith(_BOM):
+                buffer = buffer[len(_BOM):]
+        # A trailing CR may be the first half of a CRLF split across reads.
+        end = len(buffer) - 1 if buffer.endswith(b"\r") else len(buffer)
+        cut = max(buffer.rfind(b"\n", 0, end), buffer.rfind(b"\r", 0, end))
+        if cut < 0:
+            self._buffer = buffer
+            return []
+        self._buffer = buffer[cut + 1:]
+        block = buffer[:cut + 1]
+        if b"\r" in block:
+            block = block.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        lines = block.split(b"\n")
+        lines.pop()  # empty remainder after the last line ending
+
+        events = []
+        for line in lines:
+            if not line:
+                if self._data:
+                    events.append(SSEEvent(self._event.decode("utf-8", "replace") or "message",
+                                           self._data[0] if len(self._data) == 1 else b"\n".join(self._data),
+                                           self.last_event_id))
+                    self._data = []
+                self._event = b""
+                continue
+            if line[0] == 0x3A:  # ':' comment, typically a keep-alive
+                continue
+            field, _, value = line.partition(b":")
+            if value[:1] == b" ":
+                value = value[1:]
+            if field == b"data":
+                self._data.append(value)
+            elif field == b"event":
+                self._event = value
+            elif field == b"id":
+                if b"\0" not in value:
+                    self.last_event_id = value.decode("utf-8", "replace")
+            elif field == b"retry":
+                if value.isdigit():
+                    self.retry = int(value)
+            else:
+                logger.debug("Ignoring unknown SSE field %r", field[:50])
+        return events
+
+
+def iter_response_bytes(response, size: int = READ_SIZE) -> Iterator[bytes]:
+    """Body bytes of a streamed ``requests`` response as soon as they arrive.
+
+    ``read1`` returns whatever is available instead of waiting for ``size``
+    bytes, so large reads do not add latency to unchunked streams either.
+    A gzip or deflate ``Content-Encoding`` is decoded, as ``iter_content``
+    does.
+    """
+    raw = response.raw
+    read1 = getattr(raw, "read1", None)
+    if read1 is None:
+        # urllib3 1.x: chunked bodies arrive per chunk; keep other reads small.
+        yield from response.iter_content(chunk_size=None if getattr(raw, "chunked", False) else 512)
+        return
+    # requests opens the body with decode_content=False; raw reads must ask
+    # for decoding themselves.
+    encoded = response.headers.get("Content-Encoding", "identity").strip().lower() != "identity"
+    while True:
+        data = read1(size, decode_content=True) if encoded else read1(size)
+        if not data:
+            return
+        yield data
+
+
+def iter_events(response) -> Iterator[SSEEvent]:
+    parser = SSEParser()
+    for chunk in iter_response_bytes(response):
+        yield from parser.feed(chunk)
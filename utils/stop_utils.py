@@ -0,0 +1,122 @@
+import re
+import logging
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How much already-seen text a stop regex is re-checked against when a new
+# chunk arrives. Regex matches longer than this are not detected.
+REGEX_WINDOW = 512
+
+
+def normalize_stop_sequences(stop, separator: Optional[str] = None) -> List[str]:
+    """Turn a node's stop input into the list form every provider accepts.
+
+    ``separator`` splits one string into several sequences (SambaNova uses
+    commas); without it the whole string is a single sequence.
+    """
+    if not stop:
+        return []
+    if isinstance(stop, str):
+        parts = stop.split(separator) if separator else [stop]
+    else:
+        parts = list(stop)
+    if separator:
+        parts = [part.strip() for part in parts]
+    return [part for part in parts if part]
+
+
+class StopMatcher:
+    """Incremental client-side stop check for streamed output.
+
+    Chunks are fed as they arrive. Stop sequences are matched against the
+    previous chunk's tail plus the new chunk, so a sequence split across a
+    chunk boundary is still found. The matched sequence itself is not part of
+    the result, matching provider-side ``stop`` behaviour.
+    """
+
+    def __init__(self, stop_sequences: Iterable[str] = (), stop_regex: str = "", max_chars: int = 0):
+        self.stop_sequences = [seq for seq in stop_sequences if seq]
+        self.pattern = re.compile(stop_regex) if stop_regex else None
+        self.max_chars = max_chars if max_chars and max_chars > 0 else 0
+        self._overlap = max((len(seq) for seq in self.stop_sequences), default=1) - 1
+        self._parts = []
+        self._length = 0
+        self._tail = ""
+        self._regex_tail = ""
+        self.stopped = False
+        self.stop_reason = None
+
+    @property
+    def active(self) -> bool:
+        return bool(self.stop_sequences or self.pattern or self.max_chars)
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk; returns True once the stream should be closed."""
+        if self.stopped or not chunk:
+            return self.stopped
+        cut = None
+
+        if self.stop_sequences:
+            window = self._tail + chunk
+            offset = self._length - len(self._tail)
+            for seq in self.stop_sequences:
+                index = window.find(seq)
+                if index != -1 and (cut is None or offset + index < cut):
+                    cut = offset + index
+                    self.stop_reason = "stop"
+            self._tail = window[-self._overlap:] if self._overlap else ""
+
+        if self.pattern is not None:
+            window = self._regex_tail + chunk
+            offset = self._length - len(self._regex_tail)
+            match = self.pattern.search(window)
+            if match and (cut is None or offset + match.start() < cut):
+                cut = offset + match.start()
+                self.stop_reason = "regex"
+            self._regex_tail = window[-REGEX_WINDOW:]
+
+        if self.max_chars and self._length + len(chunk) >= self.max_chars:
+            if cut is None or self.max_chars < cut:
+                cut = self.max_chars
+                self.stop_reason = "length"
+
+        self._parts.append(chunk)
+        self._length += len(chunk)
+        if cut is not None:
+            self._truncate(cut)
+            self.stopped = True
+        return self.stopped
+
+    def _truncate(self, position: int) -> None:
+        text = "".join(self._parts)[:position]
+        self._parts = [text]
+        self._length = len(text)
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def apply(self, text: str) -> str:
+        """Enforce the same limits on an already complete (non-streamed) output."""
+        self.feed(text)
+        return self.text
+
+
+def consume_stream(chunks: Iterator[str], matcher: StopMatcher) -> Tuple[str, bool]:
+    """Read ``chunks`` until they end or ``matcher`` fires.
+
+    Closing the generator on a match exits the response context inside the
+    stream reader, which closes the connection so no more output is billed.
+    Returns ``(text, stopped_early)``.
+    """
+    try:
+        for chunk in chunks:
+            if matcher.feed(chunk):
+                logger.debug("Closing stream early (%s) after %d chars", matcher.stop_reason, matcher._length)
+                break
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    return matcher.text, matcher.stopped
@@ -0,0 +1,80 @@
+import json
+import logging
+from typing import Any, Dict, Generator, Iterable, Optional
+
+from .cancel_utils import CancelToken
+from .http_utils import post_json
+from .json_utils import loads
+from .retry_utils import retry_call
+from .sse_utils import SSEParser, iter_response_bytes
+from .usage_utils import note_request, note_usage, stream_usage
+
+logger = logging.getLogger(__name__)
+
+
+def _delta_content(event: Dict[str, Any]) -> str:
+    choices = event.get('choices')
+    if not choices:
+        return ""
+    choice = choices[0]
+    delta = choice.get('delta')
+    if delta is not None:
+        return delta.get('content') or ""
+    # Legacy /completions streams carry the text on the choice itself.
+    return choice.get('text') or ""
+
+
+def iter_deltas(chunks: Iterable[bytes], token: Optional[CancelToken] = None) -> Generator[str, None, None]:
+    """Text deltas from the raw bytes of an OpenAI compatible event stream.
+
+    Stops at ``data: [DONE]``. Usage blocks are reported to the current
+    usage meter.
+    """
+    parser = SSEParser()
+    for chunk in chunks:
+        if token is not None:
+            token.raise_if_cancelled()
+        for sse in parser.feed(chunk):
+            if sse.data == b"[DONE]":
+                logger.debug("Received end of stream")
+                return
+            try:
+                event = loads(sse.data)
+            except json.JSONDecodeError:
+                logger.error("Failed to parse stream event: %r", sse.data[:200])
+                continue
+            if "usage" in event or "x_groq" in event:
+                note_usage(stream_usage(event))
+            content = _delta_content(event)
+            if content:
+                yield content
+
+
+def stream_completion(url: str, headers: Dict[str, str], data: Dict[str, Any],
+                      token: Optional[CancelToken] = None, max_attempts: int = 1) -> Generator[str, None, None]:
+    """Yield text deltas from an OpenAI compatible streaming endpoint.
+
+    Works for Groq, Cerebras and SambaNova. Raises ``requests.HTTPError`` for a
+    non-200 status. Closing the generator closes the connection. Opening the
+    stream is retried up to ``max_attempts`` times; once output has started
+    nothing is retried.
+    """
+    token = token or CancelToken()
+    payload = dict(data, stream=True)
+    response = retry_call(lambda: post_json(url, headers, payload, token=token, stream=True),
+                          max_attempts, token, description=f"stream {url}")
+    note_request()
+    with response:
+        if response.status_code >= 400:
+            # Read the (short) error body now so callers can still inspect it
+            # after the connection is closed.
+            response.content
+        response.raise_for_status()
+        try:
+            yield from iter_deltas(iter_response_bytes(response), token)
+        except Exception:
+            # On cancellation the response is closed under the reader; report
+            # the cancellation rather than the resulting read error.
+            token.raise_if_cancelled()
+            raise
+        token.raise_if_cancelled()
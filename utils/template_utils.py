@@ -0,0 +1,179 @@
+import os
+import re
+import random
+import logging
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from .json_utils import loads
+from .path_utils import find_pack_root
+
+logger = logging.getLogger(__name__)
+
+# ``__name__`` wildcards not defined on the node are read from
+# ``<pack>/wildcards/<name>.txt``, one option per line.
+WILDCARDS_DIRNAME = 'wildcards'
+MODES = ("cartesian", "sampled")
+
+# ``{name}`` variable, ``{a|b|c}`` inline wildcard, ``__name__`` wildcard list
+# and the ``[user_input]`` / ``[system_message]`` placeholders of the presets.
+# Anything else, e.g. JSON braces in a preset, is literal text.
+_TOKEN = re.compile(
+    r"\{([A-Za-z_][\w-]*)\}"
+    r"|\{([^{}\n\"]*\|[^{}\n\"]*)\}"
+    r"|__([A-Za-z0-9][\w/-]*?)__"
+    r"|\[(user_input|system_message)\]"
+)
+
+
+class Slot(NamedTuple):
+    key: str
+    text: str
+    options: Optional[Tuple[str, ...]]
+
+
+class PromptTemplate:
+    """A prompt split once into literal text and substitution slots.
+
+    Named slots (``{name}``, ``__name__``, ``[user_input]``) take their
+    options from the variables given to ``Sweep``; inline ``{a|b}``
+    wildcards carry their own. A name used twice is one axis, so both places
+    always get the same value.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.parts: List[Union[str, Slot]] = []
+        position = 0
+        for match in _TOKEN.finditer(text):
+            if match.start() > position:
+                self.parts.append(text[position:match.start()])
+            name, inline, wildcard, placeholder = match.groups()
+            if inline is not None:
+                key = f"#{match.start()}:{inline}"
+                self.parts.append(Slot(key, match.group(0), tuple(o.strip() for o in inline.split("|"))))
+            else:
+                self.parts.append(Slot(name or wildcard or placeholder, match.group(0), None))
+            position = match.end()
+        if position < len(text):
+            self.parts.append(text[position:])
+        self.slots = [part for part in self.parts if isinstance(part, Slot)]
+
+    def render(self, values: Dict[str, str]) -> str:
+        return "".join(part if isinstance(part, str) else values.get(part.key, part.text) for part in self.parts)
+
+
+@lru_cache(maxsize=256)
+def compile_template(text: str) -> PromptTemplate:
+    return PromptTemplate(text or "")
+
+
+def _split_options(value) -> List[str]:
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [option.strip() for option in str(value).split("|")]
+
+
+def parse_variables(text: str) -> Dict[str, List[str]]:
+    """``name = a | b | c`` lines, or a JSON object of strings/lists, as option lists."""
+    text = (text or "").strip()
+    if not text:
+        return {}
+    if text.startswith("{"):
+        return {name: _split_options(value) for name, value in loads(text).items()}
+    variables = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        name, sep, value = line.partition("=")
+        if not sep:
+            raise ValueError(f"Expected 'name = option | option', got {line!r}")
+        variables[name.strip().strip("_{}[]")] = _split_options(value)
+    return variables
+
+
+@lru_cache(maxsize=64)
+def _read_wildcard_file(path: str, stamp: Tuple[int, int]) -> Tuple[str, ...]:
+    with open(path, encoding="utf-8") as f:
+        return tuple(line.strip() for line in f if line.strip() and not line.lstrip().startswith('#'))
+
+
+def load_wildcard_file(name: str) -> Optional[Tuple[str, ...]]:
+    path = os.path.join(find_pack_root(), WILDCARDS_DIRNAME, *name.split("/")) + ".txt"
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return _read_wildcard_file(path, (stat.st_mtime_ns, stat.st_size))
+
+
+class Expansion(NamedTuple):
+    index: int
+    values: Dict[str, str]
+    texts: Tuple[str, ...]
+
+
+class Sweep:
+    """Lazy expansion of one or more templates over their wildcard axes.
+
+    Every combination has an index in ``range(total)`` that decodes to one
+    option per axis, so ``cartesian`` walks the indices in order and
+    ``sampled`` draws distinct indices at random; either way only the
+    expansions being consumed exist at any time.
+    """
+
+    def __init__(self, templates: Sequence[str], variables: Optional[Dict[str, Sequence[str]]] = None):
+        self.templates = [compile_template(text) for text in templates]
+        variables = variables or {}
+        self.axes: List[Tuple[str, Tuple[str, ...]]] = []
+        self.missing: List[str] = []
+        seen = set()
+        for template in self.templates:
+            for slot in template.slots:
+                if slot.key in seen:
+                    continue
+                seen.add(slot.key)
+                options = slot.options
+                if options is None and slot.key in variables:
+                    options = tuple(variables[slot.key])
+                if options is None and slot.text.startswith("__"):
+                    options = load_wildcard_file(slot.key)
+                if options is None:
+                    # Left verbatim, like the placeholders in the preset names.
+                    self.missing.append(slot.text)
+                    continue
+                if not options:
+                    raise ValueError(f"Wildcard {slot.text} has no options")
+                self.axes.append((slot.key, options))
+        self.total = 1
+        for _, options in self.axes:
+            self.total *= len(options)
+        logger.debug("Sweep over %d axes: %d combinations", len(self.axes), self.total)
+
+    def expansion(self, index: int) -> Expansion:
+        chosen = []
+        remainder = index
+        # The last axis varies fastest, as in ``itertools.product``.
+        for key, options in reversed(self.axes):
+            remainder, choice = divmod(remainder, len(options))
+            chosen.append((key, options[choice]))
+        values = dict(reversed(chosen))
+        return Expansion(index, values, tuple(template.render(values) for template in self.templates))
+
+    def indices(self, mode: str = "cartesian", count: int = 0, seed: int = 0) -> Iterable[int]:
+        if mode not in MODES:
+            raise ValueError(f"Unknown expansion mode {mode!r}; expected one of {', '.join(MODES)}")
+        limit = min(count, self.total) if count > 0 else self.total
+        if mode == "cartesian":
+            return range(limit)
+        return random.Random(seed).sample(range(self.total), limit)
+
+    def expand(self, mode: str = "cartesian", count: int = 0, seed: int = 0) -> Iterator[Expansion]:
+        """Expansions one at a time; ``count`` > 0 caps how many."""
+        for index in self.indices(mode, count, seed):
+            yield self.expansion(index)
+
+    def named_values(self, expansion: Expansion) -> Dict[str, str]:
+        """The variable values of an expansion, without the inline wildcard keys."""
+        return {key: value for key, value in expansion.values.items() if not key.startswith("#")}
@@ -0,0 +1,505 @@
+import os
+import time
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from .json_utils import dump_file, dumps_bytes, load_file, loads
+from .lock_utils import file_lock
+from . import log_utils
+
+logger = logging.getLogger(__name__)
+
+LEDGER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "usage")
+LEDGER_FILENAME = "ledger.jsonl"
+ROLLUPS_FILENAME = "rollups.json"
+LOCK_SUFFIX = ".lock"
+# A background thread appends buffered records this often, or as soon as
+# this many are waiting.
+FLUSH_INTERVAL = 30
+FLUSH_RECORDS = 64
+# Per-conversation rollups kept, most recently used first. Older ones stay
+# in the ledger but drop out of the report.
+MAX_CONVERSATION_ROLLUPS = 1000
+GROUP_BYS = ("model", "provider", "conversation", "day")
+
+# USD per million tokens: (input, output, cached input). List prices when this
+# was written; override or extend them per provider with a [Pricing] section,
+# e.g. ``llama-3.1-8b-instant = 0.05, 0.08``.
+DEFAULT_PRICES = {
+    "groq": {
+        "llama-3.1-8b-instant": (0.05, 0.08, 0.025),
+        "llama-3.3-70b-versatile": (0.59, 0.79, 0.295),
+        "gemma2-9b-it": (0.20, 0.20, 0.10),
+    },
+    "cerebras": {
+        "llama3.1-8b": (0.10, 0.10, 0.10),
+        "llama-3.3-70b": (0.85, 1.20, 0.85),
+    },
+    "sambanova": {
+        "Meta-Llama-3.1-8B-Instruct": (0.10, 0.20, 0.10),
+        "Meta-Llama-3.3-70B-Instruct": (0.60, 1.20, 0.60),
+    },
+}
+
+
+def _config_prices(provider: str) -> Dict[str, tuple]:
+    # Imported here: provider_utils sends requests through retry_utils, which reports to this module.
+    from .provider_utils import load_provider_config
+    config = load_provider_config(provider)
+    if not config.has_section('Pricing'):
+        return {}
+    prices = {}
+    for model, value in config.items('Pricing'):
+        try:
+            numbers = [float(v) for v in value.split(',')]
+        except ValueError:
+            logger.warning("Ignoring [Pricing] %s = %r for %s", model, value, provider)
+            continue
+        if len(numbers) == 2:
+            numbers.append(numbers[0])
+        prices[model] = tuple(numbers[:3])
+    return prices
+
+
+_prices: Dict[str, Dict[str, tuple]] = {}
+
+
+def get_price(provider: str, model: str) -> Optional[tuple]:
+    if provider not in _prices:
+        # ConfigParser lower-cases option names.
+        table = {m.lower(): p for m, p in DEFAULT_PRICES.get(provider, {}).items()}
+        table.update(_config_prices(provider))
+        _prices[provider] = table
+    return _prices[provider].get(model.lower())
+
+
+def compute_cost(provider: str, model: str, prompt_tokens: int, completion_tokens: int,
+                 cached_tokens: int = 0) -> Optional[float]:
+    """Cost in USD, or None for a model without a known price."""
+    price = get_price(provider, model)
+    if price is None:
+        return None
+    input_price, output_price, cached_price = price
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1e6
+
+
+def normalize_usage(usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """Map a provider ``usage`` block onto prompt/completion/cached token counts."""
+    if not usage:
+        return None
+    details = usage.get("prompt_tokens_details") or {}
+    return {
+        "prompt_tokens": int(usage.get("prompt_tokens") or 0),
+        "completion_tokens": int(usage.get("completion_tokens") or 0),
+        "cached_tokens": int(details.get("cached_tokens") or usage.get("cached_tokens") or 0),
+    }
+
+
+def _empty_rollup() -> Dict[str, Any]:
+    return {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+            "cost": 0.0, "unpriced_requests": 0, "estimated_requests": 0, "latency": 0.0,
+            "first_ts": None, "last_ts": None}
+
+
+def _fold(rollups: Dict[str, Dict[str, Dict[str, Any]]], record: Dict[str, Any]) -> None:
+    keys = {
+        "model": f"{record['provider']}:{record['model']}",
+        "provider": record["provider"],
+        "conversation": record.get("conversation_id") or "",
+        "day": time.strftime("%Y-%m-%d", time.localtime(record["ts"])),
+    }
+    for group, key in keys.items():
+        entry = rollups[group].get(key)
+        if entry is None:
+            entry = rollups[group][key] = _empty_rollup()
+            entry["first_ts"] = record["ts"]
+        entry["requests"] += 1
+        for field in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            entry[field] += record[field]
+        entry["latency"] = round(entry["latency"] + record["latency"], 4)
+        if record["cost"] is None:
+            entry["unpriced_requests"] += 1
+        else:
+            entry["cost"] = round(entry["cost"] + record["cost"], 8)
+        if record["estimated"]:
+            entry["estimated_requests"] += 1
+        entry["last_ts"] = record["ts"]
+
+
+class UsageLedger:
+    """Append-only usage log with rollups kept up to date as records arrive.
+
+    Records are buffered and appended to ``ledger.jsonl`` in batches by a
+    background thread, so recording never touches the disk. The per-model,
+    per-provider, per-conversation and per-day rollups are saved alongside
+    with the ledger size they cover. Queries read the rollups, so they never
+    scan the ledger.
+
+    Several processes may share the directory. Each flush holds a lock file,
+    reads the saved rollups, replays whatever other processes appended after
+    them, and only then appends its own records and saves. No process
+    overwrites another's totals.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or LEDGER_DIR
+        self.ledger_path = os.path.join(self.directory, LEDGER_FILENAME)
+        self.rollups_path = os.path.join(self.directory, ROLLUPS_FILENAME)
+        self.lock_path = self.ledger_path + LOCK_SUFFIX
+        self.rollups: Dict[str, Dict[str, Dict[str, Any]]] = {group: {} for group in GROUP_BYS}
+        self.ledger_offset = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._loaded = False
+
+    # -- persistence -------------------------------------------------------
+
+    def _read_saved(self):
+        """Saved rollups plus the ledger records appended after them; call under the file lock."""
+        rollups = {group: {} for group in GROUP_BYS}
+        offset = 0
+        try:
+            data = load_file(self.rollups_path) if os.path.exists(self.rollups_path) else None
+        except Exception as e:
+            logger.warning("Could not read usage rollups %s, rebuilding from the ledger: %s", self.rollups_path, e)
+            data = None
+        if data:
+            rollups.update(data.get("rollups", {}))
+            offset = data.get("ledger_offset", 0)
+        size = os.path.getsize(self.ledger_path) if os.path.exists(self.ledger_path) else 0
+        if size < offset:
+            # Ledger was truncated or replaced; start over from what is there.
+            rollups = {group: {} for group in GROUP_BYS}
+            offset = 0
+        replayed = 0
+        if size > offset:
+            with open(self.ledger_path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        _fold(rollups, loads(line))
+                    except (ValueError, KeyError) as e:
+                        logger.warning("Skipping unreadable usage record: %s", e)
+                        continue
+                    replayed += 1
+            offset = size
+        return rollups, offset, replayed
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.ledger_path) and not os.path.exists(self.rollups_path):
+            return
+        try:
+            with file_lock(self.lock_path):
+                rollups, offset, replayed = self._read_saved()
+        except OSError as e:
+            logger.warning("Could not read usage ledger %s: %s", self.ledger_path, e)
+            return
+        self.rollups, self.ledger_offset = rollups, offset
+        if replayed:
+            logger.info("Replayed %d usage records written after the last rollup save", replayed)
+
+    @staticmethod
+    def _prune(rollups: Dict[str, Dict[str, Dict[str, Any]]]) -> None:
+        conversations = rollups["conversation"]
+        if len(conversations) > MAX_CONVERSATION_ROLLUPS:
+            recent = sorted(conversations.items(), key=lambda item: item[1].get("last_ts") or 0, reverse=True)
+            rollups["conversation"] = dict(recent[:MAX_CONVERSATION_ROLLUPS])
+
+    def flush(self) -> None:
+        """Append buffered records and save the rollups, merged with other processes'."""
+        with self._io_lock:
+            with self._lock:
+                self._load()
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with file_lock(self.lock_path):
+                    rollups, offset, _ = self._read_saved()
+                    with open(self.ledger_path, "ab") as f:
+                        f.write(b"".join(dumps_bytes(record) + b"\n" for record in pending))
+                        offset = f.tell()
+                    for record in pending:
+                        _fold(rollups, record)
+                    self._prune(rollups)
+                    tmp_path = self.rollups_path + ".tmp"
+                    dump_file(tmp_path, {"ledger_offset": offset, "rollups": rollups})
+                    os.replace(tmp_path, self.rollups_path)
+            except OSError as e:
+                logger.warning("Could not write usage ledger %s: %s", self.ledger_path, e)
+                with self._lock:
+                    self._pending[:0] = pending
+                return
+            with self._lock:
+                # Records that arrived during the write are not saved yet.
+                for record in self._pending:
+                    _fold(rollups, record)
+                self.rollups, self.ledger_offset = rollups, offset
+
+    def _run_flusher(self) -> None:
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Usage ledger flush failed")
+
+    # -- recording ---------------------------------------------------------
+
+    def record(self, provider: str, model: str, prompt_tokens: int, completion_tokens: int,
+               cached_tokens: int = 0, latency: float = 0.0, conversation_id: str = "",
+               estimated: bool = False, mode: str = "plain") -> Dict[str, Any]:
+        cost = compute_cost(provider, model, prompt_tokens, completion_tokens, cached_tokens)
+        record = {
+            "ts": round(time.time(), 3), "provider": provider, "model": model, "conversation_id": conversation_id,
+            "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "cached_tokens": cached_tokens,
+            "latency": round(latency, 4), "cost": cost if cost is None else round(cost, 8),
+            "estimated": estimated, "mode": mode,
+        }
+        with self._lock:
+            self._load()
+            _fold(self.rollups, record)
+            self._pending.append(record)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher, name="apachellmpack-usage-flush", daemon=True)
+                self._flusher.start()
+            if len(self._pending) >= FLUSH_RECORDS:
+                self._wake.set()
+        return record
+
+    # -- queries -----------------------------------------------------------
+
+    def summary(self, group_by: str = "model", provider: str = "", limit: int = 0) -> List[Dict[str, Any]]:
+        """Rollup rows for ``group_by``, highest cost (then tokens) first."""
+        if group_by not in GROUP_BYS:
+            raise ValueError(f"group_by must be one of {GROUP_BYS}")
+        with self._lock:
+            self._load()
+            rows = [dict(entry, key=key) for key, entry in self.rollups[group_by].items()]
+        if provider and group_by in ("model", "provider"):
+            rows = [row for row in rows if row["key"].split(":", 1)[0] == provider]
+        for row in rows:
+            row["avg_latency"] = round(row["latency"] / row["requests"], 3) if row["requests"] else 0.0
+            row["tokens_per_second"] = round(row["completion_tokens"] / row["latency"], 1) if row["latency"] else 0.0
+        if group_by == "day":
+            rows.sort(key=lambda row: row["key"], reverse=True)
+        else:
+            rows.sort(key=lambda row: (row["cost"], row["prompt_tokens"] + row["completion_tokens"]), reverse=True)
+        return rows[:limit] if limit else rows
+
+    def totals(self, provider: str = "") -> Dict[str, Any]:
+        total = _empty_rollup()
+        for row in self.summary("provider", provider):
+            for field in ("requests", "prompt_tokens", "completion_tokens", "cached_tokens",
+                          "unpriced_requests", "estimated_requests"):
+                total[field] += row[field]
+            total["cost"] = round(total["cost"] + row["cost"], 8)
+            total["latency"] = round(total["latency"] + row["latency"], 4)
+        return total
+
+
+usage_ledger = UsageLedger()
+
+
+@atexit.register
+def _flush_ledger() -> None:
+    usage_ledger.flush()
+
+
+# -- metering ------------------------------------------------------------------
+
+_current_meter: contextvars.ContextVar = contextvars.ContextVar("apachellmpack_usage_meter", default=None)
+
+
+class UsageMeter:
+    """Collects what the transport saw for one logical request.
+
+    The HTTP helpers report "a request was sent" and any ``usage`` block they
+    parse; ``finish`` turns that into a ledger record. Nothing is recorded
+    when no request went out (a cache hit), and token counts are estimated
+    when the provider sent no usage (most streams).
+    """
+
+    def __init__(self, provider: str, model: str, conversation_id: str = "", mode: str = "plain",
+                 ledger: Optional[UsageLedger] = None):
+        self.provider = provider
+        self.model = model
+        self.conversation_id = conversation_id
+        self.mode = mode
+        self.ledger = ledger or usage_ledger
+        self.sent = False
+        self.usage: Optional[Dict[str, int]] = None
+        self.start = time.perf_counter()
+        self.record: Optional[Dict[str, Any]] = None
+        self.summarized = False
+
+    def note_request(self) -> None:
+        self.sent = True
+
+    def note_usage(self, usage: Optional[Dict[str, Any]]) -> None:
+        normalized = normalize_usage(usage)
+        if normalized is None:
+            return
+        if self.usage is None:
+            self.usage = normalized
+        else:
+            # Retried JSON-mode calls are billed for every attempt.
+            for field, value in normalized.items():
+                self.usage[field] += value
+
+    def summarize(self, status: str) -> None:
+        """Emit the one-line request summary (``APACHELLMPACK_LOG_SUMMARY``) once."""
+        if self.summarized or not log_utils.summary_enabled:
+            return
+        self.summarized = True
+        record = self.record or {}
+        usage = self.usage or {}
+        log_utils.log_request_summary(
+            provider=self.provider, model=self.model, mode=self.mode, status=status,
+            latency=round(time.perf_counter() - self.start, 4),
+            prompt_tokens=record.get("prompt_tokens", usage.get("prompt_tokens")),
+            completion_tokens=record.get("completion_tokens", usage.get("completion_tokens")),
+            cached_tokens=record.get("cached_tokens", usage.get("cached_tokens")),
+            cost=record.get("cost"), estimated=record.get("estimated"),
+            conversation=self.conversation_id or None)
+
+    def fail(self, status: str) -> None:
+        """Mark the request as failed for the summary line; nothing is recorded."""
+        self.summarize(f"error:{status}")
+
+    def finish(self, prompt, completion_text: str) -> Optional[Dict[str, Any]]:
+        """Record the request; ``prompt`` (string or messages) is only used for estimates."""
+        if not self.sent:
+            self.summarize("cached")
+        if not self.sent or self.record is not None:
+            return self.record
+        if self.usage is not None:
+            usage, estimated = self.usage, False
+        else:
+            from .catalog_utils import estimate_tokens
+            usage = {"prompt_tokens": estimate_tokens(prompt or ""),
+                     "completion_tokens": estimate_tokens(completion_text or "") if completion_text else 0,
+                     "cached_tokens": 0}
+            estimated = True
+        try:
+            self.record = self.ledger.record(self.provider, self.model, latency=time.perf_counter() - self.start,
+                                             conversation_id=self.conversation_id, estimated=estimated,
+                                             mode=self.mode, **usage)
+        except Exception as e:
+            logger.warning("Could not record usage for %s:%s: %s", self.provider, self.model, e)
+        self.summarize("ok")
+        return self.record
+
+    @property
+    def total_tokens(self) -> int:
+        if self.record is None:
+            return 0
+        return self.record["prompt_tokens"] + self.record["completion_tokens"]
+
+
+@contextmanager
+def metered(provider: str, model: str, conversation_id: str = "", mode: str = "plain") -> Iterator[UsageMeter]:
+    """Make a ``UsageMeter`` current for the requests sent inside the block."""
+    meter = UsageMeter(provider, model, conversation_id, mode)
+    reset = _current_meter.set(meter)
+    try:
+        yield meter
+    except BaseException as e:
+        meter.summarize(f"error:{type(e).__name__}")
+        raise
+    finally:
+        _current_meter.reset(reset)
+
+
+def note_request() -> None:
+    meter = _current_meter.get()
+    if meter is not None:
+        meter.note_request()
+
+
+def note_usage(usage: Optional[Dict[str, Any]]) -> None:
+    meter = _current_meter.get()
+    if meter is not None:
+        meter.note_usage(usage)
+
+
+def stream_usage(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """``usage`` of a stream event: standard final chunk or Groq's ``x_groq``."""
+    return event.get("usage") or (event.get("x_groq") or {}).get("usage")
+
+
+# -- reporting -----------------------------------------------------------------
+
+def format_report(rows: List[Dict[str, Any]], totals: Dict[str, Any], group_by: str) -> str:
+    lines = [f"{group_by:<40} {'requests':>8} {'prompt':>10} {'completion':>10} {'cached':>8} {'cost $':>10} {'avg s':>7} {'tok/s':>7}"]
+    for row in rows:
+        key = row["key"] or "(none)"
+        cost = f"{row['cost']:.6f}" + ("*" if row["unpriced_requests"] else "")
+        lines.append(f"{key[:40]:<40} {row['requests']:>8} {row['prompt_tokens']:>10} {row['completion_tokens']:>10} "
+                     f"{row['cached_tokens']:>8} {cost:>10} {row['avg_latency']:>7} {row['tokens_per_second']:>7}")
+    lines.append(f"total: {totals['requests']} requests, {totals['prompt_tokens'] + totals['completion_tokens']} tokens, "
+                 f"${totals['cost']:.6f}")
+    if totals["unpriced_requests"]:
+        lines.append(f"* {totals['unpriced_requests']} requests to models without a price are not in the cost")
+    if totals["estimated_requests"]:
+        lines.append(f"{totals['estimated_requests']} requests had no usage block; their tokens are estimated")
+    return "\n".join(lines)
+
+
+def format_connections(stats: Dict[str, Any]) -> str:
+    """Report lines for ``warmup_utils.prewarm_stats()``; empty before any request."""
+    lines = []
+    if stats["enabled"]:
+        total = stats["timings"].get("total")
+        lines.append(f"prewarm: finished in {total:.3f}s" if stats["finished"] else "prewarm: running")
+    for host, connection in stats["connections"].items():
+        line = (f"{host}: first request {connection['first_request']:.3f}s "
+                f"({'warm' if connection['first_request_warm'] else 'cold'})")
+        if connection["steady_state"] is not None:
+            line += f", later ones {connection['steady_state']:.3f}s on average"
+        lines.append(line)
+    return "".join("\n" + line for line in lines)
+
+
+def register_routes() -> bool:
+    """Serve ``GET /apachellmpack/usage`` from the ComfyUI server, if there is one.
+
+    Query parameters: ``group_by`` (model, provider, conversation, day),
+    ``provider`` and ``limit``.
+    """
+    try:
+        from aiohttp import web
+        from server import PromptServer
+        routes = PromptServer.instance.routes
+    except (ImportError, AttributeError):
+        return False
+
+    @routes.get("/apachellmpack/usage")
+    async def get_usage(request):
+        group_by = request.query.get("group_by", "model")
+        provider = request.query.get("provider", "")
+        try:
+            limit = int(request.query.get("limit", 0))
+            rows = usage_ledger.summary(group_by, provider, limit)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        from .warmup_utils import prewarm_stats
+        return web.json_response({"group_by": group_by, "rows": rows, "totals": usage_ledger.totals(provider),
+                                  "connections": prewarm_stats()})
+
+    return True
@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from .catalog_utils import get_catalog
+from .http_utils import connection_stats, mark_warm, warm_connection
+from .json_utils import load_file_cached
+from .path_utils import find_pack_root, history_file_path
+from .provider_utils import PROVIDERS, get_api_key, get_base_url, get_headers
+
+logger = logging.getLogger(__name__)
+
+# Set to 1 to warm paths, presets, catalogs and connections in the
+# background at pack load. Off by default.
+PREWARM_ENV = "APACHELLMPACK_PREWARM"
+
+# Default history file of each provider's ChatHistoryManager.
+_HISTORY_FILES = {
+    "groq": "GROQ_CONTEXT.json",
+    "cerebras": "cerebras_CONTEXT.json",
+    "sambanova": "Nova.json",
+}
+PRESET_FILES = ("DefaultPrompts.json", "UserPrompts.json")
+
+_thread: Optional[threading.Thread] = None
+_done = threading.Event()
+_timings: Dict[str, float] = {}
+
+
+def prewarm_enabled() -> bool:
+    return os.environ.get(PREWARM_ENV, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _timed(name: str, fn, *args) -> Any:
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    except Exception as e:
+        logger.debug("Warm-up step %s failed: %s", name, e)
+        return None
+    finally:
+        _timings[name] = round(time.perf_counter() - start, 4)
+
+
+def _warm_paths() -> None:
+    find_pack_root()
+    for provider, history_file in _HISTORY_FILES.items():
+        history_file_path(os.path.basename(PROVIDERS[provider]["dir"]), history_file)
+
+
+def _warm_presets(provider: str) -> None:
+    directory = PROVIDERS[provider]["dir"]
+    for filename in PRESET_FILES:
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            load_file_cached(path)
+
+
+def _warm_provider(provider: str) -> None:
+    _warm_presets(provider)
+    catalog = get_catalog(provider)
+    if not get_api_key(provider):
+        return
+    models_url = f"{get_base_url(provider)}/models"
+    # A stale catalog is refreshed over the pooled session, which warms it too.
+    if catalog.stale and catalog.refresh():
+        mark_warm(models_url)
+    else:
+        warm_connection(models_url, headers=get_headers(provider))
+
+
+def _run() -> None:
+    start = time.perf_counter()
+    _timed("paths", _warm_paths)
+    workers = [threading.Thread(target=_timed, args=(provider, _warm_provider, provider),
+                                name=f"apachellmpack-prewarm-{provider}", daemon=True)
+               for provider in PROVIDERS]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    _timings["total"] = round(time.perf_counter() - start, 4)
+    _done.set()
+    logger.info("Prewarm finished in %.3fs: %s", _timings["total"], _timings)
+
+
+def start_prewarm() -> bool:
+    """Start the warm-up in a daemon thread; returns immediately.
+
+    Resolves history paths, loads presets and model catalogs and opens pooled
+    connections to every provider with an API key, so the first execution
+    costs the same as later ones. Runs at most once per process.
+    """
+    global _thread
+    if not prewarm_enabled() or _thread is not None:
+        return False
+    _thread = threading.Thread(target=_run, name="apachellmpack-prewarm", daemon=True)
+    _thread.start()
+    return True
+
+
+def wait_for_prewarm(timeout: Optional[float] = None) -> bool:
+    return _done.wait(timeout)
+
+
+def prewarm_stats() -> Dict[str, Any]:
+    """Warm-up step timings plus per-host first request (warm or cold) vs steady-state latency."""
+    return {"enabled": prewarm_enabled(), "finished": _done.is_set(),
+            "timings": dict(_timings), "connections": connection_stats()}